@@ -0,0 +1,80 @@
+"""
+Measure how many calculation status updates per second a SQLite database file sustains,
+with and without the SQLite tuning profile (see `SQLiteSettings`).
+
+Each status update inserts a status event and updates the calculation in its own transaction
+through the async engine (aiosqlite), just like the server does when calculations report their progress
+(see `CalculationDB.aupdate_status()`).
+
+On an ext4 disk, the tuning profile raised the rate from about 175-260 to about 290-450 updates/s
+(1.4-2.6x between runs), which falls short of several times the throughput. The profile removes the
+fsync on each commit (plain sqlite3 went from about 1,000 to 40,000 such commits/s on the same disk),
+but each update still spends 2-3 ms in the async ORM path (session, flush and aiosqlite round trips).
+The server applies status updates one at a time as they arrive from the key-value watch, so they
+can't be committed in batches without changing how they are consumed.
+
+Usage:
+    python benchmarks/bench_sqlite_status_updates.py [--num-updates 2000] [--db-dir /path/on/target/disk]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from pyqcrbox import settings
+from pyqcrbox.logging import set_log_level
+from pyqcrbox.sql_models import CalculationDB, CalculationStatusEnum
+
+
+async def measure_status_update_rate(db_path: Path, num_updates: int, tuning_enabled: bool) -> float:
+    settings.db.sqlite.enabled = tuning_enabled
+    url = f"sqlite:///{db_path}"
+    settings.db.url = url
+    settings.db.create_db_and_tables()
+
+    calculation = CalculationDB(
+        calculation_id=f"bench_calc_{'tuned' if tuning_enabled else 'default'}",
+        application_slug="bench_app",
+        application_version="0.1.0",
+        command_name="bench_command",
+        arguments={},
+    )
+    await calculation.asave_to_db()
+
+    statuses = [CalculationStatusEnum.RUNNING, CalculationStatusEnum.SUCCESSFUL]
+    start = time.perf_counter()
+    for idx in range(num_updates):
+        await calculation.aupdate_status(statuses[idx % 2])
+    elapsed = time.perf_counter() - start
+
+    await settings.db.get_async_engine().dispose()
+    settings.db.get_engine().dispose()
+    return num_updates / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-updates", type=int, default=2000)
+    parser.add_argument(
+        "--db-dir", type=Path, default=None, help="directory for the database files (default: temp dir)"
+    )
+    args = parser.parse_args()
+    set_log_level("WARNING")  # keep logging of the status updates out of the measurement
+
+    with tempfile.TemporaryDirectory(dir=args.db_dir) as db_dir:
+        default_rate = asyncio.run(
+            measure_status_update_rate(Path(db_dir) / "default.db", args.num_updates, tuning_enabled=False)
+        )
+        tuned_rate = asyncio.run(
+            measure_status_update_rate(Path(db_dir) / "tuned.db", args.num_updates, tuning_enabled=True)
+        )
+
+    print(f"status updates/s without tuning profile: {default_rate:10.1f}")
+    print(f"status updates/s with tuning profile:    {tuned_rate:10.1f}")
+    print(f"speed-up: {tuned_rate / default_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
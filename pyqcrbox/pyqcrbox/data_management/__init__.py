@@ -1 +1,3 @@
+from .data_file_cache import DataFileDiskCache
 from .data_file_manager import DummyDataFileManager, QCrBoxDataFileManager
+from .dataset import Dataset, DatasetMember
@@ -0,0 +1,210 @@
+import zlib
+from enum import StrEnum
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator
+
+import anyio
+from nats.js import api
+
+from pyqcrbox import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency (install with `pip install pyqcrbox[compression]`)
+    zstandard = None
+
+__all__ = [
+    "ContentEncoding",
+    "CorruptContentsError",
+    "decode_chunks",
+    "encode_chunks",
+    "get_content_encoding",
+    "get_decoded_size",
+    "get_encoding_for_file",
+    "parse_accept_encoding",
+]
+
+# Headers of stored objects recording how their contents are encoded
+CONTENT_ENCODING_HEADER = "Content-Encoding"
+DECODED_SIZE_HEADER = "Qcrbox-Decoded-Size"
+
+# Window bits for zlib to read and write the gzip format (rather than raw zlib streams)
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Maximum size of the chunks decompressed from zstd-encoded contents at a time
+ZSTD_DECODED_CHUNK_SIZE = 1024 * 1024
+
+
+class CorruptContentsError(ValueError):
+    pass
+
+
+class ContentEncoding(StrEnum):
+    # Same names as used in HTTP's Content-Encoding header
+    IDENTITY = "identity"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+def get_encoding_for_file(filename: str | None) -> ContentEncoding:
+    """
+    Return the encoding to store a file with, based on its file extension.
+
+    Text-based crystallographic files (CIF, HKL, ...) typically compress several-fold;
+    other files are stored as they are. This uses zstd if it is available, and gzip otherwise.
+    """
+    data_file_settings = settings.data_files
+    extension = Path(filename).suffix[1:].lower() if filename else ""
+    if not data_file_settings.compression_enabled or extension not in data_file_settings.compressed_file_extensions:
+        return ContentEncoding.IDENTITY
+    return ContentEncoding.ZSTD if zstandard is not None else ContentEncoding.GZIP
+
+
+def get_content_encoding(info: api.ObjectInfo) -> ContentEncoding:
+    return ContentEncoding((info.headers or {}).get(CONTENT_ENCODING_HEADER, [ContentEncoding.IDENTITY])[0])
+
+
+def get_decoded_size(info: api.ObjectInfo) -> int:
+    return int((info.headers or {}).get(DECODED_SIZE_HEADER, [info.size])[0])
+
+
+def get_encoding_headers(encoding: ContentEncoding, decoded_size: int) -> dict[str, list[str]] | None:
+    if encoding == ContentEncoding.IDENTITY:
+        return None
+    return {CONTENT_ENCODING_HEADER: [encoding.value], DECODED_SIZE_HEADER: [str(decoded_size)]}
+
+
+def parse_accept_encoding(accept_encoding: str | None) -> set[ContentEncoding]:
+    """
+    Return the supported encodings accepted according to an HTTP Accept-Encoding header.
+
+    Quality values are only used to exclude encodings (`q=0`), not to rank them, because
+    the contents of a data file are only ever passed through in the encoding they are stored with.
+    """
+    accepted_encodings = set()
+    rejected_encodings = set()
+    for entry in (accept_encoding or "").split(","):
+        name, *params = [part.strip().lower() for part in entry.split(";")]
+        encodings = set(ContentEncoding) if name == "*" else {name} & set(ContentEncoding)
+        if any(_is_zero_quality_value(param) for param in params):
+            rejected_encodings.update(encodings)
+        else:
+            accepted_encodings.update(encodings)
+    if zstandard is None:
+        rejected_encodings.add(ContentEncoding.ZSTD)
+    return {ContentEncoding(name) for name in accepted_encodings - rejected_encodings}
+
+
+def _is_zero_quality_value(param: str) -> bool:
+    key, _, value = param.partition("=")
+    try:
+        return key.strip() == "q" and float(value) == 0
+    except ValueError:
+        return False
+
+
+def _check_encoding_is_supported(encoding: ContentEncoding) -> None:
+    if encoding == ContentEncoding.ZSTD and zstandard is None:
+        raise RuntimeError("Data file is compressed with zstd, but the 'zstandard' package is not installed.")
+
+
+async def encode_chunks(chunks: AsyncIterable[bytes], encoding: ContentEncoding) -> AsyncIterator[bytes]:
+    _check_encoding_is_supported(encoding)
+    match encoding:
+        case ContentEncoding.IDENTITY:
+            async for chunk in chunks:
+                yield chunk
+            return
+        case ContentEncoding.GZIP:
+            compressor = zlib.compressobj(settings.data_files.gzip_compression_level, wbits=GZIP_WBITS)
+        case ContentEncoding.ZSTD:
+            compressor = zstandard.ZstdCompressor(level=settings.data_files.zstd_compression_level).compressobj()
+
+    async for chunk in chunks:
+        if compressed_chunk := compressor.compress(chunk):
+            yield compressed_chunk
+    yield compressor.flush()
+
+
+async def decode_chunks(
+    chunks: AsyncIterable[bytes], encoding: ContentEncoding, *, decoded_size: int | None = None
+) -> AsyncIterator[bytes]:
+    """
+    Decode the contents of a stored object chunk by chunk.
+
+    If the `decoded_size` recorded for the object is given, decoding stops with an error as soon as
+    the contents turn out to be larger, so that corrupt (or malicious) contents can't blow up in size.
+
+    Raises:
+        CorruptContentsError: If the contents are truncated or their decoded size doesn't match `decoded_size`.
+    """
+    _check_encoding_is_supported(encoding)
+    if encoding == ContentEncoding.IDENTITY:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    total_size = 0
+
+    def check_size(decompressed_chunk: bytes) -> bytes:
+        nonlocal total_size
+        total_size += len(decompressed_chunk)
+        if decoded_size is not None and total_size > decoded_size:
+            raise CorruptContentsError(f"Decoded contents exceed their recorded size of {decoded_size} bytes")
+        return decompressed_chunk
+
+    if encoding == ContentEncoding.ZSTD and decoded_size is not None:
+        # Unlike zlib's, zstd's decompressobj() can't limit how much it decompresses at once, but a stream reader
+        # can. It reads the compressed chunks synchronously, so it is used from a worker thread.
+        reader = zstandard.ZstdDecompressor().stream_reader(_BlockingChunkReader(chunks))
+        while decompressed_chunk := await anyio.to_thread.run_sync(
+            reader.read, min(decoded_size - total_size + 1, ZSTD_DECODED_CHUNK_SIZE)
+        ):
+            yield check_size(decompressed_chunk)
+        # Truncated contents are caught by the size check below (the stream reader ends quietly on them)
+    else:
+        if encoding == ContentEncoding.GZIP:
+            decompressor = zlib.decompressobj(wbits=GZIP_WBITS)
+        else:
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        async for chunk in chunks:
+            if encoding == ContentEncoding.GZIP and decoded_size is not None:
+                # Never decompress more than one byte beyond the recorded size, however well the chunk compresses
+                while chunk:
+                    if decompressed_chunk := check_size(decompressor.decompress(chunk, decoded_size - total_size + 1)):
+                        yield decompressed_chunk
+                    chunk = decompressor.unconsumed_tail
+            elif decompressed_chunk := check_size(decompressor.decompress(chunk)):
+                yield decompressed_chunk
+        if encoding == ContentEncoding.GZIP and (remaining := check_size(decompressor.flush())):
+            yield remaining
+        if not decompressor.eof:
+            raise CorruptContentsError("Contents are truncated (the compressed stream ended prematurely)")
+
+    if decoded_size is not None and total_size != decoded_size:
+        raise CorruptContentsError(f"Decoded contents have {total_size} bytes rather than the recorded {decoded_size}")
+
+
+class _BlockingChunkReader:
+    """
+    File-like reader of an async iterable of chunks, which fetches the chunks from the event loop as they are read.
+
+    This must be used from a worker thread (see `anyio.to_thread.run_sync()`).
+    """
+
+    def __init__(self, chunks: AsyncIterable[bytes]):
+        self._chunks = aiter(chunks)
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._buffer:
+            if (chunk := anyio.from_thread.run(self._get_next_chunk)) is None:
+                return b""
+            self._buffer = chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    async def _get_next_chunk(self) -> bytes | None:
+        return await anext(self._chunks, None)
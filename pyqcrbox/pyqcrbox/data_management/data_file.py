@@ -1,37 +1,109 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field, NonNegativeInt, PositiveInt
 
 
 class QCrBoxDataFile(BaseModel):
+    """
+    Metadata of a data file. The contents are only fetched (from the data file manager) when they are accessed.
+    """
+
     qcrbox_file_id: str
-    filename: str
+    filename: Optional[str]
     filetype: str
-    contents: bytes
+    size: int
+    sha256: str
+    uploaded_at: datetime = Field(default_factory=datetime.now)
 
     def to_response_model(self) -> "QCrBoxDataFileResponse":
-        return QCrBoxDataFileResponse(
-            qcrbox_file_id=self.qcrbox_file_id,
-            filename=self.filename,
-            filetype=self.filetype,
-        )
+        return QCrBoxDataFileResponse(**self.model_dump())
 
 
 class QCrBoxDataFileResponse(BaseModel):
     qcrbox_file_id: str
-    filename: str
+    filename: Optional[str]
     filetype: str
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+
+
+class QCrBoxDataFileQuery(BaseModel):
+    """
+    Filters and pagination for listing data files (newest first).
+    """
+
+    filename: Optional[str] = None
+    filetype: Optional[str] = None
+    sha256: Optional[str] = Field(default=None, pattern=r"^[0-9a-fA-F]{64}$")
+    min_size: Optional[NonNegativeInt] = None
+    max_size: Optional[NonNegativeInt] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    limit: PositiveInt = 100
+    offset: NonNegativeInt = 0
+
+    def matches(self, data_file: QCrBoxDataFileResponse) -> bool:
+        return (
+            (self.filename is None or data_file.filename == self.filename)
+            and (self.filetype is None or data_file.filetype == self.filetype)
+            and (self.sha256 is None or data_file.sha256 == self.sha256.lower())
+            and (self.min_size is None or data_file.size >= self.min_size)
+            and (self.max_size is None or data_file.size <= self.max_size)
+            and (self.uploaded_after is None or data_file.uploaded_at >= self.uploaded_after)
+            and (self.uploaded_before is None or data_file.uploaded_at < self.uploaded_before)
+        )
 
 
 class QCrBoxDataset(BaseModel):
     dataset_id: str
     data_files: list[QCrBoxDataFile]
+    created_at: datetime = Field(default_factory=datetime.now)
 
     def to_response_model(self) -> "QCrBoxDatasetResponse":
         return QCrBoxDatasetResponse(
             dataset_id=self.dataset_id,
+            created_at=self.created_at,
             data_files=[f.to_response_model() for f in self.data_files],
         )
 
 
 class QCrBoxDatasetResponse(BaseModel):
     dataset_id: str
+    created_at: Optional[datetime] = None
     data_files: list[QCrBoxDataFileResponse]
+
+
+class QCrBoxDatasetCreate(BaseModel):
+    # The members of the dataset (in order), which must have been imported as data files before
+    data_file_ids: list[str] = Field(min_length=1)
+
+
+class QCrBoxDataFileImportByHash(BaseModel):
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")
+    filename: str
+
+
+class QCrBoxUploadSessionCreate(BaseModel):
+    filename: str
+    # If given, the assembled contents are verified against these before the data file is created
+    size: Optional[NonNegativeInt] = None
+    sha256: Optional[str] = Field(default=None, pattern=r"^[0-9a-fA-F]{64}$")
+
+
+class QCrBoxUploadPart(BaseModel):
+    part_number: int
+    size: int
+    sha256: str
+    uploaded_at: datetime
+
+
+class QCrBoxUploadSession(BaseModel):
+    upload_id: str
+    filename: Optional[str]
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    created_at: datetime
+    # Parts which have been received so far (ordered by part number)
+    parts: list[QCrBoxUploadPart] = []
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import shutil
+import stat
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterable, BinaryIO
+
+import anyio
+
+from pyqcrbox import logger
+
+__all__ = ["DataFileDiskCache"]
+
+
+class DataFileDiskCache:
+    """
+    Content-addressed on-disk cache of data file contents with LRU eviction.
+
+    Entries are keyed by the SHA-256 digest of their contents, so data files with identical
+    contents share a single entry and an entry never needs to be invalidated. Cached files
+    are read-only, which allows hard-linking them into a calculation's working directory
+    (a calculation writing to such a file in place fails instead of corrupting the cache).
+
+    The cache is bounded by `max_size` (in bytes). Least recently used entries are evicted
+    whenever a new entry is added; the most recently added entry is always kept, even if
+    it exceeds `max_size` on its own.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_size: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Maps the SHA-256 digest of each cached file to its size, in LRU order (least recently used first).
+        # The access order survives restarts because the modification time of a file is bumped on every access.
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_size = 0
+        for path, file_stat in sorted(self._scan_cache_dir(), key=lambda item: item[1].st_mtime_ns):
+            self._add_entry(path.name, file_stat.st_size)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.cache_dir}, {len(self._entries)} entries, {self.total_size} bytes>"
+
+    def __contains__(self, sha256_hexdigest: str) -> bool:
+        return sha256_hexdigest.lower() in self._entries
+
+    @property
+    def total_size(self) -> int:
+        return self._total_size
+
+    def _add_entry(self, sha256_hexdigest: str, size: int) -> None:
+        self._remove_entry(sha256_hexdigest)
+        self._entries[sha256_hexdigest] = size
+        self._total_size += size
+
+    def _remove_entry(self, sha256_hexdigest: str) -> None:
+        self._total_size -= self._entries.pop(sha256_hexdigest, 0)
+
+    def _scan_cache_dir(self):
+        for path in self.cache_dir.glob("??/*"):
+            if path.name.startswith("."):
+                continue  # leftover temporary file from an interrupted download
+            try:
+                yield path, path.stat()
+            except FileNotFoundError:
+                pass
+
+    def _get_path(self, sha256_hexdigest: str) -> Path:
+        return self.cache_dir / sha256_hexdigest[:2] / sha256_hexdigest
+
+    def get(self, sha256_hexdigest: str) -> Path | None:
+        """
+        Return the path of the cached file with the given contents, or `None` if they are not cached.
+        """
+        sha256_hexdigest = sha256_hexdigest.lower()
+        if sha256_hexdigest not in self._entries:
+            return None
+
+        path = self._get_path(sha256_hexdigest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # The file was removed behind our back (e.g. by another process sharing the cache directory)
+            self._remove_entry(sha256_hexdigest)
+            return None
+
+        self._entries.move_to_end(sha256_hexdigest)
+        return path
+
+    def open(self, sha256_hexdigest: str) -> BinaryIO | None:
+        """
+        Open the cached file with the given contents for reading, or return `None` if they are not cached.
+
+        Unlike `get()`, the returned file remains readable even if the entry is evicted in the meantime.
+        """
+        while (path := self.get(sha256_hexdigest)) is not None:
+            try:
+                return open(path, "rb")
+            except FileNotFoundError:
+                self._remove_entry(sha256_hexdigest.lower())
+        return None
+
+    async def put_stream(self, sha256_hexdigest: str, chunks: AsyncIterable[bytes]) -> Path:
+        """
+        Add the contents provided by `chunks` to the cache and return the path of the cached file.
+
+        Raises:
+            ValueError: If the contents don't match the given SHA-256 digest.
+        """
+        sha256_hexdigest = sha256_hexdigest.lower()
+        path = self._get_path(sha256_hexdigest)
+        path.parent.mkdir(exist_ok=True)
+
+        # Write to a temporary file first, so that a partially downloaded file never shows up in the cache
+        tmp_path = path.with_name(f".{sha256_hexdigest}.{os.getpid()}.{id(chunks):x}.tmp")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with await anyio.open_file(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await f.write(chunk)
+            if digest.hexdigest() != sha256_hexdigest:
+                raise ValueError(f"Contents don't match the expected SHA-256 digest {sha256_hexdigest!r}")
+            tmp_path.chmod(stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            tmp_path.replace(path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        self._add_entry(sha256_hexdigest, size)
+        self.evict()
+        return path
+
+    def link_to(self, sha256_hexdigest: str, dest_path: str | Path) -> Path:
+        """
+        Make the cached file with the given contents available at `dest_path`.
+
+        This creates a hard link where possible, and falls back to copying the file
+        (e.g. if `dest_path` is on a different file system than the cache).
+
+        Raises:
+            KeyError: If the given contents are not cached.
+        """
+        src_file = self.open(sha256_hexdigest)
+        if src_file is None:
+            raise KeyError(sha256_hexdigest)
+
+        dest_path = Path(dest_path)
+        with src_file:
+            try:
+                os.link(src_file.name, dest_path)
+            except FileExistsError:
+                raise
+            except OSError as exc:
+                # This includes the case that the entry was evicted after opening it,
+                # in which case we can still copy the contents from the open file.
+                logger.debug(f"Cannot hard-link cached file into {dest_path} ({exc}), copying it instead.")
+                with open(dest_path, "xb") as dest_file:
+                    shutil.copyfileobj(src_file, dest_file)
+        return dest_path
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache fits within `max_size`.
+        """
+        while self._total_size > self.max_size and len(self._entries) > 1:
+            sha256_hexdigest, size = next(iter(self._entries.items()))
+            self._remove_entry(sha256_hexdigest)
+            self._get_path(sha256_hexdigest).unlink(missing_ok=True)
+            logger.debug(f"Evicted {sha256_hexdigest} ({size} bytes) from data file cache")
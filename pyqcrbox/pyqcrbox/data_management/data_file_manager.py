@@ -1,82 +1,841 @@
+import base64
+import hashlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Callable, Iterable, Sequence, TypeVar
 
+import anyio
 import nats.js.errors
+from nats.js import JetStreamContext
+from nats.js.api import ObjectInfo
+from nats.js.object_store import OBJ_DIGEST_TYPE, ObjectStore
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, delete, desc, func, select
 
-from pyqcrbox import logger
-from pyqcrbox.helpers import generate_data_file_id, generate_dataset_id
+from pyqcrbox import logger, settings
+from pyqcrbox.helpers import generate_data_file_id, generate_dataset_id, generate_upload_id
+from pyqcrbox.sql_models import (
+    DataFileDB,
+    DatasetDataFileLinkDB,
+    DatasetDB,
+    DatasetResponseModel,
+    UploadPartDB,
+    UploadSessionDB,
+)
+from pyqcrbox.svcs import get_nats_handle_cache
 
-from .data_file import QCrBoxDataFile, QCrBoxDataset, QCrBoxDatasetResponse
+from .compression import ContentEncoding, decode_chunks, get_content_encoding, get_decoded_size, get_encoding_for_file
+from .data_file import (
+    QCrBoxDataFile,
+    QCrBoxDataFileQuery,
+    QCrBoxDataFileResponse,
+    QCrBoxDataset,
+    QCrBoxDatasetResponse,
+    QCrBoxUploadPart,
+    QCrBoxUploadSession,
+)
+from .data_file_cache import DataFileDiskCache
+from .dataset import Dataset, DatasetMember
+from .object_store_streaming import (
+    DEFAULT_CHUNK_SIZE,
+    add_object_link,
+    delete_object,
+    get_object_info,
+    get_object_info_and_sequence,
+    get_object_mtime,
+    iter_object_chunks_by_info,
+    put_content_addressed_object_stream,
+    put_object_stream,
+    resolve_object_links,
+    touch_object,
+)
+
+# Data files are links into the (content-addressed) blob store, so that identical contents are only stored once
+DATA_FILES_BUCKET = "qcrbox_data_files"
+DATA_BLOBS_BUCKET = "qcrbox_data_blobs"
+
+# Parts of data files which are being uploaded in parts are kept here until they are assembled
+UPLOAD_PARTS_BUCKET = "qcrbox_upload_parts"
+
+# Header of a data file object recording the original filename
+FILENAME_HEADER = "Qcrbox-Filename"
+
+# Parts of an upload session are numbered from 1 to this (inclusive)
+MAX_UPLOAD_PART_NUMBER = 10_000
+
+T = TypeVar("T")
+
+
+class UploadVerificationError(ValueError):
+    """
+    Raised if (part of) an upload doesn't match its expected size or SHA-256 digest, or if parts are missing.
+    """
+
+
+async def iter_local_file_chunks(file_path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(file_path, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+
+async def iter_bytes_chunks(data: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    for idx in range(0, len(data), chunk_size):
+        yield data[idx : idx + chunk_size]
+
+
+class _VerifiedChunks:
+    """
+    Pass chunks through while computing their size and SHA-256 digest.
+
+    If they don't match the expected values, `UploadVerificationError` is raised after the last
+    chunk (rather than once iteration has finished), so that whoever consumes the chunks sees the
+    error before committing to them, e.g. before an object is published to the object store.
+    """
+
+    def __init__(self, chunks: AsyncIterable[bytes], *, size: int | None = None, sha256: str | None = None):
+        self._chunks = chunks
+        self._expected_size = size
+        self._expected_sha256 = sha256.lower() if sha256 is not None else None
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._chunks:
+            self._digest.update(chunk)
+            self.size += len(chunk)
+            yield chunk
+        if self._expected_size is not None and self.size != self._expected_size:
+            raise UploadVerificationError(f"Expected {self._expected_size} bytes but received {self.size}")
+        if self._expected_sha256 is not None and self.sha256 != self._expected_sha256:
+            raise UploadVerificationError(
+                f"SHA-256 digest mismatch (expected {self._expected_sha256}, got {self.sha256})"
+            )
+
+
+def _check_upload_part_number(part_number: int) -> None:
+    if not 1 <= part_number <= MAX_UPLOAD_PART_NUMBER:
+        raise ValueError(f"Part number must be between 1 and {MAX_UPLOAD_PART_NUMBER}, got {part_number}")
+
+
+def _check_upload_is_complete(upload_session: QCrBoxUploadSession) -> None:
+    """
+    Check that all parts of an upload session are present and add up to the expected size (if known).
+    """
+    part_numbers = {part.part_number for part in upload_session.parts}
+    if not part_numbers:
+        raise UploadVerificationError("No parts have been uploaded")
+    missing_part_numbers = sorted(set(range(1, max(part_numbers) + 1)) - part_numbers)
+    if missing_part_numbers:
+        raise UploadVerificationError(f"Missing parts: {missing_part_numbers}")
+    total_size = sum(part.size for part in upload_session.parts)
+    if upload_session.size is not None and total_size != upload_session.size:
+        raise UploadVerificationError(f"Expected {upload_session.size} bytes but the parts add up to {total_size}")
+
+
+def _get_upload_part_name(upload_id: str, part_number: int) -> str:
+    return f"{upload_id}/{part_number}"
+
+
+def _get_data_file_filter_clauses(query: QCrBoxDataFileQuery) -> list:
+    clauses = []
+    if query.filename is not None:
+        clauses.append(DataFileDB.filename == query.filename)
+    if query.filetype is not None:
+        clauses.append(DataFileDB.filetype == query.filetype)
+    if query.sha256 is not None:
+        clauses.append(DataFileDB.sha256 == query.sha256.lower())
+    if query.min_size is not None:
+        clauses.append(DataFileDB.size >= query.min_size)
+    if query.max_size is not None:
+        clauses.append(DataFileDB.size <= query.max_size)
+    if query.uploaded_after is not None:
+        clauses.append(DataFileDB.uploaded_at >= query.uploaded_after)
+    if query.uploaded_before is not None:
+        clauses.append(DataFileDB.uploaded_at < query.uploaded_before)
+    return clauses
+
+
+def _to_upload_session(upload_session: UploadSessionDB) -> QCrBoxUploadSession:
+    return QCrBoxUploadSession(
+        **upload_session.model_dump(exclude={"id"}),
+        parts=[QCrBoxUploadPart.model_validate(part, from_attributes=True) for part in upload_session.parts],
+    )
+
+
+def _was_modified_before(info: ObjectInfo, cutoff: datetime) -> bool:
+    # Objects without a (valid) modification time are treated as recently modified, just to be on the safe side
+    mtime = get_object_mtime(info)
+    return mtime is not None and mtime < cutoff
 
 
 class QCrBoxDataFileManager:
-    def __init__(self):
-        self.datasets = {}
+    """
+    Stores data file contents in the NATS object store and keeps a catalogue of
+    their metadata (and of the datasets they belong to) in the database.
 
-    async def exists(self, qcrbox_file_id: str) -> bool:
+    If a `disk_cache` is given, file contents are read through it, so that repeatedly
+    reading the same contents on the same machine only fetches them from NATS once.
+    """
+
+    def __init__(self, disk_cache: DataFileDiskCache | None = None):
+        self.disk_cache = disk_cache
+        self._upload_part_locks: dict[tuple[str, int], anyio.Lock] = {}
+
+    @classmethod
+    def with_disk_cache_from_settings(cls) -> "QCrBoxDataFileManager":
+        """
+        Create a data file manager using the disk cache configured in the client settings (if any).
+        """
+        cache_dir = settings.registry.client.data_file_cache_dir
+        if cache_dir is None:
+            return cls()
+        return cls(DataFileDiskCache(cache_dir, max_size=settings.registry.client.data_file_cache_max_size))
+
+    @staticmethod
+    async def _run_in_db_session(func: Callable[[Session], T]) -> T:
+        return await settings.db.run_in_session(func, init_db=True)
+
+    @staticmethod
+    async def _get_jetstream(*buckets: str) -> JetStreamContext:
+        """
+        Return the JetStream context of the NATS broker, ensuring that the given buckets exist.
+
+        The object store handles are cached, so this only needs a round trip to the NATS
+        server the first time a bucket is used (or after the broker has reconnected).
+        """
         from pyqcrbox.services import get_nats_broker
 
         nats_broker = await get_nats_broker()
-        data_file_storage = await nats_broker.object_storage("qcrbox_data_files")
+        handle_cache = get_nats_handle_cache(nats_broker)
+        for bucket in buckets:
+            await handle_cache.object_store(bucket)
+        return nats_broker.stream
+
+    @staticmethod
+    async def _get_object_store(bucket: str) -> ObjectStore:
+        from pyqcrbox.services import get_nats_broker
+
+        nats_broker = await get_nats_broker()
+        return await get_nats_handle_cache(nats_broker).object_store(bucket)
+
+    async def exists(self, qcrbox_file_id: str) -> bool:
+        js = await self._get_jetstream(DATA_FILES_BUCKET)
         try:
-            await data_file_storage.get_info(qcrbox_file_id)
+            await get_object_info(js, DATA_FILES_BUCKET, qcrbox_file_id)
             return True
         except nats.js.errors.ObjectNotFoundError:
             return False
 
-    async def import_local_file(self, file_path: str | Path, _qcrbox_file_id: str | None = None) -> str:
-        with open(file_path, "rb") as f:
-            return await self.import_bytes(f.read(), filename=file_path.name, _qcrbox_file_id=_qcrbox_file_id)
+    async def import_local_file(
+        self,
+        file_path: str | Path,
+        _qcrbox_file_id: str | None = None,
+        *,
+        encoding: ContentEncoding | None = None,
+    ) -> str:
+        file_path = Path(file_path)
+        return await self.import_stream(
+            iter_local_file_chunks(file_path),
+            filename=file_path.name,
+            _qcrbox_file_id=_qcrbox_file_id,
+            encoding=encoding,
+        )
 
     async def import_bytes(
-        self, file_contents: bytes, *, filename: str | None = None, _qcrbox_file_id: str | None = None
+        self,
+        file_contents: bytes,
+        *,
+        filename: str | None = None,
+        _qcrbox_file_id: str | None = None,
+        encoding: ContentEncoding | None = None,
     ) -> str:
-        from pyqcrbox.services import get_nats_broker
+        return await self.import_stream(
+            iter_bytes_chunks(file_contents), filename=filename, _qcrbox_file_id=_qcrbox_file_id, encoding=encoding
+        )
 
+    async def import_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        *,
+        filename: str | None = None,
+        _qcrbox_file_id: str | None = None,
+        encoding: ContentEncoding | None = None,
+    ) -> str:
+        """
+        Import a file whose contents are provided chunk by chunk, without holding all of it in memory.
+
+        The contents are stored in a content-addressed blob store, so importing the same contents
+        more than once only adds a new data file entry referencing the existing blob.
+
+        Text-based file types are stored compressed unless a different `encoding` is given
+        (see `get_encoding_for_file()`); this is transparent to anyone reading the file.
+        """
         qcrbox_file_id = _qcrbox_file_id or generate_data_file_id()
-        logger.debug(f"Storing file {filename!r} in NATS object store (id={qcrbox_file_id!r})")
-        logger.warning(f"TODO: Store metadata about the file, including the filename {filename!r}")
+        encoding = encoding or get_encoding_for_file(filename)
+        logger.debug(f"Storing file {filename!r} in NATS object store (id={qcrbox_file_id!r}, encoding={encoding})")
 
-        nats_broker = await get_nats_broker()
-        data_file_storage = await nats_broker.object_storage("qcrbox_data_files")
-        await data_file_storage.put(qcrbox_file_id, file_contents)
+        js = await self._get_jetstream(DATA_BLOBS_BUCKET)
+        blob_info = await put_content_addressed_object_stream(js, DATA_BLOBS_BUCKET, chunks, encoding=encoding)
+        await self._add_data_file_referencing_blob(qcrbox_file_id, blob_info, filename=filename)
         return qcrbox_file_id
 
-    async def create_dataset_from_data_file(self, data_file_id: str) -> str:
+    async def store_local_file_contents(self, file_path: str | Path) -> str:
+        """
+        Store the contents of a local file without adding a data file for them and return their SHA-256 digest.
+
+        This is for clients, which don't keep a catalogue of data files: the server can then add the
+        data file with `import_by_content_hash()` without the contents having to be transferred again.
+        """
+        file_path = Path(file_path)
+        js = await self._get_jetstream(DATA_BLOBS_BUCKET)
+        blob_info = await put_content_addressed_object_stream(
+            js, DATA_BLOBS_BUCKET, iter_local_file_chunks(file_path), encoding=get_encoding_for_file(file_path.name)
+        )
+        return blob_info.name.removeprefix("sha256-")
+
+    async def import_by_content_hash(
+        self, sha256_hexdigest: str, *, filename: str | None = None, _qcrbox_file_id: str | None = None
+    ) -> str:
+        """
+        Import a file whose contents have been stored before, without having to transfer them again.
+
+        Raises:
+            KeyError: If no contents with the given SHA-256 digest have been stored.
+        """
+        js = await self._get_jetstream(DATA_BLOBS_BUCKET)
+        try:
+            blob_info = await touch_object(js, DATA_BLOBS_BUCKET, f"sha256-{sha256_hexdigest.lower()}")
+        except nats.js.errors.ObjectNotFoundError:
+            raise KeyError(sha256_hexdigest) from None
+
+        qcrbox_file_id = _qcrbox_file_id or generate_data_file_id()
+        logger.debug(f"Adding file {filename!r} referencing existing contents (id={qcrbox_file_id!r})")
+        await self._add_data_file_referencing_blob(qcrbox_file_id, blob_info, filename=filename)
+        return qcrbox_file_id
+
+    async def _add_data_file_referencing_blob(
+        self, qcrbox_file_id: str, blob_info: ObjectInfo, *, filename: str | None
+    ) -> None:
+        js = await self._get_jetstream(DATA_FILES_BUCKET)
+        headers = {FILENAME_HEADER: [filename]} if filename else None
+        await add_object_link(js, DATA_FILES_BUCKET, qcrbox_file_id, blob_info, headers=headers)
+
+        def add_data_file(session: Session) -> None:
+            # Importing a file under an existing id replaces it (just like in the object store)
+            data_file = session.exec(
+                select(DataFileDB).where(DataFileDB.qcrbox_file_id == qcrbox_file_id)
+            ).one_or_none() or DataFileDB(qcrbox_file_id=qcrbox_file_id, size=0, sha256="")
+            data_file.filename = filename
+            data_file.filetype = Path(filename).suffix[1:] if filename else ""
+            data_file.size = get_decoded_size(blob_info)
+            data_file.sha256 = blob_info.name.removeprefix("sha256-")
+            data_file.uploaded_at = datetime.now()
+            session.add(data_file)
+            session.commit()
+
+        await self._run_in_db_session(add_data_file)
+
+    async def get_data_files(self, query: QCrBoxDataFileQuery | None = None) -> list[DataFileDB]:
+        query = query or QCrBoxDataFileQuery()
+        return await self._run_in_db_session(
+            lambda session: session.exec(
+                select(DataFileDB)
+                .where(*_get_data_file_filter_clauses(query))
+                .order_by(desc(DataFileDB.uploaded_at), desc(DataFileDB.id))
+                .offset(query.offset)
+                .limit(query.limit)
+            ).all()
+        )
+
+    async def get_data_file(self, data_file_id: str) -> DataFileDB:
+        data_file = await self._run_in_db_session(
+            lambda session: session.exec(
+                select(DataFileDB).where(DataFileDB.qcrbox_file_id == data_file_id)
+            ).one_or_none()
+        )
+        if data_file is None:
+            raise KeyError(data_file_id)
+        return data_file
+
+    async def create_dataset(self, data_file_ids: Sequence[str]) -> str:
+        """
+        Create a dataset from existing data files, which keep the given order within the dataset.
+
+        Datasets only reference their members, so the contents of the data files are never touched.
+        """
         dataset_id = generate_dataset_id()
-        self.datasets[dataset_id] = [data_file_id]
+
+        def create(session: Session) -> None:
+            dataset = DatasetDB(dataset_id=dataset_id)
+            session.add(dataset)
+            session.flush()
+            self._add_dataset_members(session, dataset, data_file_ids)
+            session.commit()
+
+        await self._run_in_db_session(create)
         return dataset_id
 
+    async def create_dataset_from_data_file(self, data_file_id: str) -> str:
+        return await self.create_dataset([data_file_id])
+
+    async def add_data_files_to_dataset(self, dataset_id: str, data_file_ids: Sequence[str]) -> None:
+        def add(session: Session) -> None:
+            dataset = self._get_dataset_db(session, dataset_id)
+            self._add_dataset_members(session, dataset, data_file_ids)
+            session.commit()
+
+        await self._run_in_db_session(add)
+
+    @staticmethod
+    def _get_dataset_db(session: Session, dataset_id: str) -> DatasetDB:
+        dataset = session.exec(select(DatasetDB).where(DatasetDB.dataset_id == dataset_id)).one_or_none()
+        if dataset is None:
+            raise KeyError(dataset_id)
+        return dataset
+
+    @staticmethod
+    def _add_dataset_members(session: Session, dataset: DatasetDB, data_file_ids: Sequence[str]) -> None:
+        # Data files which are already members of the dataset (or are given more than once) are only added once
+        data_file_ids = list(dict.fromkeys(data_file_ids))
+        db_ids = dict(
+            session.exec(
+                select(DataFileDB.qcrbox_file_id, DataFileDB.id).where(
+                    col(DataFileDB.qcrbox_file_id).in_(data_file_ids)
+                )
+            ).all()
+        )
+        for data_file_id in data_file_ids:
+            if data_file_id not in db_ids:
+                raise KeyError(data_file_id)
+
+        existing_members = set(
+            session.exec(
+                select(DatasetDataFileLinkDB.data_file_id).where(DatasetDataFileLinkDB.dataset_id == dataset.id)
+            ).all()
+        )
+        max_position = session.exec(
+            select(func.max(DatasetDataFileLinkDB.position)).where(DatasetDataFileLinkDB.dataset_id == dataset.id)
+        ).one()
+        next_position = 0 if max_position is None else max_position + 1
+        new_members = [
+            db_ids[data_file_id] for data_file_id in data_file_ids if db_ids[data_file_id] not in existing_members
+        ]
+        session.add_all(
+            DatasetDataFileLinkDB(dataset_id=dataset.id, data_file_id=db_id, position=position)
+            for position, db_id in enumerate(new_members, start=next_position)
+        )
+
+    async def get_datasets(self, limit: int = 100, offset: int = 0) -> list[DatasetDB]:
+        return await self._run_in_db_session(
+            lambda session: session.exec(
+                select(DatasetDB).order_by(desc(DatasetDB.created_at), desc(DatasetDB.id)).offset(offset).limit(limit)
+            ).all()
+        )
+
+    async def get_dataset_info(self, dataset_id: str) -> DatasetResponseModel:
+        return await self._run_in_db_session(
+            lambda session: self._get_dataset_db(session, dataset_id).to_response_model()
+        )
+
+    async def get_dataset(self, dataset_id: str) -> Dataset:
+        """
+        Return the dataset with its members, whose contents are only fetched when they are accessed.
+        """
+
+        def get(session: Session) -> Dataset:
+            dataset = self._get_dataset_db(session, dataset_id)
+            members = [
+                DatasetMember(QCrBoxDataFileResponse.model_validate(data_file, from_attributes=True), self)
+                for data_file in dataset.data_files
+            ]
+            return Dataset(dataset.dataset_id, members, created_at=dataset.created_at)
+
+        return await self._run_in_db_session(get)
+
     async def get_file_contents(self, qcrbox_file_id: str) -> bytes:
-        from pyqcrbox.services import get_nats_broker
+        if self.disk_cache is not None:
+            with await self._open_cached_file(qcrbox_file_id) as f:
+                return await anyio.to_thread.run_sync(f.read)
+        return b"".join([chunk async for chunk in self.iter_file_contents(qcrbox_file_id)])
 
-        nats_broker = await get_nats_broker()
-        data_file_storage = await nats_broker.object_storage("qcrbox_data_files")
-        file_obj = await data_file_storage.get(qcrbox_file_id)
-        return file_obj.data
+    async def export_to_path(self, qcrbox_file_id: str, dest_path: str | Path) -> Path:
+        """
+        Write the contents of a data file to `dest_path` (which must not exist yet).
 
-    async def delete(self, qcrbox_file_id: str) -> None:
-        from pyqcrbox.services import get_nats_broker
+        With a disk cache, the cached file is hard-linked to `dest_path` rather than copied
+        where possible, so the file is read-only.
+        """
+        dest_path = Path(dest_path)
+        if self.disk_cache is not None:
+            sha256_hexdigest = await self.get_content_hash(qcrbox_file_id)
+            with await self._open_cached_file(qcrbox_file_id, sha256_hexdigest=sha256_hexdigest):
+                return self.disk_cache.link_to(sha256_hexdigest, dest_path)
 
-        nats_broker = await get_nats_broker()
-        data_file_storage = await nats_broker.object_storage("qcrbox_data_files")
+        async with await anyio.open_file(dest_path, "xb") as f:
+            async for chunk in self.iter_file_contents(qcrbox_file_id):
+                await f.write(chunk)
+        return dest_path
+
+    async def get_content_hash(self, qcrbox_file_id: str) -> str:
+        """
+        Return the SHA-256 digest (as a hex string) of the contents of a data file.
+
+        This only needs the file's metadata, not its contents.
+
+        Raises:
+            nats.js.errors.ObjectNotFoundError: If the data file does not exist.
+        """
+        info = await self._get_data_file_object_info(qcrbox_file_id)
+        if info.is_link():
+            return info.options.link.name.removeprefix("sha256-")
+        # Files stored directly (i.e. not as a link into the blob store) carry their own digest
+        return base64.urlsafe_b64decode(info.digest.removeprefix(OBJ_DIGEST_TYPE)).hex()
+
+    async def get_filename(self, qcrbox_file_id: str) -> str | None:
+        """
+        Return the original filename of a data file (if known), without needing the catalogue.
+
+        Raises:
+            nats.js.errors.ObjectNotFoundError: If the data file does not exist.
+        """
+        info = await self._get_data_file_object_info(qcrbox_file_id)
+        return (info.headers or {}).get(FILENAME_HEADER, [None])[0]
+
+    async def _get_data_file_object_info(self, qcrbox_file_id: str) -> ObjectInfo:
+        js = await self._get_jetstream(DATA_FILES_BUCKET)
+        return await get_object_info(js, DATA_FILES_BUCKET, qcrbox_file_id)
+
+    async def _open_cached_file(self, qcrbox_file_id: str, *, sha256_hexdigest: str | None = None) -> BinaryIO:
+        sha256_hexdigest = sha256_hexdigest or await self.get_content_hash(qcrbox_file_id)
+        while (f := self.disk_cache.open(sha256_hexdigest)) is None:
+            logger.debug(f"Data file {qcrbox_file_id!r} not in disk cache, fetching it from NATS")
+            await self.disk_cache.put_stream(sha256_hexdigest, self.iter_file_contents(qcrbox_file_id))
+        return f
+
+    async def iter_file_contents(self, qcrbox_file_id: str) -> AsyncIterator[bytes]:
+        encoding, chunks = await self.iter_encoded_file_contents(qcrbox_file_id)
+        async for chunk in decode_chunks(chunks, encoding):
+            yield chunk
+
+    async def iter_encoded_file_contents(
+        self, qcrbox_file_id: str, accepted_encodings: Iterable[ContentEncoding] = ()
+    ) -> tuple[ContentEncoding, AsyncIterator[bytes]]:
+        """
+        Return the encoding and the contents (chunk by chunk) of a data file.
+
+        If the file is stored with one of the `accepted_encodings`, its contents are returned
+        exactly as stored (which saves decompressing and recompressing them when they are
+        served over HTTP); otherwise they are decompressed.
+
+        Raises:
+            nats.js.errors.ObjectNotFoundError: If the data file does not exist.
+        """
+        js = await self._get_jetstream(DATA_FILES_BUCKET, DATA_BLOBS_BUCKET)
+        info = await resolve_object_links(js, DATA_FILES_BUCKET, qcrbox_file_id)
+        stored_encoding = get_content_encoding(info)
+        chunks = iter_object_chunks_by_info(js, info)
+        if stored_encoding in accepted_encodings:
+            return stored_encoding, chunks
+        return ContentEncoding.IDENTITY, decode_chunks(chunks, stored_encoding, decoded_size=get_decoded_size(info))
+
+    async def delete(self, qcrbox_file_id: str) -> None:
+        data_file_storage = await self._get_object_store(DATA_FILES_BUCKET)
         try:
             await data_file_storage.delete(qcrbox_file_id)
         except nats.js.errors.ObjectNotFoundError:
             # We don't care if the file doesn't exist in the first place
             pass
 
+        def delete_data_file(session: Session) -> None:
+            data_file_ids = select(DataFileDB.id).where(DataFileDB.qcrbox_file_id == qcrbox_file_id)
+            session.exec(
+                delete(DatasetDataFileLinkDB).where(col(DatasetDataFileLinkDB.data_file_id).in_(data_file_ids))
+            )
+            session.exec(delete(DataFileDB).where(DataFileDB.qcrbox_file_id == qcrbox_file_id))
+            session.commit()
+
+        await self._run_in_db_session(delete_data_file)
+
+    async def create_upload_session(
+        self, filename: str | None, *, size: int | None = None, sha256: str | None = None
+    ) -> QCrBoxUploadSession:
+        """
+        Start uploading a data file in parts, which can be uploaded concurrently and in any order
+        (see `upload_part()`) and are assembled into a data file by `complete_upload_session()`.
+
+        If the `size` or `sha256` digest of the file is given, the assembled contents are verified against them.
+        """
+
+        def create(session: Session) -> QCrBoxUploadSession:
+            upload_session = UploadSessionDB(
+                upload_id=generate_upload_id(),
+                filename=filename,
+                size=size,
+                sha256=sha256.lower() if sha256 is not None else None,
+            )
+            session.add(upload_session)
+            session.commit()
+            session.refresh(upload_session)
+            return _to_upload_session(upload_session)
+
+        return await self._run_in_db_session(create)
+
+    async def get_upload_session(self, upload_id: str) -> QCrBoxUploadSession:
+        return await self._run_in_db_session(
+            lambda session: _to_upload_session(self._get_upload_session_db(session, upload_id))
+        )
+
+    async def get_upload_sessions(self) -> list[QCrBoxUploadSession]:
+        def get_all(session: Session) -> list[QCrBoxUploadSession]:
+            upload_sessions = session.exec(select(UploadSessionDB).order_by(UploadSessionDB.created_at)).all()
+            return [_to_upload_session(upload_session) for upload_session in upload_sessions]
+
+        return await self._run_in_db_session(get_all)
+
+    @staticmethod
+    def _get_upload_session_db(session: Session, upload_id: str) -> UploadSessionDB:
+        upload_session = session.exec(
+            select(UploadSessionDB).where(UploadSessionDB.upload_id == upload_id)
+        ).one_or_none()
+        if upload_session is None:
+            raise KeyError(upload_id)
+        return upload_session
+
+    async def upload_part(
+        self, upload_id: str, part_number: int, chunks: AsyncIterable[bytes], *, sha256: str | None = None
+    ) -> QCrBoxUploadPart:
+        """
+        Store a part of an upload session, streaming it straight into the object store.
+
+        Uploading a part again replaces it, so a failed part can simply be retried (concurrent
+        uploads of the same part are stored one after the other, and the last one wins). If its
+        `sha256` digest is given, the part is only stored if its contents match it.
+
+        Raises:
+            KeyError: If the upload session does not exist.
+            ValueError: If the part number is out of range.
+            UploadVerificationError: If the contents of the part don't match the given digest.
+        """
+        _check_upload_part_number(part_number)
+        await self._run_in_db_session(lambda session: self._get_upload_session_db(session, upload_id))
+
+        async with self._lock_upload_part(upload_id, part_number):
+            return await self._store_upload_part(upload_id, part_number, chunks, sha256=sha256)
+
+    @asynccontextmanager
+    async def _lock_upload_part(self, upload_id: str, part_number: int) -> AsyncIterator[None]:
+        # Storing the same part concurrently would leave the chunks of all but one of the uploads
+        # behind in the object store (see `put_object_stream()`), so these are serialised
+        key = (upload_id, part_number)
+        lock = self._upload_part_locks.setdefault(key, anyio.Lock())
+        try:
+            async with lock:
+                yield
+        finally:
+            if not lock.statistics().tasks_waiting and not lock.locked():
+                self._upload_part_locks.pop(key, None)
+
+    async def _store_upload_part(
+        self, upload_id: str, part_number: int, chunks: AsyncIterable[bytes], *, sha256: str | None
+    ) -> QCrBoxUploadPart:
+        js = await self._get_jetstream(UPLOAD_PARTS_BUCKET)
+        part_name = _get_upload_part_name(upload_id, part_number)
+        verified_chunks = _VerifiedChunks(chunks, sha256=sha256)
+        await put_object_stream(js, UPLOAD_PARTS_BUCKET, part_name, verified_chunks)
+
+        def record_upload_part(session: Session) -> QCrBoxUploadPart:
+            upload_session = self._get_upload_session_db(session, upload_id)
+            upload_part = session.get(UploadPartDB, (upload_session.id, part_number)) or UploadPartDB(
+                upload_session_id=upload_session.id, part_number=part_number, size=0, sha256=""
+            )
+            upload_part.size = verified_chunks.size
+            upload_part.sha256 = verified_chunks.sha256
+            upload_part.uploaded_at = datetime.now()
+            session.add(upload_part)
+            session.commit()
+            return QCrBoxUploadPart.model_validate(upload_part, from_attributes=True)
+
+        try:
+            try:
+                return await self._run_in_db_session(record_upload_part)
+            except IntegrityError:
+                # The same part has been recorded concurrently (by another server process), so update it instead
+                return await self._run_in_db_session(record_upload_part)
+        except KeyError:
+            # The upload has been aborted in the meantime
+            await self._delete_upload_parts(upload_id, [part_number])
+            raise
+
+    async def complete_upload_session(self, upload_id: str, *, _qcrbox_file_id: str | None = None) -> str:
+        """
+        Assemble the parts of an upload session (ordered by part number) into a new data file and return its id.
+
+        The parts are streamed from the object store straight into the blob store, and nothing is
+        stored unless the assembled contents match the expected size and digest (if given). The
+        upload session is removed once the data file has been created.
+
+        Raises:
+            KeyError: If the upload session does not exist.
+            UploadVerificationError: If parts are missing or the contents don't match the expected
+                size or digest (the upload session is kept, so that parts can be uploaded again).
+        """
+        upload_session = await self.get_upload_session(upload_id)
+        _check_upload_is_complete(upload_session)
+
+        js = await self._get_jetstream(UPLOAD_PARTS_BUCKET, DATA_BLOBS_BUCKET)
+        part_names = [_get_upload_part_name(upload_id, part.part_number) for part in upload_session.parts]
+        try:
+            part_infos = [await get_object_info(js, UPLOAD_PARTS_BUCKET, part_name) for part_name in part_names]
+        except nats.js.errors.ObjectNotFoundError:
+            raise UploadVerificationError("Some parts are no longer available, please upload them again") from None
+
+        async def iter_parts():
+            for part_info in part_infos:
+                async for chunk in iter_object_chunks_by_info(js, part_info):
+                    yield chunk
+
+        qcrbox_file_id = await self.import_stream(
+            _VerifiedChunks(iter_parts(), size=upload_session.size, sha256=upload_session.sha256),
+            filename=upload_session.filename,
+            _qcrbox_file_id=_qcrbox_file_id,
+        )
+        await self.abort_upload_session(upload_id)
+        return qcrbox_file_id
+
+    async def abort_upload_session(self, upload_id: str) -> None:
+        """
+        Remove an upload session and all of its parts (this does nothing if the session doesn't exist).
+        """
+
+        def delete_upload_session(session: Session) -> list[int]:
+            upload_session = session.exec(
+                select(UploadSessionDB).where(UploadSessionDB.upload_id == upload_id)
+            ).one_or_none()
+            if upload_session is None:
+                return []
+            part_numbers = [part.part_number for part in upload_session.parts]
+            session.exec(delete(UploadPartDB).where(UploadPartDB.upload_session_id == upload_session.id))
+            session.exec(delete(UploadSessionDB).where(UploadSessionDB.id == upload_session.id))
+            session.commit()
+            return part_numbers
+
+        part_numbers = await self._run_in_db_session(delete_upload_session)
+        await self._delete_upload_parts(upload_id, part_numbers)
+
+    async def _delete_upload_parts(self, upload_id: str, part_numbers: Iterable[int]) -> None:
+        upload_parts_storage = await self._get_object_store(UPLOAD_PARTS_BUCKET)
+        for part_number in part_numbers:
+            try:
+                await upload_parts_storage.delete(_get_upload_part_name(upload_id, part_number))
+            except nats.js.errors.ObjectNotFoundError:
+                pass
+
+    async def iter_unreferenced_blobs(
+        self, min_age: timedelta = timedelta(0), batch_size: int = 500
+    ) -> AsyncIterator[list[ObjectInfo]]:
+        """
+        Yield the info of stored contents which are no longer referenced by any data file, in batches.
+
+        Contents which were stored or reused less than `min_age` ago are left out, because a
+        data file referencing them may be in the process of being imported. The stored contents
+        are listed a batch at a time and looked up in the catalogue of data files, so only one
+        batch is held in memory (but this takes time proportional to the number of stored contents).
+        """
+        cutoff = datetime.now(timezone.utc) - min_age
+        batch = []
+
+        async def get_unreferenced(blob_infos: list[ObjectInfo]) -> list[ObjectInfo]:
+            digests = [info.name.removeprefix("sha256-") for info in blob_infos]
+            referenced_digests = set(
+                await self._run_in_db_session(
+                    lambda session: session.exec(
+                        select(DataFileDB.sha256).where(col(DataFileDB.sha256).in_(digests))
+                    ).all()
+                )
+            )
+            return [info for info, digest in zip(blob_infos, digests) if digest not in referenced_digests]
+
+        async for info in self._iter_objects(DATA_BLOBS_BUCKET):
+            if _was_modified_before(info, cutoff):
+                batch.append(info)
+            if len(batch) == batch_size:
+                if unreferenced_blobs := await get_unreferenced(batch):
+                    yield unreferenced_blobs
+                batch = []
+        if batch and (unreferenced_blobs := await get_unreferenced(batch)):
+            yield unreferenced_blobs
+
+    async def delete_blob(self, blob_name: str, min_age: timedelta = timedelta(0)) -> bool:
+        """
+        Delete stored contents (by name, see `iter_unreferenced_blobs()`) and return whether they were deleted.
+
+        The contents are kept if they have been reused less than `min_age` ago, i.e. since they were
+        found to be unreferenced, or if they are reused while they are being deleted.
+        """
+        js = await self._get_jetstream(DATA_BLOBS_BUCKET)
+        try:
+            info, sequence = await get_object_info_and_sequence(js, DATA_BLOBS_BUCKET, blob_name)
+        except nats.js.errors.ObjectNotFoundError:
+            return False
+        if not _was_modified_before(info, datetime.now(timezone.utc) - min_age):
+            return False
+        # Reusing the contents updates their info (see `touch_object()`), in which case they aren't deleted
+        return await delete_object(js, info, expected_sequence=sequence)
+
+    async def _iter_objects(self, bucket: str) -> AsyncIterator[ObjectInfo]:
+        """
+        Yield the info of all objects in a bucket, streamed through a single watcher.
+        """
+        object_store = await self._get_object_store(bucket)
+        watcher = await object_store.watch(ignore_deletes=True)
+        try:
+            async for info in watcher:
+                if info is None:  # marks the end of the objects that existed when the watch started
+                    return
+                yield info
+        finally:
+            await watcher.stop()
+
 
 class DummyDataFileManager:
     def __init__(self):
         self.dummy_storage = {}
+        self.dummy_blobs: dict[str, bytes] = {}  # SHA-256 hexdigest -> contents
         self.datasets = {}
+        self.upload_sessions: dict[str, QCrBoxUploadSession] = {}
+        self.upload_parts: dict[tuple[str, int], bytes] = {}  # (upload id, part number) -> contents
 
     async def exists(self, qcrbox_file_id: str) -> bool:
         return qcrbox_file_id in self.dummy_storage
 
-    async def import_local_file(self, file_path: str | Path, _qcrbox_file_id: str | None = None) -> str:
-        with open(file_path, "rb") as f:
-            return await self.import_bytes(f.read(), filename=file_path.name, _qcrbox_file_id=_qcrbox_file_id)
+    async def import_local_file(
+        self,
+        file_path: str | Path,
+        _qcrbox_file_id: str | None = None,
+        *,
+        encoding: ContentEncoding | None = None,
+    ) -> str:
+        file_path = Path(file_path)
+        return await self.import_stream(
+            iter_local_file_chunks(file_path), filename=file_path.name, _qcrbox_file_id=_qcrbox_file_id
+        )
+
+    async def import_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        *,
+        filename: str | None = None,
+        _qcrbox_file_id: str | None = None,
+        encoding: ContentEncoding | None = None,
+    ) -> str:
+        # The dummy storage keeps everything in memory anyway
+        file_contents = b"".join([chunk async for chunk in chunks])
+        return await self.import_bytes(file_contents, filename=filename, _qcrbox_file_id=_qcrbox_file_id)
 
     async def import_bytes(
         self,
@@ -84,40 +843,138 @@ class DummyDataFileManager:
         *,
         filename: str | None = None,
         _qcrbox_file_id: str | None = None,
+        encoding: ContentEncoding | None = None,
     ) -> str:
+        # Data files with identical contents share the same bytes object (which is never compressed)
+        sha256_hexdigest = hashlib.sha256(file_contents).hexdigest()
+        self.dummy_blobs.setdefault(sha256_hexdigest, file_contents)
+        return await self.import_by_content_hash(sha256_hexdigest, filename=filename, _qcrbox_file_id=_qcrbox_file_id)
+
+    async def store_local_file_contents(self, file_path: str | Path) -> str:
+        file_contents = Path(file_path).read_bytes()
+        sha256_hexdigest = hashlib.sha256(file_contents).hexdigest()
+        self.dummy_blobs.setdefault(sha256_hexdigest, file_contents)
+        return sha256_hexdigest
+
+    async def import_by_content_hash(
+        self, sha256_hexdigest: str, *, filename: str | None = None, _qcrbox_file_id: str | None = None
+    ) -> str:
+        sha256_hexdigest = sha256_hexdigest.lower()
+        file_contents = self.dummy_blobs[sha256_hexdigest]
         qcrbox_file_id = _qcrbox_file_id or generate_data_file_id()
-        file_extension = Path(filename).suffix[1:]
+        file_extension = Path(filename).suffix[1:] if filename else ""
         data_file = QCrBoxDataFile(
             qcrbox_file_id=qcrbox_file_id,
             filename=filename,
             filetype=file_extension,
-            contents=file_contents,
+            size=len(file_contents),
+            sha256=sha256_hexdigest,
         )
         self.dummy_storage[qcrbox_file_id] = data_file
 
         return qcrbox_file_id
 
-    async def create_dataset_from_data_file(self, data_file_id: str) -> str:
+    async def create_dataset(self, data_file_ids: Sequence[str]) -> str:
         dataset_id = generate_dataset_id()
-        data_files = [await self.get_data_file(data_file_id)]
+        data_files = [await self.get_data_file(data_file_id) for data_file_id in dict.fromkeys(data_file_ids)]
         self.datasets[dataset_id] = QCrBoxDataset(dataset_id=dataset_id, data_files=data_files)
         return dataset_id
 
-    async def get_data_files(self) -> list[QCrBoxDataFile]:
-        return list(self.dummy_storage.values())
+    async def create_dataset_from_data_file(self, data_file_id: str) -> str:
+        return await self.create_dataset([data_file_id])
+
+    async def add_data_files_to_dataset(self, dataset_id: str, data_file_ids: Sequence[str]) -> None:
+        dataset = self.datasets[dataset_id]
+        new_data_files = [await self.get_data_file(data_file_id) for data_file_id in dict.fromkeys(data_file_ids)]
+        existing_ids = {data_file.qcrbox_file_id for data_file in dataset.data_files}
+        dataset.data_files.extend(f for f in new_data_files if f.qcrbox_file_id not in existing_ids)
+
+    async def get_data_files(self, query: QCrBoxDataFileQuery | None = None) -> list[QCrBoxDataFile]:
+        query = query or QCrBoxDataFileQuery()
+        data_files = sorted(self.dummy_storage.values(), key=lambda f: f.uploaded_at, reverse=True)
+        data_files = [f for f in data_files if query.matches(f.to_response_model())]
+        return data_files[query.offset : query.offset + query.limit]
 
     async def get_data_file(self, data_file_id) -> QCrBoxDataFile:
         return self.dummy_storage[data_file_id]
 
-    async def get_datasets(self) -> list[QCrBoxDataset]:
-        return list(self.datasets.values())
+    async def get_datasets(self, limit: int = 100, offset: int = 0) -> list[QCrBoxDataset]:
+        return list(self.datasets.values())[offset : offset + limit]
 
     async def get_dataset_info(self, dataset_id: str) -> QCrBoxDatasetResponse:
         return self.datasets[dataset_id].to_response_model()
 
+    async def get_dataset(self, dataset_id: str) -> Dataset:
+        dataset = self.datasets[dataset_id]
+        members = [DatasetMember(data_file.to_response_model(), self) for data_file in dataset.data_files]
+        return Dataset(dataset.dataset_id, members, created_at=dataset.created_at)
+
     async def get_file_contents(self, qcrbox_file_id: str) -> bytes:
         data_file = self.dummy_storage[qcrbox_file_id]
-        return data_file.contents
+        return self.dummy_blobs[data_file.sha256]
+
+    async def iter_file_contents(self, qcrbox_file_id: str) -> AsyncIterator[bytes]:
+        async for chunk in iter_bytes_chunks(await self.get_file_contents(qcrbox_file_id)):
+            yield chunk
+
+    async def iter_encoded_file_contents(
+        self, qcrbox_file_id: str, accepted_encodings: Iterable[ContentEncoding] = ()
+    ) -> tuple[ContentEncoding, AsyncIterator[bytes]]:
+        return ContentEncoding.IDENTITY, self.iter_file_contents(qcrbox_file_id)
 
     async def delete(self, qcrbox_file_id: str) -> None:
         _ = self.dummy_storage.pop(qcrbox_file_id, None)
+
+    async def create_upload_session(
+        self, filename: str | None, *, size: int | None = None, sha256: str | None = None
+    ) -> QCrBoxUploadSession:
+        upload_session = QCrBoxUploadSession(
+            upload_id=generate_upload_id(),
+            filename=filename,
+            size=size,
+            sha256=sha256.lower() if sha256 is not None else None,
+            created_at=datetime.now(),
+        )
+        self.upload_sessions[upload_session.upload_id] = upload_session
+        return upload_session.model_copy(deep=True)
+
+    async def get_upload_session(self, upload_id: str) -> QCrBoxUploadSession:
+        return self.upload_sessions[upload_id].model_copy(deep=True)
+
+    async def get_upload_sessions(self) -> list[QCrBoxUploadSession]:
+        return [upload_session.model_copy(deep=True) for upload_session in self.upload_sessions.values()]
+
+    async def upload_part(
+        self, upload_id: str, part_number: int, chunks: AsyncIterable[bytes], *, sha256: str | None = None
+    ) -> QCrBoxUploadPart:
+        _check_upload_part_number(part_number)
+        upload_session = self.upload_sessions[upload_id]
+        verified_chunks = _VerifiedChunks(chunks, sha256=sha256)
+        part_contents = b"".join([chunk async for chunk in verified_chunks])
+        self.upload_parts[upload_id, part_number] = part_contents
+
+        upload_part = QCrBoxUploadPart(
+            part_number=part_number, size=len(part_contents), sha256=verified_chunks.sha256, uploaded_at=datetime.now()
+        )
+        other_parts = [part for part in upload_session.parts if part.part_number != part_number]
+        upload_session.parts = sorted([*other_parts, upload_part], key=lambda part: part.part_number)
+        return upload_part
+
+    async def complete_upload_session(self, upload_id: str, *, _qcrbox_file_id: str | None = None) -> str:
+        upload_session = self.upload_sessions[upload_id]
+        _check_upload_is_complete(upload_session)
+        part_contents = [self.upload_parts[upload_id, part.part_number] for part in upload_session.parts]
+        verified_chunks = _VerifiedChunks(
+            iter_bytes_chunks(b"".join(part_contents)), size=upload_session.size, sha256=upload_session.sha256
+        )
+        file_contents = b"".join([chunk async for chunk in verified_chunks])
+        qcrbox_file_id = await self.import_bytes(
+            file_contents, filename=upload_session.filename, _qcrbox_file_id=_qcrbox_file_id
+        )
+        await self.abort_upload_session(upload_id)
+        return qcrbox_file_id
+
+    async def abort_upload_session(self, upload_id: str) -> None:
+        upload_session = self.upload_sessions.pop(upload_id, None)
+        for part in upload_session.parts if upload_session is not None else []:
+            self.upload_parts.pop((upload_id, part.part_number), None)
@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, Optional
+
+from .data_file import QCrBoxDataFileResponse, QCrBoxDatasetResponse
+
+if TYPE_CHECKING:
+    from .data_file_manager import DummyDataFileManager, QCrBoxDataFileManager
+
+__all__ = ["Dataset", "DatasetMember"]
+
+
+class DatasetMember:
+    """
+    A data file belonging to a dataset.
+
+    Only the metadata of the data file is held in memory; its contents are fetched
+    from the data file manager each time they are accessed.
+    """
+
+    def __init__(self, info: QCrBoxDataFileResponse, data_file_manager: "QCrBoxDataFileManager | DummyDataFileManager"):
+        self.info = info
+        self._data_file_manager = data_file_manager
+
+    def __repr__(self) -> str:
+        return f"<DatasetMember: {self.qcrbox_file_id!r} ({self.filename!r})>"
+
+    @property
+    def qcrbox_file_id(self) -> str:
+        return self.info.qcrbox_file_id
+
+    @property
+    def filename(self) -> Optional[str]:
+        return self.info.filename
+
+    @property
+    def filetype(self) -> str:
+        return self.info.filetype
+
+    async def get_contents(self) -> bytes:
+        return await self._data_file_manager.get_file_contents(self.qcrbox_file_id)
+
+    def iter_contents(self) -> AsyncIterator[bytes]:
+        return self._data_file_manager.iter_file_contents(self.qcrbox_file_id)
+
+
+class Dataset:
+    """
+    A dataset made up of an ordered list of data files (e.g. diffraction frames, CIF, HKL and tsc files).
+    """
+
+    def __init__(self, dataset_id: str, members: list[DatasetMember], created_at: Optional[datetime] = None):
+        self.dataset_id = dataset_id
+        self.members = members
+        self.created_at = created_at
+
+    def __repr__(self) -> str:
+        return f"<Dataset: {self.dataset_id!r} ({len(self)} data files)>"
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __iter__(self) -> Iterator[DatasetMember]:
+        return iter(self.members)
+
+    def get_member(self, filename: str) -> DatasetMember:
+        for member in self.members:
+            if member.filename == filename:
+                return member
+        raise KeyError(filename)
+
+    def get_members_by_filetype(self, filetype: str) -> list[DatasetMember]:
+        return [member for member in self.members if member.filetype == filetype]
+
+    def to_response_model(self) -> QCrBoxDatasetResponse:
+        return QCrBoxDatasetResponse(
+            dataset_id=self.dataset_id,
+            created_at=self.created_at,
+            data_files=[member.info for member in self.members],
+        )
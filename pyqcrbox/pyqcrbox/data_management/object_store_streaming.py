@@ -0,0 +1,390 @@
+import base64
+import dataclasses
+import json
+from datetime import datetime, timezone
+from hashlib import sha256
+from typing import AsyncIterable, AsyncIterator
+
+import anyio
+import nats.js.errors
+from nats.js import JetStreamContext, api
+from nats.js.kv import MSG_ROLLUP_SUBJECT
+from nats.js.object_store import (
+    OBJ_CHUNKS_PRE_TEMPLATE,
+    OBJ_DIGEST_TEMPLATE,
+    OBJ_DIGEST_TYPE,
+    OBJ_META_PRE_TEMPLATE,
+    OBJ_STREAM_TEMPLATE,
+)
+from nats.nuid import NUID
+
+from .compression import ContentEncoding, encode_chunks, get_encoding_headers
+
+__all__ = [
+    "add_object_link",
+    "delete_object",
+    "get_object_info",
+    "get_object_info_and_sequence",
+    "get_object_mtime",
+    "iter_object_chunks",
+    "iter_object_chunks_by_info",
+    "put_content_addressed_object_stream",
+    "put_object_stream",
+    "rechunk",
+    "resolve_object_links",
+    "touch_object",
+]
+
+# Chunk size used when storing objects (this is the same default that the NATS clients use)
+DEFAULT_CHUNK_SIZE = 128 * 1024
+
+# JetStream error code for a publish whose `Nats-Expected-Last-Subject-Sequence` header doesn't match
+WRONG_LAST_SEQUENCE_ERR_CODE = 10071
+
+
+class _ObjectChangedError(Exception):
+    """
+    Raised when the info of an object could not be published because it changed since it was read.
+    """
+
+
+async def rechunk(chunks: AsyncIterable[bytes], chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    Regroup the given chunks into chunks of exactly `chunk_size` bytes (except for the last one).
+    """
+    buffer = bytearray()
+    async for data in chunks:
+        buffer += data
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def put_object_stream(
+    js: JetStreamContext,
+    bucket: str,
+    name: str,
+    chunks: AsyncIterable[bytes],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> api.ObjectInfo:
+    """
+    Store the contents of an async iterator in a NATS object store, one chunk at a time.
+
+    This writes the same layout as `ObjectStore.put()` (so the object can be read by any
+    NATS client), but never holds more than a single chunk of the object in memory.
+    """
+    existing_info = await _get_object_info_if_exists(js, bucket, name)
+    info = await _write_object_chunks(js, bucket, chunks, chunk_size)
+    info.name = name
+    await _publish_object_info(js, info, on_error_purge_chunks=True)
+
+    if existing_info is not None:
+        await _purge_object_chunks(js, bucket, existing_info.nuid)
+
+    return info
+
+
+async def put_content_addressed_object_stream(
+    js: JetStreamContext,
+    bucket: str,
+    chunks: AsyncIterable[bytes],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    encoding: ContentEncoding = ContentEncoding.IDENTITY,
+) -> api.ObjectInfo:
+    """
+    Store the contents of an async iterator in a NATS object store under a name derived from
+    its SHA-256 digest (which is computed while the chunks are being written).
+
+    The contents can be stored compressed by passing a different `encoding`, which is recorded
+    in the object's headers. The name is always derived from the uncompressed contents.
+
+    If an object with the same contents already exists (regardless of its encoding), the newly
+    written chunks are discarded and the info of the existing object is returned (after updating
+    its modification time, see `touch_object()`), so identical contents are only stored once.
+    If the existing object is deleted concurrently (e.g. by garbage collection), the newly written
+    chunks are stored after all.
+    """
+    content_digest = sha256()
+    decoded_size = 0
+
+    async def iter_hashed_chunks():
+        nonlocal decoded_size
+        async for chunk in chunks:
+            content_digest.update(chunk)
+            decoded_size += len(chunk)
+            yield chunk
+
+    info = await _write_object_chunks(js, bucket, encode_chunks(iter_hashed_chunks(), encoding), chunk_size)
+    info.name = f"sha256-{content_digest.hexdigest()}"
+    info.headers = get_encoding_headers(encoding, decoded_size)
+
+    while True:
+        existing_info, sequence = await _get_last_object_info(js, bucket, info.name)
+        if existing_info is not None:
+            try:
+                existing_info = await touch_object(js, bucket, info.name)
+            except nats.js.errors.ObjectNotFoundError:
+                continue  # deleted in the meantime (e.g. by garbage collection), so store the new chunks after all
+            await _purge_object_chunks(js, bucket, info.nuid)
+            return existing_info
+
+        try:
+            # This fails if an object with the same contents has been stored in the meantime
+            await _publish_object_info(js, info, on_error_purge_chunks=True, expected_sequence=sequence)
+        except _ObjectChangedError:
+            continue
+        return info
+
+
+async def touch_object(js: JetStreamContext, bucket: str, name: str) -> api.ObjectInfo:
+    """
+    Set the modification time of an object to the current time (without rewriting its contents)
+    and return its updated info.
+
+    This marks contents which are about to be referenced again as recently used, so that
+    garbage collection doesn't delete them in the meantime. The info is only updated if it
+    hasn't changed since it was read, so that an object deleted concurrently (see `delete_object()`)
+    is never brought back without its contents.
+
+    Raises:
+        nats.js.errors.ObjectNotFoundError: If the object does not exist (anymore).
+    """
+    while True:
+        info, sequence = await get_object_info_and_sequence(js, bucket, name)
+        info.mtime = datetime.now(timezone.utc).isoformat()
+        try:
+            await _publish_object_info(js, info, expected_sequence=sequence)
+        except _ObjectChangedError:
+            continue
+        return info
+
+
+async def delete_object(js: JetStreamContext, info: api.ObjectInfo, *, expected_sequence: int | None = None) -> bool:
+    """
+    Delete an object (in the same way as `ObjectStore.delete()`) and return whether it was deleted.
+
+    If the `expected_sequence` of the object's info is given (see `get_object_info_and_sequence()`),
+    the object is only deleted if its info hasn't changed since, e.g. because it was touched
+    by `touch_object()` or replaced.
+    """
+    deleted_info = dataclasses.replace(info, deleted=True, size=0, chunks=0, digest="", mtime="")
+    try:
+        await _publish_object_info(js, deleted_info, expected_sequence=expected_sequence)
+    except _ObjectChangedError:
+        return False
+    await _purge_object_chunks(js, info.bucket, info.nuid)
+    return True
+
+
+def get_object_mtime(info: api.ObjectInfo) -> datetime | None:
+    try:
+        return datetime.fromisoformat(info.mtime)
+    except (TypeError, ValueError):
+        return None
+
+
+async def add_object_link(
+    js: JetStreamContext, bucket: str, name: str, target: api.ObjectInfo, headers: dict[str, list[str]] | None = None
+) -> api.ObjectInfo:
+    """
+    Add an object which links to another object (possibly in a different bucket).
+
+    Links don't have any contents of their own; NATS clients follow them transparently when reading.
+    The link can carry its own `headers` (in the same format as the Go client, i.e. mapping
+    each header name to a list of values).
+    """
+    existing_info = await _get_object_info_if_exists(js, bucket, name)
+    info = api.ObjectInfo(
+        name=name,
+        bucket=bucket,
+        nuid=NUID().next().decode(),
+        size=0,
+        chunks=0,
+        mtime=datetime.now(timezone.utc).isoformat(),
+        headers=headers,
+        options=api.ObjectMetaOptions(link=api.ObjectLink(bucket=target.bucket, name=target.name)),
+    )
+    await _publish_object_info(js, info)
+
+    if existing_info is not None:
+        await _purge_object_chunks(js, bucket, existing_info.nuid)
+
+    return info
+
+
+async def get_object_info(js: JetStreamContext, bucket: str, name: str) -> api.ObjectInfo:
+    """
+    Return the info of an object (equivalent to `ObjectStore.get_info()`, but without needing
+    to look up the object store first).
+
+    Raises:
+        nats.js.errors.ObjectNotFoundError: If the object does not exist.
+    """
+    info, _ = await get_object_info_and_sequence(js, bucket, name)
+    return info
+
+
+async def get_object_info_and_sequence(js: JetStreamContext, bucket: str, name: str) -> tuple[api.ObjectInfo, int]:
+    """
+    Return the info of an object along with the stream sequence of the message holding it,
+    which changes whenever the object is changed (see `delete_object()`).
+
+    Raises:
+        nats.js.errors.ObjectNotFoundError: If the object does not exist.
+    """
+    info, sequence = await _get_last_object_info(js, bucket, name)
+    if info is None:
+        raise nats.js.errors.ObjectNotFoundError
+    return info, sequence
+
+
+async def _get_last_object_info(js: JetStreamContext, bucket: str, name: str) -> tuple[api.ObjectInfo | None, int]:
+    """
+    Return the info of an object (or `None` if it doesn't exist) and the stream sequence of the message
+    holding it (which is 0 if the object has never existed).
+    """
+    stream_name = OBJ_STREAM_TEMPLATE.format(bucket=bucket)
+    meta_subject = _get_meta_subject(bucket, name)
+    try:
+        msg = await js.get_last_msg(stream_name, meta_subject)
+    except nats.js.errors.NotFoundError:
+        return None, 0
+
+    info = api.ObjectInfo.from_response(json.loads(msg.data))
+    return (None if info.deleted else info), msg.seq
+
+
+async def _get_object_info_if_exists(js: JetStreamContext, bucket: str, name: str) -> api.ObjectInfo | None:
+    info, _ = await _get_last_object_info(js, bucket, name)
+    return info
+
+
+async def _write_object_chunks(
+    js: JetStreamContext, bucket: str, chunks: AsyncIterable[bytes], chunk_size: int
+) -> api.ObjectInfo:
+    """
+    Write the given chunks to the object store and return the info of the resulting (as yet unnamed) object.
+
+    The object only becomes visible once its info has been published.
+    """
+    # Use a new nuid so that any existing chunks remain intact if the name is reused
+    nuid = NUID().next().decode()
+    chunk_subject = OBJ_CHUNKS_PRE_TEMPLATE.format(bucket=bucket, obj=nuid)
+
+    digest = sha256()
+    num_chunks = 0
+    total_size = 0
+    try:
+        async for chunk in rechunk(chunks, chunk_size):
+            digest.update(chunk)
+            await js.publish(chunk_subject, chunk)
+            num_chunks += 1
+            total_size += len(chunk)
+    except BaseException:
+        # Don't leave orphaned chunks behind if the upload fails or is aborted
+        await _purge_object_chunks(js, bucket, nuid)
+        raise
+
+    return api.ObjectInfo(
+        name="",
+        bucket=bucket,
+        nuid=nuid,
+        size=total_size,
+        chunks=num_chunks,
+        mtime=datetime.now(timezone.utc).isoformat(),
+        digest=OBJ_DIGEST_TEMPLATE.format(digest=base64.urlsafe_b64encode(digest.digest()).decode()),
+        options=api.ObjectMetaOptions(max_chunk_size=chunk_size),
+    )
+
+
+def _get_meta_subject(bucket: str, name: str) -> str:
+    return OBJ_META_PRE_TEMPLATE.format(bucket=bucket, obj=base64.urlsafe_b64encode(name.encode()).decode())
+
+
+async def _publish_object_info(
+    js: JetStreamContext,
+    info: api.ObjectInfo,
+    on_error_purge_chunks: bool = False,
+    expected_sequence: int | None = None,
+):
+    """
+    Publish the info of an object, which makes it (or any changes to it) visible.
+
+    If the `expected_sequence` of the current info is given (0 for an object that has never existed),
+    this raises `_ObjectChangedError` if the info has changed since; the chunks are kept in that case.
+    """
+    headers = {api.Header.ROLLUP: MSG_ROLLUP_SUBJECT}
+    if expected_sequence is not None:
+        headers[api.Header.EXPECTED_LAST_SUBJECT_SEQUENCE] = str(expected_sequence)
+    try:
+        await js.publish(
+            _get_meta_subject(info.bucket, info.name), json.dumps(info.as_dict()).encode(), headers=headers
+        )
+    except BaseException as exc:
+        if isinstance(exc, nats.js.errors.APIError) and exc.err_code == WRONG_LAST_SEQUENCE_ERR_CODE:
+            raise _ObjectChangedError(info.name) from None
+        if on_error_purge_chunks:
+            await _purge_object_chunks(js, info.bucket, info.nuid)
+        raise
+
+
+async def _purge_object_chunks(js: JetStreamContext, bucket: str, nuid: str) -> None:
+    stream_name = OBJ_STREAM_TEMPLATE.format(bucket=bucket)
+    chunk_subject = OBJ_CHUNKS_PRE_TEMPLATE.format(bucket=bucket, obj=nuid)
+    with anyio.CancelScope(shield=True):
+        await js.purge_stream(stream_name, subject=chunk_subject)
+
+
+async def resolve_object_links(js: JetStreamContext, bucket: str, name: str) -> api.ObjectInfo:
+    """
+    Return the info of an object, following any links to the object actually holding the contents.
+
+    Raises:
+        nats.js.errors.ObjectNotFoundError: If the object (or the target of a link) does not exist.
+    """
+    info = await get_object_info(js, bucket, name)
+    while info.is_link():
+        info = await get_object_info(js, info.options.link.bucket, info.options.link.name)
+    return info
+
+
+async def iter_object_chunks(js: JetStreamContext, bucket: str, name: str) -> AsyncIterator[bytes]:
+    """
+    Yield the contents of an object in a NATS object store chunk by chunk (following links).
+
+    Raises:
+        nats.js.errors.ObjectNotFoundError: If the object does not exist.
+        nats.js.errors.DigestMismatchError: If the retrieved data does not match the stored digest.
+    """
+    info = await resolve_object_links(js, bucket, name)
+    async for chunk in iter_object_chunks_by_info(js, info):
+        yield chunk
+
+
+async def iter_object_chunks_by_info(js: JetStreamContext, info: api.ObjectInfo) -> AsyncIterator[bytes]:
+    """
+    Yield the contents of an object chunk by chunk, given its info (which must not be a link).
+
+    Raises:
+        nats.js.errors.DigestMismatchError: If the retrieved data does not match the stored digest.
+    """
+    if info.size == 0:
+        return
+
+    digest = sha256()
+    chunk_subject = OBJ_CHUNKS_PRE_TEMPLATE.format(bucket=info.bucket, obj=info.nuid)
+    sub = await js.subscribe(chunk_subject, ordered_consumer=True)
+    try:
+        async for msg in sub.messages:
+            digest.update(msg.data)
+            yield msg.data
+            if msg.metadata.num_pending == 0:
+                break
+    finally:
+        await sub.unsubscribe()
+
+    expected_digest = base64.urlsafe_b64decode(info.digest.removeprefix(OBJ_DIGEST_TYPE))
+    if digest.digest() != expected_digest:
+        raise nats.js.errors.DigestMismatchError
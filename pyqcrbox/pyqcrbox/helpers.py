@@ -3,12 +3,20 @@ import re
 import time
 from importlib import import_module
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 from uuid import uuid4
 
 from pyqcrbox.logging import logger
 
-__all__ = ["generate_correlation_id", "generate_data_file_id", "generate_dataset_id", "generate_private_routing_key"]
+__all__ = [
+    "generate_correlation_id",
+    "generate_data_file_id",
+    "generate_dataset_id",
+    "generate_private_routing_key",
+    "is_data_file_id",
+]
+
+DATA_FILE_ID_PREFIX = "qcrbox_df_"
 
 
 def generate_private_routing_key() -> str:
@@ -30,17 +38,27 @@ def generate_calculation_id() -> str:
 
 
 def generate_data_file_id() -> str:
-    result = create_unique_id(prefix="qcrbox_df_")
+    result = create_unique_id(prefix=DATA_FILE_ID_PREFIX)
     logger.debug(f"Generated data file id: {result}")
     return result
 
 
+def is_data_file_id(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(DATA_FILE_ID_PREFIX)
+
+
 def generate_dataset_id() -> str:
     result = create_unique_id(prefix="qcrbox_ds_")
     logger.debug(f"Generated dataset id: {result}")
     return result
 
 
+def generate_upload_id() -> str:
+    result = create_unique_id(prefix="qcrbox_upload_")
+    logger.debug(f"Generated upload id: {result}")
+    return result
+
+
 def create_unique_id(*, prefix="") -> str:
     return f"{prefix}0x{uuid4().hex}"
 
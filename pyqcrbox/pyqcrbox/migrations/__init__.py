@@ -0,0 +1,85 @@
+"""
+Migrations of the database schema, managed with Alembic.
+
+After changing any of the table models, add a revision with the corresponding changes
+(based on a database which has all previous revisions applied) by running:
+
+    QCRBOX__DB__URL=<database url> alembic -c pyqcrbox/migrations/alembic.ini revision --autogenerate -m "<summary>"
+"""
+
+from pathlib import Path
+
+import sqlalchemy
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+
+__all__ = ["drop_version_table", "get_alembic_config", "upgrade_db_schema"]
+
+MIGRATIONS_DIR = Path(__file__).parent
+
+
+def get_alembic_config(connection: sqlalchemy.Connection | None = None) -> Config:
+    config = Config(MIGRATIONS_DIR / "alembic.ini")
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    config.attributes["connection"] = connection
+    return config
+
+
+# The revision that databases created before the schema was managed by migrations are at (see
+# `_get_unversioned_schema_revision()`), and the one that added the current status of calculations
+BASELINE_REVISION = "0000"
+CALCULATION_CURRENT_STATUS_REVISION = "0001"
+
+
+def upgrade_db_schema(connection: sqlalchemy.Connection) -> None:
+    """
+    Bring the schema of the database up to date.
+
+    New databases have all tables created directly from the models and are marked as being at the
+    latest revision. Databases created before the schema was managed by migrations are marked as being
+    at the revision matching their schema and migrated from there, all others have any outstanding
+    migrations applied.
+
+    Raises:
+        RuntimeError: If the schema of a database without a revision doesn't match the models after migrating it.
+    """
+    from pyqcrbox.sql_models import QCrBoxBaseSQLModel  # import here to avoid a circular import
+
+    config = get_alembic_config(connection)
+    if MigrationContext.configure(connection).get_current_revision() is not None:
+        command.upgrade(config, "head")
+        return
+
+    existing_tables = set(sqlalchemy.inspect(connection).get_table_names()) & set(QCrBoxBaseSQLModel.metadata.tables)
+    if not existing_tables:
+        QCrBoxBaseSQLModel.metadata.create_all(connection)
+        command.stamp(config, "head")
+        return
+
+    # Before migrations, missing tables were created on startup (as is done here), and the calculation
+    # tables are the only ones whose schema has changed since then
+    revision = _get_unversioned_schema_revision(connection, existing_tables)
+    QCrBoxBaseSQLModel.metadata.create_all(connection)
+    command.stamp(config, revision)
+    command.upgrade(config, "head")
+
+    if differences := compare_metadata(MigrationContext.configure(connection), QCrBoxBaseSQLModel.metadata):
+        raise RuntimeError(
+            f"The schema of the database (created before its schema was managed by migrations) could "
+            f"not be migrated to match the current one, please recreate it. Remaining differences: {differences}"
+        )
+
+
+def _get_unversioned_schema_revision(connection: sqlalchemy.Connection, existing_tables: set[str]) -> str:
+    if "calculation" not in existing_tables:
+        return "head"  # it is created from the models
+    calculation_columns = {column["name"] for column in sqlalchemy.inspect(connection).get_columns("calculation")}
+    if "current_status" in calculation_columns:
+        return CALCULATION_CURRENT_STATUS_REVISION
+    return BASELINE_REVISION
+
+
+def drop_version_table(connection: sqlalchemy.Connection) -> None:
+    connection.execute(sqlalchemy.text("DROP TABLE IF EXISTS alembic_version"))
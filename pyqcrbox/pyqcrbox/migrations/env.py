@@ -0,0 +1,29 @@
+from alembic import context
+
+from pyqcrbox.settings import settings
+from pyqcrbox.sql_models import QCrBoxBaseSQLModel
+
+target_metadata = QCrBoxBaseSQLModel.metadata
+
+
+def run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite can only alter tables by copying them
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    context.configure(url=settings.db.url, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+elif (connection := context.config.attributes.get("connection")) is not None:
+    # Called from `pyqcrbox.migrations.upgrade_db_schema()`
+    run_migrations(connection)
+else:
+    with settings.db.get_engine().begin() as connection:
+        run_migrations(connection)
@@ -0,0 +1,86 @@
+"""Keep the current status of calculations on the calculation table
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 13:05:12.418305
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = "0000"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+calculation_status_enum = sa.Enum(
+    "SUBMITTED", "RUNNING", "SUCCESSFUL", "FAILED", "CANCELLED", "UNKNOWN", name="calculationstatusenum"
+)
+
+
+def upgrade() -> None:
+    # The columns are added as nullable, filled in from the latest status event of each calculation
+    # (if any), and only then made non-nullable (SQLite can only do this by copying the table).
+    with op.batch_alter_table("calculation") as batch_op:
+        batch_op.add_column(sa.Column("user", sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+        batch_op.add_column(sa.Column("current_status", calculation_status_enum, nullable=True))
+        batch_op.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+
+    op.execute(
+        """
+        UPDATE calculation SET
+            current_status = COALESCE(
+                (
+                    SELECT status FROM calculation_status_event
+                    WHERE calculation_status_event.calculation_id = calculation.id
+                    ORDER BY calculation_status_event.timestamp DESC, calculation_status_event.id DESC
+                    LIMIT 1
+                ),
+                'UNKNOWN'
+            ),
+            updated_at = COALESCE(
+                (
+                    SELECT MAX(timestamp) FROM calculation_status_event
+                    WHERE calculation_status_event.calculation_id = calculation.id
+                ),
+                calculation.timestamp
+            )
+        """
+    )
+
+    with op.batch_alter_table("calculation") as batch_op:
+        batch_op.alter_column("current_status", existing_type=calculation_status_enum, nullable=False)
+        batch_op.alter_column("updated_at", existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index(
+            "ix_calculation_application_slug_timestamp", ["application_slug", "timestamp"], unique=False
+        )
+        batch_op.create_index("ix_calculation_current_status_timestamp", ["current_status", "timestamp"], unique=False)
+        batch_op.create_index(
+            "ix_calculation_current_status_updated_at", ["current_status", "updated_at"], unique=False
+        )
+        batch_op.create_index("ix_calculation_timestamp_id", ["timestamp", "id"], unique=False)
+        batch_op.create_index("ix_calculation_user_timestamp", ["user", "timestamp"], unique=False)
+    op.create_index(
+        "ix_calculation_status_event_calculation_id_timestamp",
+        "calculation_status_event",
+        ["calculation_id", "timestamp"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_calculation_status_event_calculation_id_timestamp", table_name="calculation_status_event")
+    with op.batch_alter_table("calculation") as batch_op:
+        batch_op.drop_index("ix_calculation_user_timestamp")
+        batch_op.drop_index("ix_calculation_timestamp_id")
+        batch_op.drop_index("ix_calculation_current_status_updated_at")
+        batch_op.drop_index("ix_calculation_current_status_timestamp")
+        batch_op.drop_index("ix_calculation_application_slug_timestamp")
+        batch_op.drop_column("updated_at")
+        batch_op.drop_column("current_status")
+        batch_op.drop_column("user")
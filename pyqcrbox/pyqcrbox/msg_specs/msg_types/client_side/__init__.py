@@ -1,5 +1,6 @@
+from .cancel_calculation import *
 from .command_execution_request import *
-from .command_invocation_client_response import *
 from .command_invocation_request import *
 from .execute_command import *
 from .get_calculation_status import *
+from .request_work_nats import *
@@ -0,0 +1,7 @@
+from pyqcrbox.sql_models import QCrBoxPydanticBaseModel
+
+__all__ = ["CancelCalculationNATS"]
+
+
+class CancelCalculationNATS(QCrBoxPydanticBaseModel):
+    calculation_id: str
@@ -1,12 +1,6 @@
-from pyqcrbox.sql_models.base import QCrBoxPydanticBaseModel
-
 from ..server_side.invoke_command_nats import CommandInvocationRequestNATS
 
-__all__ = ["DiscardCommandInvocationNATS", "CommandExecutionRequestNATS"]
-
-
-class DiscardCommandInvocationNATS(QCrBoxPydanticBaseModel):
-    calculation_id: str
+__all__ = ["CommandExecutionRequestNATS"]
 
 
 class CommandExecutionRequestNATS(CommandInvocationRequestNATS):
@@ -0,0 +1,29 @@
+from pyqcrbox.sql_models import QCrBoxPydanticBaseModel
+
+from .command_execution_request import CommandExecutionRequestNATS
+
+__all__ = ["AcknowledgeWorkNATS", "AcknowledgeWorkResponseNATS", "RequestWorkNATS", "RequestWorkResponseNATS"]
+
+
+class RequestWorkNATS(QCrBoxPydanticBaseModel):
+    application_slug: str
+    application_version: str
+    client_id: str
+    private_inbox_prefix: str
+    num_free_slots: int
+    num_free_slots_per_command: dict[str, int] = {}
+
+
+class RequestWorkResponseNATS(QCrBoxPydanticBaseModel):
+    jobs: list[CommandExecutionRequestNATS]
+
+
+class AcknowledgeWorkNATS(QCrBoxPydanticBaseModel):
+    client_id: str
+    private_inbox_prefix: str
+    calculation_ids: list[str]
+
+
+class AcknowledgeWorkResponseNATS(QCrBoxPydanticBaseModel):
+    # Only these calculations may be executed (any others have been handed out again in the meantime)
+    calculation_ids: list[str]
@@ -1,4 +1,7 @@
 from .client_indicates_availability_to_execute_command import *
+from .get_scheduler_stats import *
 from .invoke_command import *
 from .invoke_command_nats import *
 from .register_application import *
+from .register_data_files import *
+from .run_garbage_collection import *
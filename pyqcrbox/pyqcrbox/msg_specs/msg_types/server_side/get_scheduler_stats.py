@@ -0,0 +1,22 @@
+from typing import Optional
+
+from pyqcrbox.sql_models import CalculationPriorityEnum, QCrBoxPydanticBaseModel
+
+__all__ = ["GetSchedulerStatsNATS", "PriorityClassStatsNATS", "SchedulerStatsResponseNATS"]
+
+
+class GetSchedulerStatsNATS(QCrBoxPydanticBaseModel):
+    pass
+
+
+class PriorityClassStatsNATS(QCrBoxPydanticBaseModel):
+    priority: CalculationPriorityEnum
+    num_queued: int
+    num_running: int
+    num_dispatched: int
+    max_wait_time_queued: Optional[float]  # seconds
+    mean_wait_time_dispatched: Optional[float]  # seconds
+
+
+class SchedulerStatsResponseNATS(QCrBoxPydanticBaseModel):
+    queues: list[PriorityClassStatsNATS]
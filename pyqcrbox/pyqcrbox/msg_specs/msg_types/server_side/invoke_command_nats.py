@@ -1,10 +1,10 @@
-from typing import Any
+from typing import Any, Optional
 
 from pyqcrbox import helpers
 
-__all__ = ["InvokeCommandNATS", "CommandInvocationRequestNATS"]
+__all__ = ["InvokeCommandNATS", "InvokeCommandBatchNATS", "CommandInvocationRequestNATS"]
 
-from pyqcrbox.sql_models import QCrBoxPydanticBaseModel
+from pyqcrbox.sql_models import CalculationPriorityEnum, QCrBoxPydanticBaseModel
 
 
 class InvokeCommandNATS(QCrBoxPydanticBaseModel):
@@ -12,6 +12,8 @@ class InvokeCommandNATS(QCrBoxPydanticBaseModel):
     application_version: str | None
     command_name: str
     arguments: dict[str, Any]
+    priority: CalculationPriorityEnum = CalculationPriorityEnum.NORMAL
+    user: Optional[str] = None
 
     @property
     def nats_subject_parts(self):
@@ -20,5 +22,9 @@ class InvokeCommandNATS(QCrBoxPydanticBaseModel):
         return f"{slug_sanitized}.{version_sanitized}"
 
 
+class InvokeCommandBatchNATS(QCrBoxPydanticBaseModel):
+    invocations: list[InvokeCommandNATS]
+
+
 class CommandInvocationRequestNATS(InvokeCommandNATS):
     calculation_id: str
@@ -0,0 +1,20 @@
+from typing import Optional
+
+from pyqcrbox.sql_models import QCrBoxPydanticBaseModel
+
+__all__ = ["DataFileContentsNATS", "RegisterDataFilesNATS", "RegisterDataFilesResponseNATS"]
+
+
+class DataFileContentsNATS(QCrBoxPydanticBaseModel):
+    # Contents which have already been stored in the object store (see `store_local_file_contents()`)
+    sha256: str
+    filename: Optional[str] = None
+
+
+class RegisterDataFilesNATS(QCrBoxPydanticBaseModel):
+    files: list[DataFileContentsNATS]
+
+
+class RegisterDataFilesResponseNATS(QCrBoxPydanticBaseModel):
+    # The ids of the new data files (in the same order as the files in the request)
+    qcrbox_file_ids: list[str]
@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Optional
+
+from pyqcrbox.sql_models import QCrBoxPydanticBaseModel
+
+__all__ = ["GarbageCollectionReportNATS", "RunGarbageCollectionNATS"]
+
+
+class RunGarbageCollectionNATS(QCrBoxPydanticBaseModel):
+    dry_run: bool = True
+
+
+class GarbageCollectionReportNATS(QCrBoxPydanticBaseModel):
+    dry_run: bool
+    started_at: datetime
+    duration: Optional[float] = None  # seconds
+    num_calculations: int = 0
+    num_data_files: int = 0
+    data_file_size: int = 0  # bytes
+    num_blobs: int = 0  # stored contents no longer referenced by any data file
+    blob_size: int = 0  # bytes (as stored, i.e. possibly compressed)
+    num_upload_sessions: int = 0  # abandoned uploads in parts
+    # Only the first few ids are listed, to keep the report small (the numbers above are always complete)
+    calculation_ids: list[str] = []
+    data_file_ids: list[str] = []
+    db_vacuumed: bool = False
@@ -1,4 +1,7 @@
 from enum import StrEnum
+from typing import Optional
+
+import anyio
 
 from pyqcrbox import logger
 
@@ -11,29 +14,110 @@ class ClientStatusEnum(StrEnum):
 
 
 class ClientStatus:
-    def __init__(self, initial_status: ClientStatusEnum | str = ClientStatusEnum.IDLE):
-        self._status = ClientStatusEnum(initial_status)
+    """
+    Keeps track of the calculations a client is currently handling.
+
+    Each calculation occupies one execution slot, which is either 'pending' (the client
+    has received the job from the server but not started executing it yet) or 'busy'.
+    The client is available as long as there are free slots, both in total and for the
+    specific command being requested.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_calculations: int = 1,
+        max_concurrent_calculations_per_command: Optional[dict[str, int]] = None,
+    ):
+        if max_concurrent_calculations < 1:
+            raise ValueError(f"The number of slots must be at least 1, got: {max_concurrent_calculations!r}")
+
+        self.max_concurrent_calculations = max_concurrent_calculations
+        self.max_concurrent_calculations_per_command = max_concurrent_calculations_per_command or {}
+        self._slots: dict[str, tuple[str, ClientStatusEnum]] = {}
+        self._slot_released_event = anyio.Event()
+
+    def __repr__(self):
+        clsname = self.__class__.__name__
+        return f"<{clsname}: {self.status} ({self.num_occupied_slots}/{self.max_concurrent_calculations} slots)>"
+
+    @property
+    def status(self) -> ClientStatusEnum:
+        if not self._slots:
+            return ClientStatusEnum.IDLE
+        elif any(slot_status == ClientStatusEnum.BUSY for (_, slot_status) in self._slots.values()):
+            return ClientStatusEnum.BUSY
+        else:
+            return ClientStatusEnum.PENDING
+
+    @property
+    def num_occupied_slots(self) -> int:
+        return len(self._slots)
 
     @property
-    def status(self):
-        return self._status
+    def num_free_slots(self) -> int:
+        return self.max_concurrent_calculations - self.num_occupied_slots
+
+    def num_free_slots_for_command(self, command_name: str) -> int:
+        num_free_slots = self.num_free_slots
+        try:
+            max_for_command = self.max_concurrent_calculations_per_command[command_name]
+        except KeyError:
+            return num_free_slots
+
+        num_occupied_for_command = sum(1 for (cmd_name, _) in self._slots.values() if cmd_name == command_name)
+        return min(num_free_slots, max_for_command - num_occupied_for_command)
 
     @property
-    def is_available(self) -> bool:
-        return self.status == ClientStatusEnum.IDLE
-
-    def set_pending(self) -> None:
-        if self.status != ClientStatusEnum.IDLE:
-            raise RuntimeError(f"Cannot set status to 'pending' from '{self.status} (current status must be 'idle').")
-        logger.debug("Setting client status to 'pending'")
-        self._status = ClientStatusEnum.PENDING
-
-    def set_idle(self) -> None:
-        logger.debug("Setting client status to 'idle'")
-        self._status = ClientStatusEnum.IDLE
-
-    def set_busy(self) -> None:
-        if self.status != ClientStatusEnum.PENDING:
-            raise RuntimeError(f"Cannot set status to 'busy' from '{self.status} (current status must be 'pending').")
-        logger.debug("Setting client status to 'busy'")
-        self._status = ClientStatusEnum.BUSY
+    def num_free_slots_per_command(self) -> dict[str, int]:
+        """
+        Number of free slots for each command that has its own concurrency limit.
+        """
+        return {
+            cmd_name: self.num_free_slots_for_command(cmd_name)
+            for cmd_name in self.max_concurrent_calculations_per_command
+        }
+
+    def is_available(self, command_name: Optional[str] = None) -> bool:
+        if command_name is None:
+            return self.num_free_slots > 0
+        return self.num_free_slots_for_command(command_name) > 0
+
+    async def wait_for_free_slot(self) -> None:
+        while not self.is_available():
+            await self._slot_released_event.wait()
+
+    def get_calculation_status(self, calculation_id: str) -> ClientStatusEnum:
+        try:
+            _, slot_status = self._slots[calculation_id]
+        except KeyError:
+            return ClientStatusEnum.IDLE
+        return slot_status
+
+    def set_pending(self, calculation_id: str, command_name: str) -> None:
+        if calculation_id in self._slots:
+            raise RuntimeError(f"Calculation {calculation_id!r} already occupies a slot on this client.")
+        if not self.is_available(command_name):
+            raise RuntimeError(
+                f"Cannot set status to 'pending' for {calculation_id!r} (no free slots for command {command_name!r})."
+            )
+        logger.debug(f"Setting status of calculation {calculation_id!r} to 'pending'")
+        self._slots[calculation_id] = (command_name, ClientStatusEnum.PENDING)
+
+    def set_busy(self, calculation_id: str) -> None:
+        slot_status = self.get_calculation_status(calculation_id)
+        if slot_status != ClientStatusEnum.PENDING:
+            raise RuntimeError(
+                f"Cannot set status to 'busy' for {calculation_id!r} from '{slot_status}' "
+                "(current status must be 'pending')."
+            )
+        logger.debug(f"Setting status of calculation {calculation_id!r} to 'busy'")
+        command_name, _ = self._slots[calculation_id]
+        self._slots[calculation_id] = (command_name, ClientStatusEnum.BUSY)
+
+    def set_idle(self, calculation_id: str) -> None:
+        logger.debug(f"Releasing slot occupied by calculation {calculation_id!r}")
+        self._slots.pop(calculation_id, None)
+
+        # Wake up anyone waiting for a free slot (anyio events cannot be reset, so we replace it)
+        self._slot_released_event.set()
+        self._slot_released_event = anyio.Event()
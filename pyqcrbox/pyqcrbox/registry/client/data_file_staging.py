@@ -0,0 +1,135 @@
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import anyio
+
+from pyqcrbox import logger, settings
+from pyqcrbox.data_management import QCrBoxDataFileManager
+from pyqcrbox.helpers import is_data_file_id
+from pyqcrbox.msg_specs import DataFileContentsNATS
+from pyqcrbox.sql_models import CommandSpecDiscriminatedUnion
+
+__all__ = ["DataFileStaging"]
+
+INPUT_FILE_DTYPES = ("QCrBox.input_cif", "QCrBox.input_file")
+OUTPUT_FILE_DTYPES = ("QCrBox.output_cif", "QCrBox.output_file")
+
+
+def _get_default_output_filename(param) -> str:
+    return f"{param.name}.cif" if param.dtype == "QCrBox.output_cif" else param.name
+
+
+class DataFileStaging:
+    """
+    Stages the data files passed as arguments to a calculation in a scratch directory.
+
+    Arguments of input file parameters which are QCrBox data file ids are fetched (in parallel)
+    into a scratch directory private to the calculation and replaced with the paths of the
+    fetched files. Any output file parameters of such a calculation are placed in the same
+    directory, and the contents of the output files are uploaded once the calculation has
+    finished (to be added as new data files by the server). This means the client doesn't
+    need access to a filesystem shared with the server and other clients.
+
+    Arguments which are plain paths are passed through unchanged, and calculations
+    without any data file arguments don't use a scratch directory at all.
+    """
+
+    def __init__(
+        self,
+        cmd_spec: CommandSpecDiscriminatedUnion,
+        arguments: dict[str, Any],
+        *,
+        calculation_id: str,
+        data_file_manager: QCrBoxDataFileManager,
+    ):
+        self.cmd_spec = cmd_spec
+        self.arguments = arguments
+        self.calculation_id = calculation_id
+        self.data_file_manager = data_file_manager
+        self.input_data_file_ids = {
+            param.name: arguments[param.name]
+            for param in cmd_spec.parameters
+            if param.dtype in INPUT_FILE_DTYPES and is_data_file_id(arguments.get(param.name))
+        }
+        self.scratch_dir: Path | None = None
+        self.output_paths: dict[str, Path] = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.calculation_id!r}, scratch_dir={self.scratch_dir}>"
+
+    @property
+    def is_needed(self) -> bool:
+        return bool(self.input_data_file_ids)
+
+    async def stage_inputs(self) -> dict[str, Any]:
+        """
+        Fetch the input data files and return the arguments to run the calculation with.
+        """
+        if not self.is_needed:
+            return self.arguments
+
+        scratch_root = settings.registry.client.scratch_dir
+        if scratch_root is not None:
+            scratch_root.mkdir(parents=True, exist_ok=True)
+        self.scratch_dir = Path(tempfile.mkdtemp(prefix=f"{self.calculation_id}_", dir=scratch_root))
+        logger.debug(f"Staging {len(self.input_data_file_ids)} data files in {self.scratch_dir}")
+
+        # Keep the original filenames where possible, because some programs expect
+        # related input files to share the same stem (e.g. structure.ins and structure.hkl).
+        input_paths = {}
+        for param_name, qcrbox_file_id in self.input_data_file_ids.items():
+            filename = Path(await self.data_file_manager.get_filename(qcrbox_file_id) or param_name).name
+            input_paths[param_name] = self._get_unused_path(filename, param_name, input_paths.values())
+
+        async with anyio.create_task_group() as tg:
+            for param_name, qcrbox_file_id in self.input_data_file_ids.items():
+                tg.start_soon(self.data_file_manager.export_to_path, qcrbox_file_id, input_paths[param_name])
+
+        for param in self.cmd_spec.parameters:
+            if param.dtype not in OUTPUT_FILE_DTYPES:
+                continue
+            value = self.arguments.get(param.name)
+            if value is None and not param.required:
+                continue
+            filename = Path(value).name if value else _get_default_output_filename(param)
+            used_paths = [*input_paths.values(), *self.output_paths.values()]
+            self.output_paths[param.name] = self._get_unused_path(filename, param.name, used_paths)
+
+        staged_paths = input_paths | self.output_paths
+        return self.arguments | {param_name: str(path) for param_name, path in staged_paths.items()}
+
+    def _get_unused_path(self, filename: str, param_name: str, used_paths) -> Path:
+        path = self.scratch_dir / filename
+        if path in used_paths:
+            path = self.scratch_dir / param_name / filename
+            path.parent.mkdir()
+        return path
+
+    async def upload_outputs(self) -> dict[str, DataFileContentsNATS]:
+        """
+        Upload the contents of the output files of the calculation (by parameter name).
+
+        Data files for them still need to be added by the server, which keeps the catalogue of data files.
+        """
+        output_contents = {}
+
+        async def upload(param_name: str, path: Path):
+            sha256 = await self.data_file_manager.store_local_file_contents(path)
+            output_contents[param_name] = DataFileContentsNATS(sha256=sha256, filename=path.name)
+
+        async with anyio.create_task_group() as tg:
+            for param_name, path in self.output_paths.items():
+                if path.is_file():
+                    tg.start_soon(upload, param_name, path)
+                else:
+                    logger.warning(f"Calculation {self.calculation_id!r} did not produce output file {path.name!r}")
+
+        return output_contents
+
+    def cleanup(self) -> None:
+        if self.scratch_dir is None or settings.registry.client.keep_scratch_dirs:
+            return
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        self.scratch_dir = None
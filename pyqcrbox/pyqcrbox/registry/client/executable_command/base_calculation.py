@@ -10,11 +10,23 @@ class BaseCalculation(metaclass=ABCMeta):
     def __init__(self, *, calculation_id: str, calc_finished_event: anyio.Event):
         self.calculation_id = calculation_id
         self.calc_finished_event = calc_finished_event
+        self.is_cancelled = False
 
     @abstractmethod
     async def wait_until_finished(self):
         pass
 
+    @abstractmethod
+    async def terminate(self):
+        """
+        Stop the calculation (including any processes it has spawned) if it is still running.
+        """
+        pass
+
+    async def cancel(self):
+        self.is_cancelled = True
+        await self.terminate()
+
     @property
     @abstractmethod
     def status(self) -> CalculationStatusEnum:
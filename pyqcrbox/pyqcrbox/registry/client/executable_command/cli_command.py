@@ -10,7 +10,12 @@ __all__ = ["CLICommand"]
 # SPDX-License-Identifier: MPL-2.0
 
 import asyncio
+import contextlib
+import functools
 import inspect
+import os
+import resource
+import signal
 import subprocess
 
 from pyqcrbox import logger
@@ -74,6 +79,21 @@ class QCrBoxCmdArgumentMismatch(Exception):
     pass
 
 
+def _apply_resource_limits(max_memory: int | None, cpu_affinity: list[int] | None, nice: int | None):
+    """
+    Restrict the resources available to the current process.
+
+    This is run in the child process right before the command is executed, so
+    the limits are inherited by any processes spawned by the command.
+    """
+    if max_memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    if cpu_affinity is not None:
+        os.sched_setaffinity(0, cpu_affinity)
+    if nice is not None:
+        os.nice(nice)
+
+
 class CLICommand(BaseCommand):
     def __init__(self, cmd_spec: CLICommandSpec):
         assert cmd_spec.implemented_as == "cli_command"
@@ -119,14 +139,34 @@ class CLICommand(BaseCommand):
             stdout=_stdout,
             stderr=_stderr,
             cwd=_cwd,
+            # Run the command in its own process group so that it can be
+            # terminated together with any child processes it spawns.
+            start_new_session=True,
+            preexec_fn=self._get_preexec_fn(),
         )
 
-        return CLICmdCalculation(self.proc, calculation_id=_calculation_id, calc_finished_event=calc_finished_event)
+        return CLICmdCalculation(
+            self.proc,
+            calculation_id=_calculation_id,
+            calc_finished_event=calc_finished_event,
+            timeout=self.cmd_spec.timeout,
+        )
+
+    def _get_preexec_fn(self):
+        limits = dict(
+            max_memory=self.cmd_spec.max_memory,
+            cpu_affinity=self.cmd_spec.cpu_affinity,
+            nice=self.cmd_spec.nice,
+        )
+        if all(value is None for value in limits.values()):
+            return None
+        return functools.partial(_apply_resource_limits, **limits)
 
     async def terminate(self):
         if self.proc:
-            logger.debug("Terminating process running CLI command.")
-            self.proc.terminate()
-            logger.trace("Process terminated.")
+            logger.debug("Terminating process group running CLI command.")
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(self.proc.pid, signal.SIGTERM)
+            logger.debug("Process terminated.")
         else:
-            logger.trace(f"No process running for {self} - nothing to terminate.")
+            logger.debug(f"No process running for {self} - nothing to terminate.")
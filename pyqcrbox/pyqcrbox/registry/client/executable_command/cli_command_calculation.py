@@ -1,48 +1,139 @@
 # SPDX-License-Identifier: MPL-2.0
 import asyncio
+import contextlib
+import os
+import signal
+from enum import StrEnum
 
 import anyio
 
-from pyqcrbox import logger
+from pyqcrbox import logger, settings
 from pyqcrbox.sql_models import CalculationStatusEnum
 
 from .base_calculation import BaseCalculation
+from .output_tail import OutputTail
+
+
+def _get_signal_name(signum: int) -> str:
+    try:
+        return signal.Signals(signum).name
+    except ValueError:
+        return str(signum)
+
+
+class CLICmdFailureReason(StrEnum):
+    NONZERO_EXIT_CODE = "nonzero_exit_code"
+    KILLED_BY_SIGNAL = "killed_by_signal"
+    TIMEOUT = "timeout"
 
 
 class CLICmdCalculation(BaseCalculation):
-    def __init__(self, proc: asyncio.subprocess.Process, calculation_id: str, calc_finished_event: anyio.Event):
+    def __init__(
+        self,
+        proc: asyncio.subprocess.Process,
+        calculation_id: str,
+        calc_finished_event: anyio.Event,
+        timeout: float | None = None,
+    ):
         super().__init__(calculation_id=calculation_id, calc_finished_event=calc_finished_event)
         self.proc = proc
         self.calculation_id = calculation_id
-        self._stdout = ""
-        self._stderr = ""
-        self.retrieved_stdout_stderr = False
+        self.timeout = timeout
+        self.timed_out = False
+        self._stdout = OutputTail(max_size=settings.registry.client.max_captured_output_size)
+        self._stderr = OutputTail(max_size=settings.registry.client.max_captured_output_size)
         self.calc_finished_event = calc_finished_event
 
     async def wait_until_finished(self):
         logger.debug(f"Waiting for calculation to finish: {self.calculation_id!r}")
-        # logger.debug("Waiting for process to exit...")
-        await self.proc.wait()
-        # logger.debug("Process finished.")
+        async with anyio.create_task_group() as tg:
+            # Drain the output pipes while the process is running, otherwise it blocks
+            # as soon as the pipe buffers are full.
+            for stream, output_tail in [(self.proc.stdout, self._stdout), (self.proc.stderr, self._stderr)]:
+                if stream is not None:
+                    tg.start_soon(output_tail.read_from, stream)
+
+            with anyio.move_on_after(self.timeout) as cancel_scope:
+                await self.proc.wait()
+
+            if cancel_scope.cancelled_caught:
+                logger.warning(f"Calculation {self.calculation_id!r} exceeded its time limit of {self.timeout} seconds")
+                self.timed_out = True
+                await self.terminate()
+
+            # Any processes that were spawned in the background and outlive the command
+            # may keep the pipes open, so don't wait forever for them to be closed.
+            tg.cancel_scope.deadline = anyio.current_time() + settings.registry.client.termination_grace_period
+
         self.calc_finished_event.set()
         logger.debug(f"Calculation finished: {self.calculation_id!r} (status: {self.status!r})")
         if self.status == CalculationStatusEnum.FAILED:
             logger.debug(f"\nStdout:\n\n{await self.stdout}\n\nStderr:\n\n{await self.stderr}")
 
+    async def terminate(self):
+        if self.proc.returncode is not None:
+            logger.debug(f"Process for calculation {self.calculation_id!r} has already exited - nothing to terminate.")
+            return
+
+        logger.debug(f"Terminating process group running calculation {self.calculation_id!r}")
+        self._signal_process_group(signal.SIGTERM)
+        with anyio.move_on_after(settings.registry.client.termination_grace_period) as cancel_scope:
+            await self.proc.wait()
+
+        if cancel_scope.cancelled_caught:
+            logger.warning(f"Process group did not exit after SIGTERM, killing it: {self.calculation_id!r}")
+            self._signal_process_group(signal.SIGKILL)
+            await self.proc.wait()
+        logger.debug("Process terminated.")
+
+    def _signal_process_group(self, sig: signal.Signals):
+        # The process may have exited in the meantime, in which case there is nothing left to do
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(self.proc.pid, sig)
+
     @property
     def status(self) -> CalculationStatusEnum:
+        if self.is_cancelled:
+            return CalculationStatusEnum.CANCELLED
+
         match self.proc.returncode:
             case None:
                 status = CalculationStatusEnum.RUNNING
-            case 0:
+            case 0 if not self.timed_out:
                 status = CalculationStatusEnum.SUCCESSFUL
             case _:
                 status = CalculationStatusEnum.FAILED
 
         return status
 
+    @property
+    def failure_reason(self) -> CLICmdFailureReason | None:
+        if self.status != CalculationStatusEnum.FAILED:
+            return None
+        elif self.timed_out:
+            return CLICmdFailureReason.TIMEOUT
+        elif self.returncode < 0:
+            return CLICmdFailureReason.KILLED_BY_SIGNAL
+        else:
+            return CLICmdFailureReason.NONZERO_EXIT_CODE
+
     def _get_status_details_extra_info(self):
-        return {"returncode": self.returncode}
+        extra_info = {"returncode": self.returncode}
+        match self.failure_reason:
+            case None:
+                pass
+            case CLICmdFailureReason.TIMEOUT:
+                extra_info |= {"failure_reason": self.failure_reason, "timeout": self.timeout}
+            case CLICmdFailureReason.KILLED_BY_SIGNAL:
+                extra_info |= {"failure_reason": self.failure_reason, "signal": _get_signal_name(-self.returncode)}
+            case _:
+                extra_info |= {"failure_reason": self.failure_reason}
+
+        # Only the tail of the output is kept, so let users know if anything was discarded
+        for name, output_tail in [("stdout", self._stdout), ("stderr", self._stderr)]:
+            if output_tail.is_truncated:
+                extra_info[f"{name}_num_bytes_total"] = output_tail.num_bytes_total
+        return extra_info
 
     @property
     def returncode(self) -> int:
@@ -50,17 +141,8 @@ class CLICmdCalculation(BaseCalculation):
 
     @property
     async def stdout(self) -> str:
-        await self.retrieve_stdout_stderr()
-        return self._stdout
+        return str(self._stdout)
 
     @property
     async def stderr(self) -> str:
-        await self.retrieve_stdout_stderr()
-        return self._stderr
-
-    async def retrieve_stdout_stderr(self):
-        if self.status != CalculationStatusEnum.RUNNING and not self.retrieved_stdout_stderr:
-            stdout, stderr = await self.proc.communicate()
-            self._stdout = stdout.decode()
-            self._stderr = stderr.decode()
-            self.retrieved_stdout_stderr = True
+        return str(self._stderr)
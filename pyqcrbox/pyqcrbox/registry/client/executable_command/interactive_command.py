@@ -15,6 +15,7 @@ class InteractiveCommand(BaseCommand):
         self.prepare_cmd_spec = cmd_spec.interactive_lifecycle.prepare
         self.run_cmd_spec = cmd_spec.interactive_lifecycle.run
         self.finalise_cmd_spec = cmd_spec.interactive_lifecycle.finalise
+        self.calc: InteractiveCmdCalculation | None = None
 
     async def execute_in_background(
         self,
@@ -47,13 +48,15 @@ class InteractiveCommand(BaseCommand):
         else:
             finalise_calc = None
 
-        return InteractiveCmdCalculation(
+        self.calc = InteractiveCmdCalculation(
             calculation_id=_calculation_id,
             calc_finished_event=calc_finished_event,
             prepare_calc=prepare_calc,
             run_calc=run_calc,
             finalise_calc=finalise_calc,
         )
+        return self.calc
 
-    def terminate(self):
-        raise NotImplementedError("TODO: implement terminate() for interactive commands")
+    async def terminate(self):
+        if self.calc is not None:
+            await self.calc.terminate()
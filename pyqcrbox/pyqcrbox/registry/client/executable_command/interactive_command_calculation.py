@@ -22,8 +22,14 @@ class InteractiveCmdCalculation(BaseCalculation):
 
     @property
     def status(self) -> CalculationStatusEnum:
+        if self.is_cancelled:
+            return CalculationStatusEnum.CANCELLED
         return CalculationStatusEnum.RUNNING
 
+    @property
+    def _sub_calculations(self) -> list[BaseCalculation]:
+        return [calc for calc in (self.prepare_calc, self.run_calc, self.finalise_calc) if calc is not None]
+
     @property
     async def stdout(self) -> None:
         return None
@@ -43,3 +49,7 @@ class InteractiveCmdCalculation(BaseCalculation):
         if self.finalise_calc:
             logger.debug("Running the 'finalise' command")
             await self.finalise_calc.wait_until_finished()
+
+    async def terminate(self):
+        for calc in self._sub_calculations:
+            await calc.terminate()
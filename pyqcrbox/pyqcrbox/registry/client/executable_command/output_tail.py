@@ -0,0 +1,43 @@
+# SPDX-License-Identifier: MPL-2.0
+import asyncio
+
+__all__ = ["OutputTail"]
+
+
+class OutputTail:
+    """
+    Keeps the most recent output of a stream, up to `max_size` bytes.
+
+    Older output is discarded once the limit is reached, so that the memory
+    used by a calculation stays bounded no matter how chatty the program is.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.num_bytes_total = 0
+        self._buffer = bytearray()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {len(self._buffer)}/{self.num_bytes_total} bytes>"
+
+    def __str__(self):
+        # The beginning of the buffer may be in the middle of a multibyte character after truncation
+        return self._buffer.decode(errors="replace")
+
+    @property
+    def is_truncated(self) -> bool:
+        return self.num_bytes_total > len(self._buffer)
+
+    def append(self, data: bytes) -> None:
+        self.num_bytes_total += len(data)
+        self._buffer += data
+        excess = len(self._buffer) - self.max_size
+        if excess > 0:
+            del self._buffer[:excess]
+
+    async def read_from(self, stream: asyncio.StreamReader, chunk_size: int = 64 * 1024) -> None:
+        """
+        Consume the given stream until it is closed.
+        """
+        while data := await stream.read(chunk_size):
+            self.append(data)
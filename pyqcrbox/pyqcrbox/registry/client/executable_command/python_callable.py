@@ -3,6 +3,7 @@ import importlib
 import inspect
 import multiprocessing.pool
 import multiprocessing.process
+import signal
 import traceback
 from typing import Union
 
@@ -22,6 +23,13 @@ class CalculationNotRunning(Exception):
     pass
 
 
+def _reset_signal_handlers():
+    # Worker processes are forked from the client and would otherwise inherit the signal
+    # handlers installed by the ASGI server, which prevents them from being terminated.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
 class PythonCallable(BaseCommand):
     def __init__(self, cmd_spec: PythonCallableSpec):
         assert cmd_spec.implemented_as == "python_callable"
@@ -82,7 +90,7 @@ class PythonCallable(BaseCommand):
             calc_finished_event.set()
             calc_finished_event = None
 
-        self.pool = multiprocessing.pool.Pool(_num_processes)
+        self.pool = multiprocessing.pool.Pool(_num_processes, initializer=_reset_signal_handlers)
         if _cwd:
             logger.warning(
                 f"TODO: Change into working directory before executing "
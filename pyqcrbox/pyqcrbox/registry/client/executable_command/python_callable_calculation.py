@@ -35,6 +35,9 @@ class PythonCallableCalculation(BaseCalculation):
 
     @property
     def status(self) -> CalculationStatusEnum:
+        if self.is_cancelled:
+            return CalculationStatusEnum.CANCELLED
+
         if self._apply_result.ready():
             if self._apply_result.successful():
                 self.return_value = self._apply_result.get()
@@ -64,7 +67,14 @@ class PythonCallableCalculation(BaseCalculation):
             return "Retrieval of STDERR not implemented yet for PythonCallableCalculation"
 
     async def terminate(self):
+        if self._apply_result.ready():
+            logger.debug(f"Calculation {self.calculation_id!r} has already finished - nothing to terminate.")
+            return
+
         logger.debug("Terminating multiprocessing pool (any running workers will be stopped immediately).")
-        self.pool.terminate()
-        self.pool.join()
-        logger.trace("Multiprocessing pool terminated.")
+        await anyio.to_thread.run_sync(self.pool.terminate)
+        await anyio.to_thread.run_sync(self.pool.join)
+        logger.debug("Multiprocessing pool terminated.")
+
+        # The pool's callbacks are never invoked for a terminated task, so we need to signal this ourselves.
+        self.calc_finished_event.set()
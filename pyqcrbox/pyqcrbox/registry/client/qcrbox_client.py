@@ -1,13 +1,17 @@
+import functools
 import os
 import sys
 from pathlib import Path
 from typing import Optional
 
+import anyio
+import nats.errors
 from faststream.nats import NatsBroker
 from litestar import Litestar
 
-from pyqcrbox import helpers, logger, msg_specs, settings, sql_models
+from pyqcrbox import logger, msg_specs, settings, sql_models
 from pyqcrbox.cli.helpers import get_repo_root
+from pyqcrbox.data_management import QCrBoxDataFileManager
 from pyqcrbox.helpers import generate_private_routing_key
 from pyqcrbox.registry.client.executable_command.base_calculation import BaseCalculation
 from pyqcrbox.registry.shared.calculation_status import update_calculation_status_in_nats_kv_NEW
@@ -16,7 +20,8 @@ from pyqcrbox.sql_models import CalculationStatusDetails, CalculationStatusEnum
 from ..shared import QCrBoxServerClientBase, TestQCrBoxServerClientBase, on_qcrbox_startup
 from .api_endpoints import create_client_asgi_server
 from .client_status import ClientStatus, ClientStatusEnum
-from .executable_command import BaseCommand, ExecutableCommand
+from .data_file_staging import DataFileStaging
+from .executable_command import ExecutableCommand
 
 # from .message_processing.command_invocation_request import handle_command_invocation_request_via_nats
 
@@ -33,19 +38,33 @@ class QCrBoxClient(QCrBoxServerClientBase):
         # broker: Optional[RabbitBroker] = None,
         nats_broker: Optional[NatsBroker] = None,
         asgi_server: Optional[Litestar] = None,
+        max_concurrent_calculations: Optional[int] = None,
     ):
         super().__init__(nats_broker=nats_broker, asgi_server=asgi_server)
         self.application_spec = application_spec
         self.client_id = client_id
         self.private_routing_key = private_routing_key or generate_private_routing_key()
         # self.routing_key_command_invocation = application_spec.routing_key_command_invocation
-        self._calculations: list[BaseCommand] = []
-        self.status = ClientStatus(ClientStatusEnum.IDLE)
+        self._pending_cancellations: set[str] = set()
+        self.status = ClientStatus(
+            max_concurrent_calculations=(
+                max_concurrent_calculations or settings.registry.client.max_concurrent_calculations
+            ),
+            max_concurrent_calculations_per_command={
+                cmd.name: cmd.max_concurrent_calculations
+                for cmd in application_spec.commands
+                if cmd.max_concurrent_calculations is not None
+            },
+        )
 
     @property
     def working_dir(self) -> Path:
         return self.application_spec.yaml_file_dir or Path.cwd()
 
+    @functools.cached_property
+    def data_file_manager(self) -> QCrBoxDataFileManager:
+        return QCrBoxDataFileManager.with_disk_cache_from_settings()
+
     # def _set_up_rabbitmq_broker(self) -> None:
     #     self.set_up_message_dispatcher(
     #         queue_name=self.private_routing_key,
@@ -60,14 +79,8 @@ class QCrBoxClient(QCrBoxServerClientBase):
     def _set_up_nats_broker(self) -> None:
         logger.warning("TODO: set up NATS broker for client")
 
-        slug_sanitized = helpers.sanitize_for_nats_subject(self.application_spec.slug)
-        version_sanitized = helpers.sanitize_for_nats_subject(self.application_spec.version)
-
-        self.nats_broker.subscriber(f"client.cmd.handle_invocation_request.{slug_sanitized}.{version_sanitized}")(
-            self.handle_command_invocation_request_from_server
-        )
-        self.nats_broker.subscriber(f"{self.private_inbox}.cmd.execute")(self.handle_command_execution)
         self.nats_broker.subscriber(f"{self.private_inbox}.calc.status")(self.get_calculation_status)
+        self.nats_broker.subscriber(f"{self.private_inbox}.calc.cancel")(self.cancel_calculation)
 
         # # Subscriber for command invocation requests
         # subject = f"cmd-invocation.request.{self.application_spec.nats_subject}"
@@ -95,80 +108,271 @@ class QCrBoxClient(QCrBoxServerClientBase):
         #     )
         #     logger.debug(f"Received response from server: {server_response}")
 
-    async def handle_command_invocation_request_from_server(self, msg: msg_specs.CommandInvocationRequestNATS):
-        # logger.info(f"Received command invocation request: {msg!r} (current client status: {self.status})")
-        logger.info(f"Received command invocation request: {msg!r} (current client status: TODO)")
-
-        response_msg = msg_specs.CommandInvocationClientResponseNATS(
-            application_slug=msg.application_slug,
-            application_version=msg.application_version,
+    @on_qcrbox_startup
+    async def start_requesting_work(self):
+        self.start_background_task(self.request_work_while_running)
+
+    async def request_work_while_running(self):
+        """
+        Ask the server for pending calculations whenever this client has free slots.
+
+        Each request states how many slots are free, and the server replies with a batch
+        of up to that many jobs taken from the work queue for this application. The jobs
+        are only executed once the server has confirmed that they are still assigned to
+        this client (jobs which aren't acknowledged in time are handed out again).
+        """
+        retry_delay = settings.nats.work_queue_poll_interval
+        while True:
+            await self.status.wait_for_free_slot()
+            try:
+                jobs = self._reserve_slots(await self.request_work_from_server())
+                if jobs:
+                    jobs = await self._acknowledge_reserved_work(jobs)
+            except (TimeoutError, nats.errors.Error) as exc:
+                # The server may be restarting or temporarily unreachable, so keep trying (less and less often)
+                logger.warning(f"Requesting work from server failed: {exc!r} (retrying in {retry_delay:.1f}s)")
+                await anyio.sleep(retry_delay)
+                retry_delay = min(2 * retry_delay, settings.nats.work_request_max_retry_delay)
+                continue
+
+            retry_delay = settings.nats.work_queue_poll_interval
+            if not jobs:
+                await anyio.sleep(settings.nats.work_queue_poll_interval)
+                continue
+
+            for msg in jobs:
+                self.start_background_task(self.handle_command_execution, msg)
+
+    def _reserve_slots(
+        self, jobs: list[msg_specs.CommandExecutionRequestNATS]
+    ) -> list[msg_specs.CommandExecutionRequestNATS]:
+        """
+        Mark the given jobs as pending and return those for which this client has a slot.
+
+        Jobs without a slot are skipped (and not acknowledged), so that the server hands them out again.
+        """
+        reserved_jobs = []
+        for job in jobs:
+            try:
+                self.status.set_pending(job.calculation_id, job.command_name)
+            except RuntimeError as exc:
+                logger.warning(f"Skipping job for calculation {job.calculation_id!r}: {exc}")
+                continue
+            reserved_jobs.append(job)
+        return reserved_jobs
+
+    async def _acknowledge_reserved_work(
+        self, jobs: list[msg_specs.CommandExecutionRequestNATS]
+    ) -> list[msg_specs.CommandExecutionRequestNATS]:
+        """
+        Acknowledge the given jobs (whose slots are already reserved) and release the slots of those not confirmed.
+        """
+        confirmed_jobs = []
+        try:
+            confirmed_jobs = await self.acknowledge_work(jobs)
+        finally:
+            confirmed_ids = {job.calculation_id for job in confirmed_jobs}
+            for job in jobs:
+                if job.calculation_id not in confirmed_ids:
+                    self.status.set_idle(job.calculation_id)
+        return confirmed_jobs
+
+    async def request_work_from_server(self) -> list[msg_specs.CommandExecutionRequestNATS]:
+        msg = msg_specs.RequestWorkNATS(
+            application_slug=self.application_spec.slug,
+            application_version=self.application_spec.version,
             client_id=self.client_id,
-            client_is_available=self.status.is_available,
-            calculation_id=msg.calculation_id,
             private_inbox_prefix=self.private_inbox,
+            num_free_slots=self.status.num_free_slots,
+            num_free_slots_per_command=self.status.num_free_slots_per_command,
         )
-
-        if self.status.is_available:
-            self.status.set_pending()
-
-        return response_msg
-
-    async def handle_discard_command_invocation(self, msg: msg_specs.DiscardCommandInvocationNATS):
-        logger.info(f"Received request to discard command invocation: {msg!r} (current status: {self.status})")
-        self.status.set_idle()
+        response = await self.nats_broker.publish(
+            msg,
+            "server.cmd.request_work",
+            rpc=True,
+            rpc_timeout=settings.nats.work_queue_fetch_timeout + settings.nats.rpc_timeout,
+            raise_timeout=True,
+        )
+        return msg_specs.RequestWorkResponseNATS(**response).jobs
+
+    async def acknowledge_work(
+        self, jobs: list[msg_specs.CommandExecutionRequestNATS]
+    ) -> list[msg_specs.CommandExecutionRequestNATS]:
+        """
+        Confirm receipt of the given jobs to the server and return those which are still assigned to this client.
+        """
+        msg = msg_specs.AcknowledgeWorkNATS(
+            client_id=self.client_id,
+            private_inbox_prefix=self.private_inbox,
+            calculation_ids=[job.calculation_id for job in jobs],
+        )
+        response = await self.nats_broker.publish(
+            msg, "server.cmd.acknowledge_work", rpc=True, rpc_timeout=settings.nats.rpc_timeout, raise_timeout=True
+        )
+        calculation_ids = set(msg_specs.AcknowledgeWorkResponseNATS(**response).calculation_ids)
+        if len(calculation_ids) < len(jobs):
+            logger.warning(f"Discarding {len(jobs) - len(calculation_ids)} job(s) no longer assigned to this client")
+        return [job for job in jobs if job.calculation_id in calculation_ids]
 
     async def handle_command_execution(self, msg: msg_specs.CommandExecutionRequestNATS):
         logger.info(f"Received command execution request: {msg!r} (current status: {self.status})")
-        self.status.set_busy()
+        self.status.set_busy(msg.calculation_id)
+        staging = None
+        calc = None
 
+        # Whatever goes wrong, the calculation must end up with a final status and release its slot
         try:
             cmd = self.get_executable_command(msg.command_name)
-            logger.debug(f"Executing command in working dir cwd={self.working_dir!r}")
-            calc = await cmd.execute_in_background(**msg.arguments, _calculation_id=msg.calculation_id, _cwd=self.working_dir)
+            staging = DataFileStaging(
+                cmd.cmd_spec,
+                msg.arguments,
+                calculation_id=msg.calculation_id,
+                data_file_manager=self.data_file_manager,
+            )
+            arguments = await staging.stage_inputs()
+            # Calculations with staged data files run in their scratch directory, so that any files they
+            # create next to their inputs (or at relative paths) don't collide with those of other calculations
+            cwd = staging.scratch_dir if staging.is_needed else self.working_dir
+            logger.debug(f"Executing command in working dir {cwd=!r}")
+            calc = await cmd.execute_in_background(**arguments, _calculation_id=msg.calculation_id, _cwd=cwd)
             if not isinstance(calc, BaseCalculation):
+                calc = None
                 raise RuntimeError("Command execution did not return a calculation object.")
+            await self._run_calculation(msg.calculation_id, calc, staging)
         except Exception as exc:
             error_msg = f"Command execution failed: {exc!r}"
             logger.error(error_msg)
-            # await update_calculation_status_in_nats_kv(msg.calculation_id, CalculationStatusEnum.FAILED)
-            status_details = CalculationStatusDetails(
-                calculation_id=msg.calculation_id,
-                status=CalculationStatusEnum.FAILED,
-                stdout=None,
-                stderr=None,
-                extra_info={"error_msg": error_msg},
-            )
-            await update_calculation_status_in_nats_kv_NEW(status_details)
-            self.status.set_idle()
-            return
-
-        # logger.debug(f"Storing calculation details: {calc!r}")
-        self.calculations[msg.calculation_id] = calc
-        # logger.debug(f"Storing KV value for {msg.calculation_id=}")
+            if calc is not None:
+                await calc.terminate()
+            await self._publish_failed_status(msg.calculation_id, error_msg)
+        finally:
+            if staging is not None:
+                staging.cleanup()
+            self.calculations.pop(msg.calculation_id, None)
+            self._pending_cancellations.discard(msg.calculation_id)
+            self.status.set_idle(msg.calculation_id)
+
+    async def _run_calculation(self, calculation_id: str, calc: BaseCalculation, staging: DataFileStaging):
+        """
+        Follow a launched calculation until it has finished, then upload its outputs and publish its final status.
+        """
+        self.calculations[calculation_id] = calc
+        if calculation_id in self._pending_cancellations:
+            # The cancellation request arrived while the calculation was being started
+            await calc.cancel()
         await update_calculation_status_in_nats_kv_NEW(await calc.get_status_details())
 
-        await calc.wait_until_finished()
-        await update_calculation_status_in_nats_kv_NEW(await calc.get_status_details())
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(self.publish_status_updates_while_running, calc)
+            await calc.wait_until_finished()
+            tg.cancel_scope.cancel()
+
+        status_details = await calc.get_status_details()
+        if staging.is_needed:
+            await self.upload_output_data_files(staging, status_details)
+        await update_calculation_status_in_nats_kv_NEW(status_details)
+
+    async def _publish_failed_status(self, calculation_id: str, error_msg: str):
+        status_details = CalculationStatusDetails(
+            calculation_id=calculation_id,
+            status=CalculationStatusEnum.FAILED,
+            stdout=None,
+            stderr=None,
+            extra_info={"error_msg": error_msg},
+        )
+        try:
+            await update_calculation_status_in_nats_kv_NEW(status_details)
+        except Exception as exc:
+            logger.error(f"Could not publish final status of calculation {calculation_id!r}: {exc!r}")
+
+    async def upload_output_data_files(self, staging: DataFileStaging, status_details: CalculationStatusDetails):
+        """
+        Upload the output files of a successful calculation with staged data files, have the server
+        add data files for them and record their data file ids in the calculation's final status details.
+        """
+        if status_details.status != CalculationStatusEnum.SUCCESSFUL:
+            return
 
-        self.status.set_idle()
+        try:
+            output_contents = await staging.upload_outputs()
+            qcrbox_file_ids = await self.register_data_files(list(output_contents.values()))
+            status_details.extra_info["output_data_files"] = dict(zip(output_contents, qcrbox_file_ids))
+        except Exception as exc:
+            error_msg = f"Uploading output files failed: {exc!r}"
+            logger.error(error_msg)
+            status_details.status = CalculationStatusEnum.FAILED
+            status_details.extra_info["error_msg"] = error_msg
+
+    async def register_data_files(self, files: list[msg_specs.DataFileContentsNATS]) -> list[str]:
+        """
+        Ask the server to add data files for contents uploaded by this client and return their ids.
+        """
+        if not files:
+            return []
+        msg = msg_specs.RegisterDataFilesNATS(files=files)
+        response = await self.nats_broker.publish(
+            msg, "server.data_files.register", rpc=True, rpc_timeout=settings.nats.rpc_timeout, raise_timeout=True
+        )
+        return msg_specs.RegisterDataFilesResponseNATS(**response).qcrbox_file_ids
+
+    async def publish_status_updates_while_running(self, calc: BaseCalculation):
+        """
+        Periodically publish the status of a running calculation (including the tail
+        of its output, if any), so that users can follow its progress.
+        """
+        last_status_details = None
+        while True:
+            await anyio.sleep(settings.registry.client.status_update_interval)
+            status_details = await calc.get_status_details()
+            if status_details != last_status_details:
+                await update_calculation_status_in_nats_kv_NEW(status_details)
+                last_status_details = status_details
 
     async def get_calculation_status(
         self, msg: msg_specs.GetCalculationStatusNATS
     ) -> msg_specs.CalculationStatusResponseNATS:
         logger.debug(f"Current contents of self.calculations: {self.calculations.items()!r}")
         logger.debug(f"Retrieving calculation details for calculation_id={msg.calculation_id!r}")
-        status = self.calculations[msg.calculation_id].status
+        try:
+            status = self.calculations[msg.calculation_id].status
+        except KeyError:
+            # The calculation has already finished (its final status is in the NATS KV store) or never ran here
+            status = CalculationStatusEnum.UNKNOWN
         logger.debug(f"Current calculation status: {status!r}")
         response = msg_specs.CalculationStatusResponseNATS(calculation_id=msg.calculation_id, status=status)
         return response
 
+    async def cancel_calculation(self, msg: msg_specs.CancelCalculationNATS) -> msg_specs.QCrBoxGenericResponse:
+        logger.info(f"Received cancellation request for calculation {msg.calculation_id!r}")
+        response_to = "calc.cancel"
+
+        try:
+            calc = self.calculations[msg.calculation_id]
+        except KeyError:
+            if self.status.get_calculation_status(msg.calculation_id) == ClientStatusEnum.IDLE:
+                return msg_specs.responses.error(
+                    response_to=response_to, msg=f"Calculation is not running on this client: {msg.calculation_id!r}"
+                )
+            # The calculation occupies a slot but has not been started yet, so cancel it as soon as it is
+            self._pending_cancellations.add(msg.calculation_id)
+            return msg_specs.responses.ok(response_to=response_to, msg="Cancellation requested")
+
+        if calc.status != CalculationStatusEnum.RUNNING:
+            return msg_specs.responses.error(
+                response_to=response_to, msg=f"Calculation has already finished (status: {calc.status})"
+            )
+
+        # This terminates any processes belonging to the calculation, so that handle_command_execution()
+        # can publish the final status and release the slot.
+        await calc.cancel()
+        return msg_specs.responses.ok(response_to=response_to, msg="Calculation cancelled")
+
     def _set_up_asgi_server(self) -> None:
         self.asgi_server = create_client_asgi_server(self.lifespan_context)
 
     async def _run_custom_shutdown_tasks(self):
         logger.debug("Terminating running calculations...")
-        logger.warning("TODO: actually terminate any running calculations...")
-        for calc in self._calculations:
+        for calc in list(self.calculations.values()):
             await calc.terminate()
 
     def get_executable_command(self, command_name):
@@ -213,7 +417,7 @@ class QCrBoxClient(QCrBoxServerClientBase):
                 msg, "register-application", rpc=True, rpc_timeout=settings.nats.rpc_timeout, raise_timeout=True
             )
             logger.debug(f"Received response to registration request: {resp=}")
-        except TimeoutError:
+        except (TimeoutError, nats.errors.NoRespondersError):
             logger.error("Application registration failed (no response from server)")
             self.shutdown()
 
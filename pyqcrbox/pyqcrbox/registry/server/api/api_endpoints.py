@@ -1,20 +1,35 @@
+from datetime import datetime
 from typing import Annotated, Any
 
+import pydantic
 import sqlalchemy.exc
-from litestar import MediaType, Request, Response, Router, get, post
+from litestar import MediaType, Request, Response, Router, WebSocket, delete, get, post, put, websocket
 
 __all__ = ["api_router"]
 
 from litestar.datastructures import UploadFile
 from litestar.enums import RequestEncodingType
-from litestar.exceptions import ClientException
-from litestar.params import Body
-
-from pyqcrbox import logger, msg_specs, sql_models
+from litestar.exceptions import ClientException, WebSocketDisconnect
+from litestar.params import Body, Parameter
+from litestar.response import ServerSentEvent, ServerSentEventMessage, Stream
+
+from pyqcrbox import logger, msg_specs, settings, sql_models
+from pyqcrbox.data_management.compression import ContentEncoding, parse_accept_encoding
+from pyqcrbox.data_management.data_file import (
+    QCrBoxDataFileImportByHash,
+    QCrBoxDataFileQuery,
+    QCrBoxDatasetCreate,
+    QCrBoxUploadSessionCreate,
+)
+from pyqcrbox.data_management.data_file_manager import MAX_UPLOAD_PART_NUMBER
 from pyqcrbox.services import get_data_file_manager
 
 from . import api_helpers
 
+# Maximum number of entries returned by a single request to the listing endpoints (unless no `limit`
+# is given to the ones listing applications, commands or calculations, which then return all entries)
+MAX_PAGE_SIZE = 1000
+
 
 @get("/", media_type=MediaType.JSON, include_in_schema=False)
 async def api_root_handler() -> dict[str, Any]:
@@ -26,31 +41,84 @@ async def health_check() -> dict:
     return {"status": "ok"}
 
 
+def _list_response(items: list, next_cursor: str | None) -> Response[list]:
+    # The cursor pointing to the next page (if any) is sent in a header, so the response body stays a plain list
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    return Response(items, headers=headers)
+
+
 @get(path="/applications", media_type=MediaType.JSON)
 async def retrieve_applications(
-    # slug: str | None = None, version: str | None = None
-) -> list[sql_models.ApplicationSpecWithCommands]:
-    return api_helpers._retrieve_applications()
+    slug: str | None = None,
+    version: str | None = None,
+    limit: Annotated[int | None, Parameter(ge=1, le=MAX_PAGE_SIZE)] = None,
+    cursor: str | None = None,
+) -> Response[list[sql_models.ApplicationSpecWithCommands]]:
+    try:
+        applications, next_cursor = await api_helpers._retrieve_applications(
+            slug=slug, version=version, limit=limit, cursor=cursor
+        )
+    except api_helpers.InvalidCursorError:
+        raise ClientException(detail=f"Invalid cursor: {cursor!r}") from None
+    return _list_response(applications, next_cursor)
 
 
 @get(path="/commands", media_type=MediaType.JSON)
 async def retrieve_commands(
-    # name: str | None, application_slug: str | None, application_version: str | None
-) -> list[sql_models.CommandSpecWithParameters]:
-    return api_helpers._retrieve_commands()
+    name: str | None = None,
+    application_slug: str | None = None,
+    application_version: str | None = None,
+    limit: Annotated[int | None, Parameter(ge=1, le=MAX_PAGE_SIZE)] = None,
+    cursor: str | None = None,
+) -> Response[list[sql_models.CommandSpecWithParameters]]:
+    try:
+        commands, next_cursor = await api_helpers._retrieve_commands(
+            name=name,
+            application_slug=application_slug,
+            application_version=application_version,
+            limit=limit,
+            cursor=cursor,
+        )
+    except api_helpers.InvalidCursorError:
+        raise ClientException(detail=f"Invalid cursor: {cursor!r}") from None
+    return _list_response(commands, next_cursor)
 
 
 @get(path="/commands/{cmd_id:int}", media_type=MediaType.JSON)
 async def retrieve_command_by_id(cmd_id: int) -> sql_models.CommandSpecWithParameters | Response[dict]:
     try:
-        return api_helpers._retrieve_command_by_id(cmd_id)
+        return await api_helpers._retrieve_command_by_id(cmd_id)
     except sqlalchemy.exc.NoResultFound:
         return Response({"status": "error", "msg": f"Command not found: id={cmd_id!r}"}, status_code=404)
 
 
 @get(path="/calculations", media_type=MediaType.JSON)
-async def get_calculation_info() -> list[sql_models.CalculationResponseModel]:
-    return api_helpers._get_calculation_info()
+async def get_calculation_info(
+    status: sql_models.CalculationStatusEnum | None = None,
+    application_slug: str | None = None,
+    application_version: str | None = None,
+    command_name: str | None = None,
+    user: str | None = None,
+    submitted_after: datetime | None = None,
+    submitted_before: datetime | None = None,
+    limit: Annotated[int | None, Parameter(ge=1, le=MAX_PAGE_SIZE)] = None,
+    cursor: str | None = None,
+) -> Response[list[sql_models.CalculationResponseModel]]:
+    try:
+        calculations, next_cursor = await api_helpers._get_calculation_info(
+            status=status,
+            application_slug=application_slug,
+            application_version=application_version,
+            command_name=command_name,
+            user=user,
+            submitted_after=submitted_after,
+            submitted_before=submitted_before,
+            limit=limit,
+            cursor=cursor,
+        )
+    except api_helpers.InvalidCursorError:
+        raise ClientException(detail=f"Invalid cursor: {cursor!r}") from None
+    return _list_response(calculations, next_cursor)
 
 
 @get(path="/calculations/{calculation_id:str}", media_type=MediaType.JSON, name="get_calculation_details")
@@ -61,7 +129,65 @@ async def get_calculation_info_by_calculation_id(calculation_id: str) -> dict |
         return Response({"status": "error", "msg": f"Calculation not found: {calculation_id!r}"}, status_code=404)
 
 
-@post(path="/data_files/upload", media_type=MediaType.TEXT)
+@get(path="/calculations/{calculation_id:str}/events", media_type=MediaType.JSON)
+async def stream_calculation_status_events(calculation_id: str) -> ServerSentEvent | Response[dict]:
+    # Check that the calculation exists upfront, so that we can respond with a proper error
+    try:
+        await api_helpers._get_calculation_info_by_calculation_id(calculation_id)
+    except api_helpers.CalculationNotFoundError:
+        return Response({"status": "error", "msg": f"Calculation not found: {calculation_id!r}"}, status_code=404)
+
+    async def status_events():
+        async for status_details in api_helpers._watch_calculation_status(calculation_id):
+            yield ServerSentEventMessage(event="status", data=status_details.model_dump_json())
+
+    return ServerSentEvent(status_events())
+
+
+@websocket(path="/calculations/{calculation_id:str}/ws")
+async def stream_calculation_status_websocket(socket: WebSocket, calculation_id: str) -> None:
+    await socket.accept()
+    try:
+        async for status_details in api_helpers._watch_calculation_status(calculation_id):
+            await socket.send_json(status_details.model_dump(mode="json"))
+    except api_helpers.CalculationNotFoundError:
+        await socket.send_json({"status": "error", "msg": f"Calculation not found: {calculation_id!r}"})
+    except WebSocketDisconnect:
+        return
+    await socket.close()
+
+
+@delete(path="/calculations/{calculation_id:str}", media_type=MediaType.JSON, status_code=200)
+async def cancel_calculation(calculation_id: str) -> dict | Response[dict]:
+    try:
+        return await api_helpers._cancel_calculation(calculation_id)
+    except api_helpers.CalculationNotFoundError:
+        return Response({"status": "error", "msg": f"Calculation not found: {calculation_id!r}"}, status_code=404)
+
+
+@get(path="/scheduler/queues", media_type=MediaType.JSON)
+async def get_scheduler_queues() -> dict:
+    return await api_helpers._get_scheduler_stats()
+
+
+@post(path="/garbage_collection", media_type=MediaType.JSON, status_code=200)
+async def run_garbage_collection(dry_run: bool = True) -> dict | Response[dict]:
+    # This is a dry run unless explicitly requested otherwise, so that it's safe to find out what would be deleted
+    try:
+        return await api_helpers._run_garbage_collection(dry_run)
+    except TimeoutError:
+        timeout = settings.registry.server.garbage_collection.request_timeout
+        return Response(
+            {"status": "error", "msg": f"Garbage collection did not finish within {timeout} s (it continues running)"},
+            status_code=504,
+        )
+
+
+@post(
+    path="/data_files/upload",
+    media_type=MediaType.JSON,
+    request_max_body_size=settings.registry.server.max_data_file_upload_size,
+)
 async def handle_data_file_upload(
     data: Annotated[UploadFile, Body(media_type=RequestEncodingType.MULTI_PART)],
 ) -> Response:
@@ -76,14 +202,183 @@ async def handle_data_file_upload(
     )
 
 
+@post(path="/data_files/import_by_hash", media_type=MediaType.JSON)
+async def handle_data_file_import_by_hash(data: QCrBoxDataFileImportByHash) -> Response:
+    try:
+        qcrbox_data_file_id = await api_helpers._import_data_file_by_hash(data)
+    except api_helpers.DataFileNotFoundError:
+        return Response(
+            {"status": "error", "msg": f"No data file with the given contents exists: sha256={data.sha256!r}"},
+            status_code=404,
+        )
+    return Response(
+        {
+            "status": "success",
+            "msg": f"Imported data file: {data.filename!r}",
+            "payload": {"qcrbox_id": qcrbox_data_file_id},
+        },
+        status_code=200,
+    )
+
+
+@post(path="/data_files/uploads", media_type=MediaType.JSON)
+async def create_upload_session(data: QCrBoxUploadSessionCreate, request: Request) -> Response:
+    """
+    Start uploading a (large) data file in parts.
+
+    The parts are uploaded (concurrently, if desired) via `PUT /data_files/uploads/{upload_id}/parts/{part_number}`,
+    with part numbers starting at 1, and assembled into a data file via `POST /data_files/uploads/{upload_id}/complete`.
+    A part which failed to upload can simply be uploaded again.
+    """
+    upload_session = await api_helpers._create_upload_session(data)
+    return Response(
+        {
+            "status": "success",
+            "msg": f"Started upload of data file: {data.filename!r}",
+            "payload": {
+                "upload_id": upload_session.upload_id,
+                "part_size": settings.registry.server.upload_part_size,
+                "max_part_size": settings.registry.server.max_upload_part_size,
+                "max_part_number": MAX_UPLOAD_PART_NUMBER,
+                "href": request.url_for("get_upload_session", upload_id=upload_session.upload_id),
+            },
+        },
+        status_code=200,
+    )
+
+
+@get(path="/data_files/uploads/{upload_id:str}", media_type=MediaType.JSON, name="get_upload_session")
+async def get_upload_session(upload_id: str) -> dict | Response[dict]:
+    # This lists the parts received so far, so that an interrupted upload can be resumed
+    try:
+        upload_session = await api_helpers._get_upload_session(upload_id)
+    except api_helpers.UploadSessionNotFoundError:
+        return Response({"status": "error", "msg": f"Upload not found: {upload_id!r}"}, status_code=404)
+    return upload_session.model_dump()
+
+
+@put(
+    path="/data_files/uploads/{upload_id:str}/parts/{part_number:int}",
+    media_type=MediaType.JSON,
+    request_max_body_size=settings.registry.server.max_upload_part_size,
+    # Logging the request would read the whole body into memory (the part is streamed into the object store instead)
+    skip_logging=True,
+)
+async def upload_part(upload_id: str, part_number: int, request: Request) -> dict | Response[dict]:
+    # The part is streamed into the object store as it arrives; if the client sends the SHA-256
+    # digest of the part in the `X-Content-SHA256` header, the part is only stored if it matches.
+    try:
+        upload_part = await api_helpers._upload_part(
+            upload_id, part_number, request.stream(), sha256=request.headers.get("x-content-sha256")
+        )
+    except api_helpers.UploadSessionNotFoundError:
+        return Response({"status": "error", "msg": f"Upload not found: {upload_id!r}"}, status_code=404)
+    except api_helpers.InvalidUploadError as exc:
+        return Response({"status": "error", "msg": str(exc)}, status_code=400)
+    return upload_part.model_dump()
+
+
+@post(path="/data_files/uploads/{upload_id:str}/complete", media_type=MediaType.JSON)
+async def complete_upload_session(upload_id: str) -> Response:
+    try:
+        qcrbox_data_file_id = await api_helpers._complete_upload_session(upload_id)
+    except api_helpers.UploadSessionNotFoundError:
+        return Response({"status": "error", "msg": f"Upload not found: {upload_id!r}"}, status_code=404)
+    except api_helpers.InvalidUploadError as exc:
+        return Response({"status": "error", "msg": str(exc)}, status_code=400)
+    return Response(
+        {
+            "status": "success",
+            "msg": f"Completed upload: {upload_id!r}",
+            "payload": {"qcrbox_id": qcrbox_data_file_id},
+        },
+        status_code=200,
+    )
+
+
+@delete(path="/data_files/uploads/{upload_id:str}", media_type=MediaType.JSON, status_code=200)
+async def abort_upload_session(upload_id: str) -> dict:
+    await api_helpers._abort_upload_session(upload_id)
+    return {"status": "success", "msg": f"Aborted upload: {upload_id!r}"}
+
+
 @get(path="/data_files", media_type=MediaType.JSON)
-async def get_data_files() -> list[dict]:
-    return await api_helpers._get_data_files()
+async def get_data_files(
+    filename: str | None = None,
+    filetype: str | None = None,
+    sha256: str | None = None,
+    min_size: int | None = None,
+    max_size: int | None = None,
+    uploaded_after: datetime | None = None,
+    uploaded_before: datetime | None = None,
+    limit: Annotated[int, Parameter(ge=1, le=MAX_PAGE_SIZE)] = 100,
+    offset: Annotated[int, Parameter(ge=0)] = 0,
+) -> list[dict]:
+    try:
+        query = QCrBoxDataFileQuery(
+            filename=filename,
+            filetype=filetype,
+            sha256=sha256,
+            min_size=min_size,
+            max_size=max_size,
+            uploaded_after=uploaded_after,
+            uploaded_before=uploaded_before,
+            limit=limit,
+            offset=offset,
+        )
+    except pydantic.ValidationError as exc:
+        raise ClientException(detail="Invalid data file query", extra=exc.errors(include_url=False)) from None
+    return await api_helpers._get_data_files(query)
+
+
+@get(path="/data_files/{qcrbox_file_id:str}/content", media_type="application/octet-stream")
+async def download_data_file_contents(qcrbox_file_id: str, request: Request) -> Stream | Response[dict]:
+    # Compressed files are sent as stored if the client accepts their encoding
+    accepted_encodings = parse_accept_encoding(request.headers.get("accept-encoding"))
+    try:
+        encoding, contents = await api_helpers._get_data_file_contents(qcrbox_file_id, accepted_encodings)
+    except api_helpers.DataFileNotFoundError:
+        return Response(
+            {"status": "error", "msg": f"Data file not found: {qcrbox_file_id!r}"},
+            media_type=MediaType.JSON,
+            status_code=404,
+        )
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != ContentEncoding.IDENTITY:
+        headers["Content-Encoding"] = encoding.value
+    return Stream(contents, media_type="application/octet-stream", headers=headers)
 
 
 @get(path="/datasets", media_type=MediaType.JSON)
-async def get_datasets() -> list[dict]:
-    return await api_helpers._get_datasets()
+async def get_datasets(
+    limit: Annotated[int, Parameter(ge=1, le=MAX_PAGE_SIZE)] = 100,
+    offset: Annotated[int, Parameter(ge=0)] = 0,
+) -> list[dict]:
+    return await api_helpers._get_datasets(limit=limit, offset=offset)
+
+
+@post(path="/datasets", media_type=MediaType.JSON)
+async def handle_dataset_create(data: QCrBoxDatasetCreate) -> Response:
+    try:
+        dataset_id = await api_helpers._create_dataset(data)
+    except api_helpers.DataFileNotFoundError as exc:
+        return Response({"status": "error", "msg": f"Data file not found: {exc.args[0]!r}"}, status_code=404)
+    return Response(
+        {
+            "status": "success",
+            "msg": f"Created dataset from {len(data.data_file_ids)} data file(s)",
+            "payload": {"dataset_id": dataset_id},
+        },
+        status_code=200,
+    )
+
+
+@get(path="/datasets/{dataset_id:str}", media_type=MediaType.JSON)
+async def get_dataset_info(dataset_id: str) -> dict | Response[dict]:
+    try:
+        return await api_helpers._get_dataset_info(dataset_id)
+    except api_helpers.DatasetNotFoundError:
+        return Response({"status": "error", "msg": f"Dataset not found: {dataset_id!r}"}, status_code=404)
 
 
 async def _get_data_files() -> list[dict]:
@@ -112,6 +407,36 @@ async def commands_invoke(data: sql_models.CommandInvocationCreate, request: Req
     )
 
 
+@post(path="/commands/invoke_batch", media_type=MediaType.JSON)
+async def commands_invoke_batch(data: list[sql_models.CommandInvocationCreate], request: Request) -> dict:
+    logger.info(f"Received batch of {len(data)} command invocations via API")
+
+    response_json = await api_helpers._invoke_command_batch(data)
+    response = msg_specs.QCrBoxGenericResponse(**response_json)
+
+    if response.status == msg_specs.ResponseStatusEnum.ERROR:
+        raise ClientException(detail=response.msg, extra=response.payload.model_dump())
+
+    # Invocations that failed are reported in "errors", so the index of each calculation in the batch is included
+    calculations = [
+        {
+            "index": idx,
+            "calculation_id": calculation_id,
+            "href": request.url_for("get_calculation_details", calculation_id=calculation_id),
+        }
+        for idx, calculation_id in enumerate(response.payload.calculation_ids)
+        if calculation_id is not None
+    ]
+    return dict(
+        msg=f"Accepted {len(calculations)} of {len(data)} command invocation requests",
+        status="ok",
+        payload={
+            "calculations": calculations,
+            "errors": response.payload.errors,
+        },
+    )
+
+
 api_router = Router(
     path="/api",
     route_handlers=[
@@ -121,10 +446,25 @@ api_router = Router(
         retrieve_commands,
         retrieve_command_by_id,
         commands_invoke,
+        commands_invoke_batch,
         get_calculation_info,
         get_calculation_info_by_calculation_id,
+        stream_calculation_status_events,
+        stream_calculation_status_websocket,
+        cancel_calculation,
+        get_scheduler_queues,
+        run_garbage_collection,
         get_data_files,
+        download_data_file_contents,
         get_datasets,
+        get_dataset_info,
+        handle_dataset_create,
         handle_data_file_upload,
+        handle_data_file_import_by_hash,
+        create_upload_session,
+        get_upload_session,
+        upload_part,
+        complete_upload_session,
+        abort_upload_session,
     ],
 )
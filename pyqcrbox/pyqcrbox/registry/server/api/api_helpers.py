@@ -1,5 +1,8 @@
+import base64
+import binascii
 import json
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, AsyncIterator, Callable, Iterable
 
 import nats.js.errors
 import sqlalchemy.exc
@@ -9,13 +12,30 @@ from litestar.datastructures import UploadFile
 from litestar.enums import RequestEncodingType
 from litestar.exceptions import ClientException
 from litestar.params import Body
-from sqlalchemy.orm import joinedload
-from sqlmodel import select
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from sqlmodel import and_, or_, select
 
 from pyqcrbox import QCRBOX_SVCS_REGISTRY, logger, msg_specs, settings, sql_models
+from pyqcrbox.data_management.compression import ContentEncoding
+from pyqcrbox.data_management.data_file import (
+    QCrBoxDataFileImportByHash,
+    QCrBoxDataFileQuery,
+    QCrBoxDatasetCreate,
+    QCrBoxUploadPart,
+    QCrBoxUploadSession,
+    QCrBoxUploadSessionCreate,
+)
 from pyqcrbox.services import get_data_file_manager
 from pyqcrbox.svcs import get_nats_key_value
 
+from ..status_broadcaster import CalculationStatusBroadcaster
+
+FINISHED_CALCULATION_STATUSES = (
+    sql_models.CalculationStatusEnum.SUCCESSFUL,
+    sql_models.CalculationStatusEnum.FAILED,
+    sql_models.CalculationStatusEnum.CANCELLED,
+)
+
 
 class CalculationNotFoundError(Exception):
     pass
@@ -25,56 +45,137 @@ class CommandNotFoundError(Exception):
     pass
 
 
-def _retrieve_applications() -> list[sql_models.ApplicationSpecWithCommands]:
+class DataFileNotFoundError(Exception):
+    pass
+
+
+class DatasetNotFoundError(Exception):
+    pass
+
+
+class UploadSessionNotFoundError(Exception):
+    pass
+
+
+class InvalidUploadError(Exception):
+    pass
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+def _encode_cursor(*values: str | int) -> str:
     """
-    Retrieves list of registered applications from the database.
+    Encodes the sort key of the last entry on a page into an opaque cursor pointing to the next page.
     """
-    model_cls = sql_models.ApplicationSpecDB
-    # filter_clauses = construct_filter_clauses(model_cls, slug=slug, version=version)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_cursor(cursor: str, *value_types: type) -> list[str | int]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise InvalidCursorError(cursor) from None
+    if not isinstance(values, list) or [type(value) for value in values] != list(value_types):
+        raise InvalidCursorError(cursor)
+    return values
+
 
-    with settings.db.get_session() as session:
-        # applications = session.scalars(select(model_cls).where(*filter_clauses)).all()
-        applications = session.scalars(select(model_cls)).all()
+async def _fetch_page(session, stmt, limit: int | None, get_sort_key: Callable) -> tuple[list, str | None]:
+    """
+    Runs a statement that is ordered by a unique sort key, fetching one row more than
+    requested to find out whether there is a next page (and if so, the cursor pointing to it).
+    """
+    if limit is None:
+        return (await session.scalars(stmt)).all(), None
+
+    rows = (await session.scalars(stmt.limit(limit + 1))).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_cursor(*get_sort_key(rows[-1]))
+
+
+async def _retrieve_applications(
+    slug: str | None = None,
+    version: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> tuple[list[sql_models.ApplicationSpecWithCommands], str | None]:
+    """
+    Retrieves list of registered applications from the database, ordered by when they were registered.
+
+    Returns the applications together with the cursor pointing to the next page (or None if there are no more).
+    """
+    model_cls = sql_models.ApplicationSpecDB
+    stmt = select(model_cls).options(selectinload(model_cls.commands)).order_by(model_cls.id)
+    if slug is not None:
+        stmt = stmt.where(model_cls.slug == slug)
+    if version is not None:
+        stmt = stmt.where(model_cls.version == version)
+    if cursor is not None:
+        (last_id,) = _decode_cursor(cursor, int)
+        stmt = stmt.where(model_cls.id > last_id)
+
+    async with settings.db.get_async_session() as session:
+        applications, next_cursor = await _fetch_page(session, stmt, limit, lambda app: (app.id,))
         applications_response_models = [app.to_response_model() for app in applications]
 
-    return applications_response_models
+    return applications_response_models, next_cursor
 
 
-def _retrieve_commands() -> list[sql_models.CommandSpecWithParameters]:
+async def _retrieve_commands(
+    name: str | None = None,
+    application_slug: str | None = None,
+    application_version: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> tuple[list[sql_models.CommandSpecWithParameters], str | None]:
     """
     Retrieves list of commands from the database.
+
+    Returns the commands together with the cursor pointing to the next page (or None if there are no more).
     """
-    # model_cls = sql_models.CommandSpecDB
-    # filter_clauses = [
-    #     (name is None) or (model_cls.name == name),
-    #     (application_slug is None) or (sql_models.ApplicationSpecDB.slug == application_slug),
-    #     (application_version is None) or (sql_models.ApplicationSpecDB.version == application_version),
-    # ]
-    stmt = select(
-        sql_models.CommandSpecDB, sql_models.ApplicationSpecDB.slug, sql_models.ApplicationSpecDB.version
-    ).join(
-        sql_models.CommandSpecDB.application,
+    model_cls = sql_models.CommandSpecDB
+    stmt = (
+        select(model_cls)
+        .join(model_cls.application)
+        .options(contains_eager(model_cls.application))
+        .order_by(model_cls.id)
     )
-
-    with settings.db.get_session() as session:
-        # commands = session.scalars(select(model_cls).where(*filter_clauses)).all()
-        commands = session.scalars(stmt).all()
+    if name is not None:
+        stmt = stmt.where(model_cls.name == name)
+    if application_slug is not None:
+        stmt = stmt.where(sql_models.ApplicationSpecDB.slug == application_slug)
+    if application_version is not None:
+        stmt = stmt.where(sql_models.ApplicationSpecDB.version == application_version)
+    if cursor is not None:
+        (last_id,) = _decode_cursor(cursor, int)
+        stmt = stmt.where(model_cls.id > last_id)
+
+    async with settings.db.get_async_session() as session:
+        commands, next_cursor = await _fetch_page(session, stmt, limit, lambda cmd: (cmd.id,))
         commands = [cmd.to_response_model() for cmd in commands]
 
-    return commands
+    return commands, next_cursor
 
 
-def _retrieve_command_by_id(
+async def _retrieve_command_by_id(
     cmd_id: int, raise_if_not_found: bool = True
 ) -> sql_models.CommandSpecWithParameters | None:
     """
     Retrieves details of a command from the database.
     """
-    query = select(sql_models.CommandSpecDB).where(sql_models.CommandSpecDB.id == cmd_id)
+    query = (
+        select(sql_models.CommandSpecDB)
+        .options(joinedload(sql_models.CommandSpecDB.application))
+        .where(sql_models.CommandSpecDB.id == cmd_id)
+    )
 
-    with settings.db.get_session() as session:
+    async with settings.db.get_async_session() as session:
         try:
-            cmd = session.scalars(query).one()
+            cmd = (await session.scalars(query)).one()
         except sqlalchemy.exc.NoResultFound:
             if raise_if_not_found:
                 raise CommandNotFoundError(cmd_id)
@@ -85,19 +186,21 @@ def _retrieve_command_by_id(
     return cmd_response_model
 
 
-def verify_command_exists(
+async def verify_command_exists(
     application_slug: str, application_version: str | None, command_name: str | None
 ) -> sql_models.CommandSpecDB:
-    with settings.db.get_session() as session:
+    async with settings.db.get_async_session() as session:
         try:
-            cmd_spec_db = session.exec(
-                select(sql_models.CommandSpecDB)
-                .join(sql_models.ApplicationSpecDB)
-                .options(joinedload(sql_models.CommandSpecDB.application))
-                .where(
-                    application_slug is None or (sql_models.ApplicationSpecDB.slug == application_slug),
-                    application_version is None or (sql_models.ApplicationSpecDB.version == application_version),
-                    sql_models.CommandSpecDB.name == command_name,
+            cmd_spec_db = (
+                await session.exec(
+                    select(sql_models.CommandSpecDB)
+                    .join(sql_models.ApplicationSpecDB)
+                    .options(joinedload(sql_models.CommandSpecDB.application))
+                    .where(
+                        application_slug is None or (sql_models.ApplicationSpecDB.slug == application_slug),
+                        application_version is None or (sql_models.ApplicationSpecDB.version == application_version),
+                        sql_models.CommandSpecDB.name == command_name,
+                    )
                 )
             ).one()
         except sqlalchemy.exc.NoResultFound:
@@ -145,7 +248,7 @@ async def _invoke_command(data: sql_models.CommandInvocationCreate) -> dict:
     with svcs.Container(QCRBOX_SVCS_REGISTRY) as con:
         nats_broker = await con.aget(NatsBroker)
 
-    cmd_spec_db = verify_command_exists(data.application_slug, data.application_version, data.command_name)
+    cmd_spec_db = await verify_command_exists(data.application_slug, data.application_version, data.command_name)
     validate_arguments_against_command_parameters(cmd_spec_db, data.arguments)
 
     msg = msg_specs.InvokeCommandNATS(
@@ -153,16 +256,182 @@ async def _invoke_command(data: sql_models.CommandInvocationCreate) -> dict:
         application_version=cmd_spec_db.application.version,
         command_name=cmd_spec_db.name,
         arguments=data.arguments,
+        priority=data.priority,
+        user=data.user,
     )
 
     response_json = await nats_broker.publish(msg, "server.cmd.handle_command_invocation_by_user", rpc=True)
     return response_json
 
 
-def _get_calculation_info() -> list[sql_models.CalculationResponseModel]:
-    with settings.db.get_session() as session:
-        calculations_db = session.exec(select(sql_models.CalculationDB)).all()
-        return [c.to_response_model() for c in calculations_db]
+async def _get_scheduler_stats() -> dict:
+    with svcs.Container(QCRBOX_SVCS_REGISTRY) as con:
+        nats_broker = await con.aget(NatsBroker)
+
+    msg = msg_specs.GetSchedulerStatsNATS()
+    response_json = await nats_broker.publish(msg, "server.scheduler.get_stats", rpc=True)
+    return response_json
+
+
+async def _run_garbage_collection(dry_run: bool) -> dict:
+    with svcs.Container(QCRBOX_SVCS_REGISTRY) as con:
+        nats_broker = await con.aget(NatsBroker)
+
+    msg = msg_specs.RunGarbageCollectionNATS(dry_run=dry_run)
+    # A run can take much longer than other requests (and may have to wait for a scheduled run to finish first)
+    response_json = await nats_broker.publish(
+        msg,
+        "server.gc.run",
+        rpc=True,
+        rpc_timeout=settings.registry.server.garbage_collection.request_timeout,
+        raise_timeout=True,
+    )
+    return response_json
+
+
+# Room left in each NATS message for the headers and the envelope around the batched invocations
+BATCH_MESSAGE_OVERHEAD = 4096  # bytes
+
+
+def _split_invocations_into_batches(
+    invocations: list[tuple[int, msg_specs.InvokeCommandNATS]], max_size: int
+) -> list[list[tuple[int, msg_specs.InvokeCommandNATS]]]:
+    """
+    Splits the (indexed) invocations into consecutive batches small enough to be sent in a single NATS message.
+    """
+    batches = [[]]
+    batch_size = 0
+    for idx, invocation in invocations:
+        size = len(invocation.model_dump_json().encode()) + 1
+        if batches[-1] and batch_size + size > max_size:
+            batches.append([])
+            batch_size = 0
+        batches[-1].append((idx, invocation))
+        batch_size += size
+    return [batch for batch in batches if batch]
+
+
+async def _invoke_command_batch(data: list[sql_models.CommandInvocationCreate]) -> dict:
+    """
+    Submits a batch of invocations, reporting the ones which fail by their index in the batch
+    rather than rejecting the entire batch. The batch is split into several NATS messages if
+    needed to stay below the maximum payload size.
+    """
+    if len(data) > settings.registry.server.max_invocations_per_batch:
+        raise ClientException(
+            f"Too many invocations in batch: {len(data)} "
+            f"(maximum: {settings.registry.server.max_invocations_per_batch})"
+        )
+
+    with svcs.Container(QCRBOX_SVCS_REGISTRY) as con:
+        nats_broker = await con.aget(NatsBroker)
+
+    max_batch_size = settings.nats.max_payload - BATCH_MESSAGE_OVERHEAD
+    calculation_ids = [None] * len(data)
+    errors = []
+
+    # Most batches consist of many invocations of the same command, so we only look up each one once.
+    cmd_specs_db = {}
+    invocations = []
+    for idx, invocation in enumerate(data):
+        key = (invocation.application_slug, invocation.application_version, invocation.command_name)
+        try:
+            if key not in cmd_specs_db:
+                cmd_specs_db[key] = await verify_command_exists(*key)
+            cmd_spec_db = cmd_specs_db[key]
+            validate_arguments_against_command_parameters(cmd_spec_db, invocation.arguments)
+        except ClientException as exc:
+            errors.append({"index": idx, "msg": f"Invalid invocation: {exc.detail}"})
+            continue
+
+        msg = msg_specs.InvokeCommandNATS(
+            application_slug=cmd_spec_db.application.slug,
+            application_version=cmd_spec_db.application.version,
+            command_name=cmd_spec_db.name,
+            arguments=invocation.arguments,
+            priority=invocation.priority,
+            user=invocation.user,
+        )
+        if (size := len(msg.model_dump_json().encode())) > max_batch_size:
+            errors.append({"index": idx, "msg": f"Invocation too large: {size} bytes (maximum: {max_batch_size})"})
+            continue
+        invocations.append((idx, msg))
+
+    for batch in _split_invocations_into_batches(invocations, max_batch_size):
+        msg = msg_specs.InvokeCommandBatchNATS(invocations=[invocation for _, invocation in batch])
+        response_json = await nats_broker.publish(msg, "server.cmd.handle_command_batch_invocation_by_user", rpc=True)
+        response = msg_specs.QCrBoxGenericResponse(**response_json)
+        if not hasattr(response.payload, "calculation_ids"):
+            errors.extend({"index": idx, "msg": response.msg} for idx, _ in batch)
+            continue
+
+        for (idx, _), calculation_id in zip(batch, response.payload.calculation_ids):
+            calculation_ids[idx] = calculation_id
+        errors.extend({"index": batch[error["index"]][0], "msg": error["msg"]} for error in response.payload.errors)
+
+    errors.sort(key=lambda error: error["index"])
+    payload = {"calculation_ids": calculation_ids, "errors": errors}
+    if data and all(calculation_id is None for calculation_id in calculation_ids):
+        return msg_specs.responses.error(
+            response_to="invoke_command_batch",
+            msg="None of the command invocations could be submitted",
+            payload=payload,
+        ).model_dump()
+    return msg_specs.responses.success(response_to="invoke_command_batch", payload=payload).model_dump()
+
+
+async def _get_calculation_info(
+    status: sql_models.CalculationStatusEnum | None = None,
+    application_slug: str | None = None,
+    application_version: str | None = None,
+    command_name: str | None = None,
+    user: str | None = None,
+    submitted_after: datetime | None = None,
+    submitted_before: datetime | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> tuple[list[sql_models.CalculationResponseModel], str | None]:
+    """
+    Retrieves calculations from the database, most recently submitted first.
+
+    All filters are applied in the database (and are backed by indexes on the calculation table),
+    and pages are fetched by continuing from the sort key of the last calculation on the previous
+    page, so fetching a page takes the same time regardless of how far into the listing it is.
+    """
+    model_cls = sql_models.CalculationDB
+    stmt = select(model_cls).order_by(model_cls.timestamp.desc(), model_cls.id.desc())
+    if status is not None:
+        stmt = stmt.where(model_cls.current_status == status)
+    if application_slug is not None:
+        stmt = stmt.where(model_cls.application_slug == application_slug)
+    if application_version is not None:
+        stmt = stmt.where(model_cls.application_version == application_version)
+    if command_name is not None:
+        stmt = stmt.where(model_cls.command_name == command_name)
+    if user is not None:
+        stmt = stmt.where(model_cls.user == user)
+    if submitted_after is not None:
+        stmt = stmt.where(model_cls.timestamp >= submitted_after)
+    if submitted_before is not None:
+        stmt = stmt.where(model_cls.timestamp < submitted_before)
+    if cursor is not None:
+        last_timestamp, last_id = _decode_cursor(cursor, str, int)
+        try:
+            last_timestamp = datetime.fromisoformat(last_timestamp)
+        except ValueError:
+            raise InvalidCursorError(cursor) from None
+        stmt = stmt.where(
+            or_(
+                model_cls.timestamp < last_timestamp,
+                and_(model_cls.timestamp == last_timestamp, model_cls.id < last_id),
+            )
+        )
+
+    async with settings.db.get_async_session() as session:
+        calculations_db, next_cursor = await _fetch_page(
+            session, stmt, limit, lambda calc: (calc.timestamp.isoformat(), calc.id)
+        )
+        return [c.to_response_model() for c in calculations_db], next_cursor
 
 
 async def _get_calculation_info_by_calculation_id(calculation_id: str) -> dict:
@@ -185,32 +454,181 @@ async def _get_calculation_info_by_calculation_id(calculation_id: str) -> dict:
         raise CalculationNotFoundError(calculation_id)
 
 
-async def _get_data_files() -> list[dict]:
+async def _watch_calculation_status(calculation_id: str) -> AsyncIterator[sql_models.CalculationStatusDetails]:
+    """
+    Yield the current status of the given calculation, followed by any updates until it has finished.
+
+    The updates are received from the server's watch on the calculation status key-value store,
+    so no matter how many users are following calculations, they don't cause any extra load.
+    """
+    with svcs.Container(QCRBOX_SVCS_REGISTRY) as con:
+        status_broadcaster = con.get(CalculationStatusBroadcaster)
+
+    # Subscribe before retrieving the current status so that no updates can be missed in between
+    with status_broadcaster.subscribe(calculation_id) as subscription:
+        status_details = sql_models.CalculationStatusDetails(
+            **await _get_calculation_info_by_calculation_id(calculation_id)
+        )
+        while True:
+            yield status_details
+            if status_details.status in FINISHED_CALCULATION_STATUSES:
+                return
+            status_details = await subscription.get()
+
+
+async def _cancel_calculation(calculation_id: str) -> dict:
+    calc_status_info = await _get_calculation_info_by_calculation_id(calculation_id)
+    if calc_status_info["status"] in FINISHED_CALCULATION_STATUSES:
+        raise ClientException(
+            f"Calculation has already finished (status: {calc_status_info['status']})", status_code=409
+        )
+
+    with svcs.Container(QCRBOX_SVCS_REGISTRY) as con:
+        nats_broker = await con.aget(NatsBroker)
+
+    msg = msg_specs.CancelCalculationNATS(calculation_id=calculation_id)
+    response_json = await nats_broker.publish(msg, "server.calc.cancel", rpc=True)
+    response = msg_specs.QCrBoxGenericResponse(**response_json)
+    if response.status == msg_specs.ResponseStatusEnum.ERROR:
+        raise ClientException(response.msg, status_code=409)
+
+    return response_json
+
+
+async def _get_data_files(query: QCrBoxDataFileQuery | None = None) -> list[dict]:
     data_file_manager = await get_data_file_manager()
-    data_files = await data_file_manager.get_data_files()
+    data_files = await data_file_manager.get_data_files(query)
     return [f.to_response_model() for f in data_files]
 
 
-async def _get_datasets() -> list[dict]:
+async def _get_data_file_contents(
+    qcrbox_file_id: str, accepted_encodings: Iterable[ContentEncoding] = ()
+) -> tuple[ContentEncoding, AsyncIterator[bytes]]:
+    """
+    Return the encoding of and an iterator over the contents of the given data file.
+
+    The contents are passed through as stored if they are compressed with one of
+    the `accepted_encodings`, and decompressed otherwise.
+
+    Raises:
+        DataFileNotFoundError: If the data file does not exist.
+    """
+    data_file_manager = await get_data_file_manager()
+    if not await data_file_manager.exists(qcrbox_file_id):
+        raise DataFileNotFoundError(qcrbox_file_id)
+    return await data_file_manager.iter_encoded_file_contents(qcrbox_file_id, accepted_encodings)
+
+
+async def _get_datasets(limit: int = 100, offset: int = 0) -> list[dict]:
     data_file_manager = await get_data_file_manager()
-    datasets = await data_file_manager.get_datasets()
+    datasets = await data_file_manager.get_datasets(limit=limit, offset=offset)
     return [d.to_response_model() for d in datasets]
 
 
+async def _iter_upload_chunks(data: UploadFile, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    while chunk := await data.read(chunk_size):
+        yield chunk
+
+
 async def _import_data_file(data: Annotated[UploadFile, Body(media_type=RequestEncodingType.MULTI_PART)]) -> str:
     data_file_manager = await get_data_file_manager()
-    qcrbox_data_file_id = await data_file_manager.import_bytes(await data.read(), filename=data.filename)
+    qcrbox_data_file_id = await data_file_manager.import_stream(_iter_upload_chunks(data), filename=data.filename)
     return qcrbox_data_file_id
 
 
+async def _import_data_file_by_hash(data: QCrBoxDataFileImportByHash) -> str:
+    """
+    Raises:
+        DataFileNotFoundError: If no file with the given contents has been uploaded before.
+    """
+    data_file_manager = await get_data_file_manager()
+    try:
+        return await data_file_manager.import_by_content_hash(data.sha256, filename=data.filename)
+    except KeyError:
+        raise DataFileNotFoundError(data.sha256) from None
+
+
+async def _create_upload_session(data: QCrBoxUploadSessionCreate) -> QCrBoxUploadSession:
+    data_file_manager = await get_data_file_manager()
+    return await data_file_manager.create_upload_session(data.filename, size=data.size, sha256=data.sha256)
+
+
+async def _get_upload_session(upload_id: str) -> QCrBoxUploadSession:
+    """
+    Raises:
+        UploadSessionNotFoundError: If the upload session does not exist.
+    """
+    data_file_manager = await get_data_file_manager()
+    try:
+        return await data_file_manager.get_upload_session(upload_id)
+    except KeyError:
+        raise UploadSessionNotFoundError(upload_id) from None
+
+
+async def _upload_part(
+    upload_id: str, part_number: int, chunks: AsyncIterator[bytes], sha256: str | None = None
+) -> QCrBoxUploadPart:
+    """
+    Raises:
+        UploadSessionNotFoundError: If the upload session does not exist.
+        InvalidUploadError: If the part number is out of range or the part doesn't match the given digest.
+    """
+    data_file_manager = await get_data_file_manager()
+    try:
+        return await data_file_manager.upload_part(upload_id, part_number, chunks, sha256=sha256)
+    except KeyError:
+        raise UploadSessionNotFoundError(upload_id) from None
+    except ValueError as exc:
+        raise InvalidUploadError(str(exc)) from None
+
+
+async def _complete_upload_session(upload_id: str) -> str:
+    """
+    Raises:
+        UploadSessionNotFoundError: If the upload session does not exist.
+        InvalidUploadError: If parts are missing or the contents don't match the expected size or digest.
+    """
+    data_file_manager = await get_data_file_manager()
+    try:
+        return await data_file_manager.complete_upload_session(upload_id)
+    except KeyError:
+        raise UploadSessionNotFoundError(upload_id) from None
+    except ValueError as exc:
+        raise InvalidUploadError(str(exc)) from None
+
+
+async def _abort_upload_session(upload_id: str) -> None:
+    data_file_manager = await get_data_file_manager()
+    await data_file_manager.abort_upload_session(upload_id)
+
+
 async def _import_dataset(data: Annotated[UploadFile, Body(media_type=RequestEncodingType.MULTI_PART)]) -> str:
     data_file_manager = await get_data_file_manager()
-    qcrbox_data_file_id = await data_file_manager.import_bytes(await data.read(), filename=data.filename)
+    qcrbox_data_file_id = await data_file_manager.import_stream(_iter_upload_chunks(data), filename=data.filename)
     qcrbox_dataset_id = await data_file_manager.create_dataset_from_data_file(qcrbox_data_file_id)
     return qcrbox_dataset_id
 
 
+async def _create_dataset(data: QCrBoxDatasetCreate) -> str:
+    """
+    Raises:
+        DataFileNotFoundError: If any of the given data files does not exist.
+    """
+    data_file_manager = await get_data_file_manager()
+    try:
+        return await data_file_manager.create_dataset(data.data_file_ids)
+    except KeyError as exc:
+        raise DataFileNotFoundError(exc.args[0]) from None
+
+
 async def _get_dataset_info(dataset_id: str) -> dict:
+    """
+    Raises:
+        DatasetNotFoundError: If the dataset does not exist.
+    """
     data_file_manager = await get_data_file_manager()
-    dataset_info = await data_file_manager.get_dataset_info(dataset_id)
+    try:
+        dataset_info = await data_file_manager.get_dataset_info(dataset_id)
+    except KeyError:
+        raise DatasetNotFoundError(dataset_id) from None
     return dataset_info.model_dump()
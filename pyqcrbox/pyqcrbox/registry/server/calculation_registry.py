@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Optional
+
+import nats.js.errors
+from faststream.nats import NatsBroker
+from nats.js.kv import KeyValue
+from pydantic import BaseModel, Field
+
+from pyqcrbox import logger, msg_specs, settings
+from pyqcrbox.sql_models import CalculationPriorityEnum
+from pyqcrbox.svcs import get_nats_handle_cache, iter_nats_key_value_entries
+
+__all__ = ["CalculationDetails", "CalculationRegistry", "ExecutingClientDetails"]
+
+
+class ExecutingClientDetails(BaseModel):
+    client_id: str
+    private_inbox_prefix: str
+
+
+class CalculationDetails(BaseModel):
+    calculation_id: str
+    application_slug: str
+    application_version: str
+    command_name: str
+    arguments: dict[str, Any]
+    priority: CalculationPriorityEnum = CalculationPriorityEnum.NORMAL
+    user: Optional[str] = None
+    submitted_at: datetime = Field(default_factory=datetime.now)
+    executing_client: ExecutingClientDetails | None = None
+    awaiting_acknowledgement: bool = False  # handed out to the executing client, which hasn't confirmed it yet
+    is_cancelled: bool = False
+
+    def to_execution_request(self) -> msg_specs.CommandExecutionRequestNATS:
+        return msg_specs.CommandExecutionRequestNATS(
+            **self.model_dump(exclude={"submitted_at", "executing_client", "awaiting_acknowledgement", "is_cancelled"})
+        )
+
+
+class CalculationRegistry:
+    """
+    Keeps track of submitted calculations and the clients executing them.
+
+    Every change is written through to a NATS key-value bucket, so that the routing
+    information survives restarts of the server. Lookups are served from an in-memory
+    LRU cache and only fall back to the key-value store on a cache miss.
+    """
+
+    def __init__(self, nats_broker: NatsBroker, bucket: str = "calculations", max_cached: Optional[int] = None):
+        self.nats_broker = nats_broker
+        self.bucket = bucket
+        self.max_cached = max_cached or settings.registry.server.calculation_registry_cache_size
+        self._cache: OrderedDict[str, CalculationDetails] = OrderedDict()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: bucket={self.bucket!r}, cached={len(self._cache)}/{self.max_cached}>"
+
+    async def _get_kv(self) -> KeyValue:
+        return await get_nats_handle_cache(self.nats_broker).key_value(self.bucket)
+
+    def _add_to_cache(self, calc: CalculationDetails) -> None:
+        self._cache[calc.calculation_id] = calc
+        self._cache.move_to_end(calc.calculation_id)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    async def add(self, calc: CalculationDetails) -> None:
+        kv = await self._get_kv()
+        await kv.put(calc.calculation_id, calc.model_dump_json().encode())
+        self._add_to_cache(calc)
+
+    async def get(self, calculation_id: str) -> CalculationDetails:
+        """
+        Return the details for the given calculation.
+
+        Raises:
+            KeyError: If the calculation is not known to the registry.
+        """
+        try:
+            self._cache.move_to_end(calculation_id)
+            return self._cache[calculation_id]
+        except KeyError:
+            pass
+
+        kv = await self._get_kv()
+        try:
+            kv_entry = await kv.get(calculation_id)
+        except nats.js.errors.KeyNotFoundError:
+            raise KeyError(calculation_id) from None
+
+        calc = CalculationDetails.model_validate_json(kv_entry.value)
+        self._add_to_cache(calc)
+        return calc
+
+    async def set_executing_client(self, calculation_id: str, executing_client: ExecutingClientDetails) -> None:
+        calc = await self.get(calculation_id)
+        calc.executing_client = executing_client
+        await self.add(calc)
+
+    async def remove(self, calculation_id: str) -> None:
+        """
+        Forget about a calculation, including all previous revisions of its entry in the key-value store.
+        """
+        self._cache.pop(calculation_id, None)
+        kv = await self._get_kv()
+        await kv.purge(calculation_id)
+
+    async def restore(self) -> AsyncIterator[CalculationDetails]:
+        """
+        Load previously registered calculations from the key-value store and yield them.
+
+        The entries are streamed in the order in which they were last updated, so only the most
+        recent ones are kept in the cache if there are more than fit into it; any remaining ones
+        are fetched on demand when they are first looked up.
+        """
+        num_restored = 0
+        async for kv_entry in iter_nats_key_value_entries(await self._get_kv()):
+            calc = CalculationDetails.model_validate_json(kv_entry.value)
+            self._add_to_cache(calc)
+            num_restored += 1
+            yield calc
+
+        logger.info(f"Restored {num_restored} previously registered calculations")
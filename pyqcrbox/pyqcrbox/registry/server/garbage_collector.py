@@ -0,0 +1,360 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional, TypeVar
+
+import anyio
+from nats.js.client import KV_PRE_TEMPLATE, KV_STREAM_TEMPLATE
+from nats.js.kv import KV_DEL, KV_PURGE
+from sqlmodel import Session, and_, col, delete, exists, func, or_, select, true
+
+from pyqcrbox import logger, msg_specs, settings
+from pyqcrbox.data_management import QCrBoxDataFileManager
+from pyqcrbox.settings import GarbageCollectionSettings, is_sqlite_file_url
+from pyqcrbox.sql_models import (
+    CalculationDataFileLinkDB,
+    CalculationDB,
+    CalculationStatusEnum,
+    DataFileDB,
+    DatasetDataFileLinkDB,
+    UploadPartDB,
+    UploadSessionDB,
+)
+from pyqcrbox.sql_models.calculation_status_event import CalculationStatusEventDB
+from pyqcrbox.svcs import get_nats_handle_cache, iter_nats_key_value_entries
+
+from .calculation_registry import CalculationRegistry
+
+__all__ = ["GarbageCollector"]
+
+T = TypeVar("T")
+
+FINISHED_CALCULATION_STATUSES = (
+    CalculationStatusEnum.SUCCESSFUL,
+    CalculationStatusEnum.FAILED,
+    CalculationStatusEnum.CANCELLED,
+)
+
+# Number of ids of deleted calculations and data files listed in the report (the counts are always complete)
+MAX_REPORTED_IDS = 100
+
+# The database is only compacted if at least this fraction of it is unused, because
+# this rewrites the whole database file (and blocks other writers while doing so).
+VACUUM_MIN_FREE_FRACTION = 0.25
+
+
+class GarbageCollector:
+    """
+    Deletes calculations and data files according to the configured retention policies.
+
+    Finished calculations are deleted once they are older than `calculation_max_age`, or
+    (oldest first) once there are more than `max_finished_calculations` of them. This includes
+    their status history in the database and their entries in the NATS key-value stores.
+
+    Data files are only deleted if no remaining calculation (as an input or output) or dataset
+    refers to them, once they are older than `data_file_max_age` or (oldest first) while the
+    total size of all data files exceeds `max_total_data_file_size`. Stored contents which are
+    no longer referenced by any data file are deleted, too.
+
+    Uploads in parts which haven't received a new part for longer than `upload_session_max_age`
+    are aborted, so that the parts of abandoned uploads don't take up space indefinitely.
+
+    Everything is deleted in batches of `batch_size`, and other tasks get to run between
+    batches, so that the server remains responsive while a large backlog is cleaned up.
+    """
+
+    def __init__(
+        self,
+        calculation_registry: CalculationRegistry,
+        gc_settings: Optional[GarbageCollectionSettings] = None,
+        data_file_manager: Optional[QCrBoxDataFileManager] = None,
+    ):
+        self.calculations = calculation_registry
+        self.settings = gc_settings or settings.registry.server.garbage_collection
+        self.data_file_manager = data_file_manager or QCrBoxDataFileManager()
+        self._lock = anyio.Lock()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: interval={self.settings.interval}s, dry_run={self.settings.dry_run}>"
+
+    @property
+    def has_retention_policies(self) -> bool:
+        return any(
+            policy is not None
+            for policy in (
+                self.settings.calculation_max_age,
+                self.settings.max_finished_calculations,
+                self.settings.data_file_max_age,
+                self.settings.max_total_data_file_size,
+                self.settings.upload_session_max_age,
+            )
+        )
+
+    async def run_periodically(self) -> None:
+        while True:
+            await anyio.sleep(self.settings.interval)
+            try:
+                await self.run()
+            except Exception as exc:
+                # Try again next time rather than giving up on garbage collection altogether
+                logger.error(f"Garbage collection failed: {exc!r}")
+
+    async def run(self, dry_run: Optional[bool] = None) -> msg_specs.GarbageCollectionReportNATS:
+        """
+        Delete everything that is due for deletion and return a report about what was deleted.
+
+        A dry run only reports what would be deleted. Data files which are only referenced by
+        calculations that are due for deletion are not included in a dry run's report, because
+        they only become unreferenced once these calculations have actually been deleted.
+        """
+        dry_run = self.settings.dry_run if dry_run is None else dry_run
+        async with self._lock:
+            report = msg_specs.GarbageCollectionReportNATS(dry_run=dry_run, started_at=datetime.now())
+            start_time = time.monotonic()
+
+            await self._collect_calculations(report)
+            await self._collect_data_files(report)
+            await self._collect_blobs(report)
+            await self._collect_upload_sessions(report)
+            if not dry_run:
+                await self._purge_key_value_delete_markers()
+                if report.num_calculations or report.num_data_files:
+                    report.db_vacuumed = await self._vacuum_db_if_worthwhile()
+
+            report.duration = time.monotonic() - start_time
+
+        logger.info(
+            f"Garbage collection {'(dry run) ' if dry_run else ''}finished in {report.duration:.1f}s: "
+            f"{report.num_calculations} calculations, {report.num_data_files} data files "
+            f"({report.data_file_size} bytes), {report.num_blobs} unreferenced blobs ({report.blob_size} bytes), "
+            f"{report.num_upload_sessions} abandoned uploads"
+        )
+        return report
+
+    async def _collect_calculations(self, report: msg_specs.GarbageCollectionReportNATS) -> None:
+        max_age = self.settings.calculation_max_age
+        max_count = self.settings.max_finished_calculations
+        if max_age is None and max_count is None:
+            return
+
+        # Both policies select the oldest finished calculations, so we only need to work out how many to delete
+        finished_calculations = _get_finished_calculations_query().subquery()
+
+        def count_calculations_to_delete(session: Session) -> int:
+            num_to_delete = 0
+            if max_count is not None:
+                num_finished = session.exec(select(func.count()).select_from(finished_calculations)).one()
+                num_to_delete = max(num_finished - max_count, 0)
+            if max_age is not None:
+                num_expired = session.exec(
+                    select(func.count())
+                    .select_from(finished_calculations)
+                    .where(finished_calculations.c.finished_at < datetime.now() - max_age)
+                ).one()
+                num_to_delete = max(num_to_delete, num_expired)
+            return num_to_delete
+
+        num_to_delete = await _run_in_db_session(count_calculations_to_delete)
+
+        last_seen = None
+        while report.num_calculations < num_to_delete:
+            batch_size = min(self.settings.batch_size, num_to_delete - report.num_calculations)
+            batch = await _run_in_db_session(
+                lambda session: session.exec(
+                    select(
+                        finished_calculations.c.id,
+                        finished_calculations.c.calculation_id,
+                        finished_calculations.c.finished_at,
+                    )
+                    .where(_is_after(finished_calculations.c.finished_at, finished_calculations.c.id, last_seen))
+                    .order_by(finished_calculations.c.finished_at, finished_calculations.c.id)
+                    .limit(batch_size)
+                ).all()
+            )
+            if not batch:
+                break
+
+            last_seen = (batch[-1].finished_at, batch[-1].id)
+            calculation_ids = [row.calculation_id for row in batch]
+            if not report.dry_run:
+                await self._delete_calculations([row.id for row in batch], calculation_ids)
+            report.num_calculations += len(batch)
+            _add_reported_ids(report.calculation_ids, calculation_ids)
+            await anyio.sleep(0)
+
+    async def _delete_calculations(self, db_ids: list[int], calculation_ids: list[str]) -> None:
+        def delete_from_db(session: Session) -> None:
+            session.exec(
+                delete(CalculationStatusEventDB).where(col(CalculationStatusEventDB.calculation_id).in_(db_ids))
+            )
+            session.exec(
+                delete(CalculationDataFileLinkDB).where(col(CalculationDataFileLinkDB.calculation_id).in_(db_ids))
+            )
+            session.exec(delete(CalculationDB).where(col(CalculationDB.id).in_(db_ids)))
+            session.commit()
+
+        await _run_in_db_session(delete_from_db)
+
+        # Purging (rather than deleting) the keys also removes their history
+        kv_calculation_status = await get_nats_handle_cache(self.calculations.nats_broker).key_value(
+            "calculation_status"
+        )
+        await asyncio.gather(
+            *(kv_calculation_status.purge(calculation_id) for calculation_id in calculation_ids),
+            *(self.calculations.remove(calculation_id) for calculation_id in calculation_ids),
+        )
+
+    async def _collect_data_files(self, report: msg_specs.GarbageCollectionReportNATS) -> None:
+        max_age = self.settings.data_file_max_age
+        max_total_size = self.settings.max_total_data_file_size
+        if max_age is None and max_total_size is None:
+            return
+
+        now = datetime.now()
+        expiry_cutoff = now - max_age if max_age is not None else None
+        num_excess_bytes = 0
+        if max_total_size is not None:
+            total_size = await _run_in_db_session(
+                lambda session: session.exec(select(func.coalesce(func.sum(DataFileDB.size), 0))).one()
+            )
+            num_excess_bytes = total_size - max_total_size
+
+        # Both policies select the oldest unreferenced data files, so we can stop at the first one that is kept
+        last_seen = None
+        while True:
+            batch = await _run_in_db_session(
+                lambda session: session.exec(
+                    _get_unreferenced_data_files_query(uploaded_before=now - self.settings.grace_period)
+                    .where(_is_after(DataFileDB.uploaded_at, DataFileDB.id, last_seen))
+                    .order_by(DataFileDB.uploaded_at, DataFileDB.id)
+                    .limit(self.settings.batch_size)
+                ).all()
+            )
+
+            data_files_to_delete = []
+            for data_file in batch:
+                is_expired = expiry_cutoff is not None and data_file.uploaded_at < expiry_cutoff
+                if not is_expired and report.data_file_size >= num_excess_bytes:
+                    break
+                data_files_to_delete.append(data_file)
+                report.data_file_size += data_file.size
+
+            for data_file in data_files_to_delete:
+                if not report.dry_run:
+                    await self.data_file_manager.delete(data_file.qcrbox_file_id)
+            report.num_data_files += len(data_files_to_delete)
+            _add_reported_ids(report.data_file_ids, [data_file.qcrbox_file_id for data_file in data_files_to_delete])
+
+            if len(data_files_to_delete) < self.settings.batch_size:
+                break
+            last_seen = (batch[-1].uploaded_at, batch[-1].id)
+            await anyio.sleep(0)
+
+    async def _collect_blobs(self, report: msg_specs.GarbageCollectionReportNATS) -> None:
+        if self.settings.data_file_max_age is None and self.settings.max_total_data_file_size is None:
+            return
+
+        async for unreferenced_blobs in self.data_file_manager.iter_unreferenced_blobs(
+            min_age=self.settings.grace_period, batch_size=self.settings.batch_size
+        ):
+            for blob_info in unreferenced_blobs:
+                # Contents that have been reused since they were listed are skipped
+                if report.dry_run or await self.data_file_manager.delete_blob(
+                    blob_info.name, min_age=self.settings.grace_period
+                ):
+                    report.num_blobs += 1
+                    report.blob_size += blob_info.size
+            await anyio.sleep(0)
+
+    async def _collect_upload_sessions(self, report: msg_specs.GarbageCollectionReportNATS) -> None:
+        max_age = self.settings.upload_session_max_age
+        if max_age is None:
+            return
+
+        # Sessions which haven't been started or received a part since the cutoff are abandoned
+        cutoff = datetime.now() - max_age
+        is_abandoned = and_(
+            UploadSessionDB.created_at < cutoff,
+            ~exists().where(UploadPartDB.upload_session_id == UploadSessionDB.id, UploadPartDB.uploaded_at >= cutoff),
+        )
+        last_seen_id = None
+        while True:
+            batch = await _run_in_db_session(
+                lambda session: session.exec(
+                    select(UploadSessionDB.id, UploadSessionDB.upload_id)
+                    .where(is_abandoned, UploadSessionDB.id > last_seen_id if last_seen_id is not None else true())
+                    .order_by(UploadSessionDB.id)
+                    .limit(self.settings.batch_size)
+                ).all()
+            )
+            if not batch:
+                break
+
+            for row in batch:
+                if not report.dry_run:
+                    await self.data_file_manager.abort_upload_session(row.upload_id)
+            report.num_upload_sessions += len(batch)
+            last_seen_id = batch[-1].id
+            await anyio.sleep(0)
+
+    async def _purge_key_value_delete_markers(self) -> None:
+        # Unlike KeyValue.purge_deletes(), this doesn't collect all delete markers before purging them
+        nats_handle_cache = get_nats_handle_cache(self.calculations.nats_broker)
+        cutoff = datetime.now(timezone.utc) - self.settings.grace_period
+        for bucket in ("calculation_status", self.calculations.bucket):
+            kv = await nats_handle_cache.key_value(bucket)
+            async for kv_entry in iter_nats_key_value_entries(kv, ignore_deletes=False):
+                if kv_entry.operation in (KV_DEL, KV_PURGE) and kv_entry.created < cutoff:
+                    await self.calculations.nats_broker.stream.purge_stream(
+                        KV_STREAM_TEMPLATE.format(bucket=bucket),
+                        subject=f"{KV_PRE_TEMPLATE.format(bucket=bucket)}{kv_entry.key}",
+                    )
+
+    async def _vacuum_db_if_worthwhile(self) -> bool:
+        engine = settings.db.get_engine()
+        if not (self.settings.vacuum_db and is_sqlite_file_url(engine.url)):
+            return False
+
+        def vacuum_db() -> bool:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                num_pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+                num_free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                if not num_pages or num_free_pages / num_pages < VACUUM_MIN_FREE_FRACTION:
+                    return False
+                logger.info(f"Compacting database ({num_free_pages} of {num_pages} pages are unused)")
+                conn.exec_driver_sql("VACUUM")
+                return True
+
+        return await anyio.to_thread.run_sync(vacuum_db)
+
+
+async def _run_in_db_session(func: Callable[[Session], T]) -> T:
+    # The garbage collector runs alongside everything else on the server, so its queries mustn't block the event loop
+    return await settings.db.run_in_session(func, init_db=True)
+
+
+def _get_finished_calculations_query():
+    # The current status of a finished calculation no longer changes, so its last update is when it finished
+    return select(
+        CalculationDB.id, CalculationDB.calculation_id, col(CalculationDB.updated_at).label("finished_at")
+    ).where(col(CalculationDB.current_status).in_(FINISHED_CALCULATION_STATUSES))
+
+
+def _get_unreferenced_data_files_query(uploaded_before: datetime):
+    return select(DataFileDB).where(
+        DataFileDB.uploaded_at < uploaded_before,
+        ~exists().where(CalculationDataFileLinkDB.qcrbox_file_id == DataFileDB.qcrbox_file_id),
+        ~exists().where(DatasetDataFileLinkDB.data_file_id == DataFileDB.id),
+    )
+
+
+def _is_after(timestamp_column, id_column, last_seen: Optional[tuple[datetime, int]]):
+    # Keyset pagination, which (unlike an offset) stays fast however far we are into the results
+    if last_seen is None:
+        return true()
+    last_timestamp, last_id = last_seen
+    return or_(timestamp_column > last_timestamp, and_(timestamp_column == last_timestamp, id_column > last_id))
+
+
+def _add_reported_ids(reported_ids: list[str], ids: list[str]) -> None:
+    reported_ids.extend(ids[: MAX_REPORTED_IDS - len(reported_ids)])
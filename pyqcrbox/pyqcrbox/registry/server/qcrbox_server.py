@@ -1,48 +1,71 @@
+import asyncio
 import json
 from pathlib import Path
-from typing import Any
 
+import nats.errors
 import nats.js.errors
+import pydantic
+import svcs
 from faststream import Context
+from faststream.nats import KvWatch, PullSub
 from litestar import Litestar, MediaType, get
 from litestar.openapi import OpenAPIConfig
 from litestar.response import Redirect
 from litestar.static_files import create_static_files_router
-from pydantic import BaseModel
 from sqlmodel import select
 
 from pyqcrbox import helpers, logger, msg_specs, settings, sql_models
+from pyqcrbox.data_management import QCrBoxDataFileManager
 from pyqcrbox.registry.shared.calculation_status import update_calculation_status_in_nats_kv_NEW
+from pyqcrbox.services import QCRBOX_GLOBAL_SERVICES_REGISTRY
 from pyqcrbox.sql_models import CalculationStatusDetails, CalculationStatusEnum
-
-from ..shared import QCrBoxServerClientBase, TestQCrBoxServerClientBase, on_qcrbox_startup, structlog_plugin
+from pyqcrbox.svcs import iter_nats_key_value_entries
+
+from ..shared import (
+    QCrBoxServerClientBase,
+    TestQCrBoxServerClientBase,
+    get_work_queue_stream,
+    get_work_queue_subject,
+    get_work_queue_subject_wildcard,
+    on_qcrbox_startup,
+    structlog_plugin,
+)
 from .api import api_router
+from .calculation_registry import CalculationDetails, CalculationRegistry, ExecutingClientDetails
+from .garbage_collector import GarbageCollector
+from .scheduler import CalculationScheduler
+from .status_broadcaster import CalculationStatusBroadcaster
 from .views import views_router
 
+FINAL_CALCULATION_STATUSES = (
+    CalculationStatusEnum.SUCCESSFUL,
+    CalculationStatusEnum.FAILED,
+    CalculationStatusEnum.CANCELLED,
+)
+
 static_files_dir = Path(__file__).parent / "assets"
 static_files_router = create_static_files_router(path="/static", directories=[static_files_dir])
 
 
-class ExecutingClientDetails(BaseModel):
-    client_id: str
-    private_inbox_prefix: str
-
-
-class CalculationDetails(BaseModel):
-    calculation_id: str
-    application_slug: str
-    application_version: str
-    command_name: str
-    arguments: dict[str, Any]
-    executing_client: ExecutingClientDetails | None = None
-
-
 @get(path="/", media_type=MediaType.HTML)
 def web_root_handler() -> Redirect:
     return Redirect(path="/views/index")
 
 
 class QCrBoxServer(QCrBoxServerClientBase):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calculations = CalculationRegistry(self.nats_broker)
+        self.scheduler = CalculationScheduler()
+        # The same data file manager as the API endpoints use (see `get_data_file_manager()`)
+        with svcs.Container(QCRBOX_GLOBAL_SERVICES_REGISTRY) as con:
+            self.data_file_manager = con.get(QCrBoxDataFileManager)
+        self.garbage_collector = GarbageCollector(self.calculations, data_file_manager=self.data_file_manager)
+        self.status_broadcaster = CalculationStatusBroadcaster()
+        # Clients which calculations have been handed out to, until they acknowledge them
+        self._unacknowledged_jobs: dict[str, ExecutingClientDetails] = {}
+        self.svcs_registry.register_value(CalculationStatusBroadcaster, self.status_broadcaster)
+
     # def _set_up_rabbitmq_broker(self) -> None:
     #     # self.set_up_message_dispatcher(
     #     #     queue_name=settings.rabbitmq.routing_key_qcrbox_registry,
@@ -57,11 +80,29 @@ class QCrBoxServer(QCrBoxServerClientBase):
         self.nats_broker.subscriber("server.cmd.handle_command_invocation_by_user")(
             self.handle_command_invocation_by_user
         )
-        self.nats_broker.subscriber("server.cmd.handle_command_invocation_client_response")(
-            self.handle_command_invocation_client_response
+        self.nats_broker.subscriber("server.cmd.handle_command_batch_invocation_by_user")(
+            self.handle_command_batch_invocation_by_user
         )
+        self.nats_broker.subscriber(
+            get_work_queue_subject_wildcard(),
+            stream=get_work_queue_stream(),
+            durable=settings.nats.work_queue_consumer,
+            pull_sub=PullSub(batch_size=settings.registry.server.max_concurrent_work_requests),
+        )(self.enqueue_calculation)
+        self.nats_broker.subscriber(
+            "server.cmd.request_work",
+            max_workers=settings.registry.server.max_concurrent_work_requests,
+        )(self.handle_work_request)
+        self.nats_broker.subscriber("server.cmd.acknowledge_work")(self.handle_work_acknowledgement)
         self.nats_broker.subscriber("server.calc.get_status")(self.get_calculation_status)
-        self.nats_broker.subscriber("*", kv_watch="calculation_status")(self.update_calculation_status_in_db)
+        self.nats_broker.subscriber("server.calc.cancel")(self.handle_calculation_cancellation)
+        self.nats_broker.subscriber("server.scheduler.get_stats")(self.get_scheduler_stats)
+        self.nats_broker.subscriber("server.gc.run")(self.run_garbage_collection)
+        self.nats_broker.subscriber("server.data_files.register")(self.handle_data_file_registration)
+        # Entries of calculations that are removed by garbage collection are purged, which isn't a status update
+        self.nats_broker.subscriber("*", kv_watch=KvWatch("calculation_status", ignore_deletes=True))(
+            self.update_calculation_status_in_db
+        )
 
     async def handle_application_registration(self, msg: msg_specs.RegisterApplication):
         logger.info(
@@ -79,7 +120,6 @@ class QCrBoxServer(QCrBoxServerClientBase):
             calculation_id=calculation_id,
             **msg.model_dump(),
         )
-        self.calculations[calculation_id] = calculation_details
 
         calculation_db = sql_models.CalculationDB(
             application_slug=msg.application_slug,
@@ -87,22 +127,90 @@ class QCrBoxServer(QCrBoxServerClientBase):
             command_name=msg.command_name,
             arguments=msg.arguments,
             calculation_id=calculation_id,
+            user=msg.user,
         )
         try:
-            calculation_db.save_to_db()
+            await calculation_db.asave_to_db()
         except sql_models.QCrBoxDBError as exc:
-            return msg_specs.InvokeCommandResponse(response_to=msg.action, status="error", msg=exc.message)
+            return msg_specs.responses.error(
+                response_to="server.cmd.handle_command_invocation_by_user", msg=exc.message
+            )
 
-        msg_to_client = msg_specs.CommandInvocationRequestNATS(
-            application_slug=msg.application_slug,
-            application_version=msg.application_version,
-            command_name=msg.command_name,
-            arguments=msg.arguments,
-            calculation_id=calculation_id,
+        await self.calculations.add(calculation_details)
+        await self._submit_calculation(calculation_details)
+        return msg_specs.QCrBoxGenericResponse(
+            response_to="server.cmd.handle_command_invocation_by_user",
+            status=CalculationStatusEnum.SUBMITTED,
+            payload={"calculation_id": calculation_id},
         )
 
+    async def handle_command_batch_invocation_by_user(self, msg: msg_specs.InvokeCommandBatchNATS):
+        """
+        Submit a batch of invocations. Invocations which fail are reported individually (by their
+        index in the batch) rather than failing the entire batch; the returned calculation ids are
+        aligned with the invocations, with `None` for each invocation that failed.
+        """
+        logger.info(f"Received batch of {len(msg.invocations)} command invocations from user")
+
+        calculations = [
+            CalculationDetails(calculation_id=helpers.generate_calculation_id(), **invocation.model_dump())
+            for invocation in msg.invocations
+        ]
+        errors = await sql_models.CalculationDB.asave_many_to_db(
+            [
+                sql_models.CalculationDB(
+                    application_slug=calc.application_slug,
+                    application_version=calc.application_version,
+                    command_name=calc.command_name,
+                    arguments=calc.arguments,
+                    calculation_id=calc.calculation_id,
+                    user=calc.user,
+                )
+                for calc in calculations
+            ]
+        )
+
+        # Register and enqueue all calculations concurrently rather than waiting for
+        # the acknowledgements of each one in turn.
+        saved_calculations = [calc for calc in calculations if calc.calculation_id not in errors]
+        results = await asyncio.gather(
+            *(self._register_and_submit_calculation(calc) for calc in saved_calculations), return_exceptions=True
+        )
+        for calc, result in zip(saved_calculations, results):
+            if isinstance(result, Exception):
+                logger.error(f"Could not submit calculation {calc.calculation_id!r}: {result!r}")
+                errors[calc.calculation_id] = f"Could not submit calculation: {result!r}"
+
+        payload = {
+            "calculation_ids": [
+                None if calc.calculation_id in errors else calc.calculation_id for calc in calculations
+            ],
+            "errors": [
+                {"index": idx, "msg": errors[calc.calculation_id]}
+                for idx, calc in enumerate(calculations)
+                if calc.calculation_id in errors
+            ],
+        }
+        if calculations and len(errors) == len(calculations):
+            return msg_specs.responses.error(
+                response_to="server.cmd.handle_command_batch_invocation_by_user",
+                msg="None of the command invocations could be submitted",
+                payload=payload,
+            )
+
+        return msg_specs.QCrBoxGenericResponse(
+            response_to="server.cmd.handle_command_batch_invocation_by_user",
+            status=CalculationStatusEnum.SUBMITTED,
+            payload=payload,
+        )
+
+    async def _register_and_submit_calculation(self, calc: CalculationDetails) -> None:
+        await self.calculations.add(calc)
+        await self._submit_calculation(calc)
+
+    async def _submit_calculation(self, calc: CalculationDetails) -> None:
         status_details = CalculationStatusDetails(
-            calculation_id=calculation_id,
+            calculation_id=calc.calculation_id,
             status=CalculationStatusEnum.SUBMITTED,
             stdout="",
             stderr="",
@@ -110,69 +218,222 @@ class QCrBoxServer(QCrBoxServerClientBase):
         )
         await update_calculation_status_in_nats_kv_NEW(status_details)
         # await self.kv_calculation_status.put(calculation_id, CalculationStatusEnum.SUBMITTED.encode())
+
         await self.nats_broker.publish(
-            msg_to_client,
-            subject=f"client.cmd.handle_invocation_request.{msg_to_client.nats_subject_parts}",
-            reply_to="server.cmd.handle_command_invocation_client_response",
-        )
-        return msg_specs.QCrBoxGenericResponse(
-            response_to="server.cmd.handle_command_invocation_by_user",
-            status=CalculationStatusEnum.SUBMITTED,
-            payload={"calculation_id": calculation_id},
+            calc.to_execution_request(),
+            subject=get_work_queue_subject(calc.application_slug, calc.application_version),
+            stream=settings.nats.work_queue_stream,
         )
 
-    async def handle_command_invocation_client_response(self, msg: msg_specs.CommandInvocationClientResponseNATS):
-        logger.info(f"Received client response: {msg!r}")
-        if not msg.client_is_available:
-            logger.debug(f"Client is not available: {msg.client_id}")
-            return
+    async def enqueue_calculation(self, msg: msg_specs.CommandExecutionRequestNATS) -> None:
+        """
+        Move a calculation from the work queue stream into the scheduler.
 
-        logger.debug(f"Retrieving details for calculation: {msg.calculation_id!r}")
+        The message is acknowledged (and thus removed from the stream) once this handler
+        returns. From then on the calculation registry is the durable record of it, which
+        is why any pending calculations are re-queued from there at startup.
+        """
         try:
-            calc = self.calculations[msg.calculation_id]
+            calc = await self.calculations.get(msg.calculation_id)
         except KeyError:
-            error_msg = f"Calculation not found: {msg.calculation_id!r}"
-            logger.error(error_msg)
-            raise RuntimeError(error_msg)
+            # The job was queued before the calculation registry was persistent (or its entry
+            # was lost), but the job message itself carries everything we need to rebuild it.
+            calc = CalculationDetails(**msg.model_dump())
+            await self.calculations.add(calc)
+
+        if calc.executing_client is not None or calc.is_cancelled:
+            logger.debug(f"Calculation {calc.calculation_id!r} has already been dispatched or cancelled, ignoring.")
+            return
+
+        self.scheduler.enqueue(calc)
+
+    async def handle_work_request(self, msg: msg_specs.RequestWorkNATS) -> msg_specs.RequestWorkResponseNATS:
+        """
+        Hand out a batch of pending calculations to a client that has free slots.
+
+        The calculations are chosen by the scheduler and the client is recorded as executing
+        them, so that subsequent requests concerning these calculations can be routed to it.
+        If nothing is pending, the request is held open for a short while in case new
+        calculations arrive in the meantime.
+        """
+        logger.debug(f"Received work request: {msg!r}")
+        calcs = self._select_calculations_for_client(msg)
+        if not calcs:
+            await self.scheduler.wait_for_new_calculations(timeout=settings.nats.work_queue_fetch_timeout)
+            calcs = self._select_calculations_for_client(msg)
+
+        # Record the executing client before yielding control, so that a concurrent cancellation
+        # request always either finds the calculation in the scheduler's queue or sees who runs it.
+        executing_client = ExecutingClientDetails(
+            client_id=msg.client_id, private_inbox_prefix=msg.private_inbox_prefix
+        )
+        for calc in calcs:
+            calc.executing_client = executing_client
+            calc.awaiting_acknowledgement = True
+            self._unacknowledged_jobs[calc.calculation_id] = executing_client
+        await asyncio.gather(*(self.calculations.add(calc) for calc in calcs))
+
+        jobs = [calc.to_execution_request() for calc in calcs]
+
+        if jobs:
+            logger.info(f"Dispatching {len(jobs)} calculation(s) to client {msg.client_id!r}")
+            # The reply may never reach the client (e.g. because it has given up waiting for it), in which
+            # case the calculations would never run, so they are handed out again unless acknowledged in time.
+            self.start_background_task(self._requeue_unless_acknowledged, [calc.calculation_id for calc in calcs])
+        return msg_specs.RequestWorkResponseNATS(jobs=jobs)
+
+    async def handle_work_acknowledgement(
+        self, msg: msg_specs.AcknowledgeWorkNATS
+    ) -> msg_specs.AcknowledgeWorkResponseNATS:
+        """
+        Confirm which of the calculations handed out to a client are still assigned to it.
+
+        Calculations which have been queued again because the acknowledgement came too late (or which
+        have been cancelled in the meantime) are left out, and the client must not execute them.
+        """
+        executing_client = ExecutingClientDetails(
+            client_id=msg.client_id, private_inbox_prefix=msg.private_inbox_prefix
+        )
+        calculation_ids = [
+            calculation_id
+            for calculation_id in msg.calculation_ids
+            if self._unacknowledged_jobs.get(calculation_id) == executing_client
+        ]
+        for calculation_id in calculation_ids:
+            del self._unacknowledged_jobs[calculation_id]
+
+        calcs = await asyncio.gather(*(self.calculations.get(calculation_id) for calculation_id in calculation_ids))
+        for calc in calcs:
+            calc.awaiting_acknowledgement = False
+        await asyncio.gather(*(self.calculations.add(calc) for calc in calcs))
+        return msg_specs.AcknowledgeWorkResponseNATS(calculation_ids=calculation_ids)
+
+    async def _requeue_unless_acknowledged(self, calculation_ids: list[str]) -> None:
+        await asyncio.sleep(settings.registry.server.work_acknowledgement_timeout)
+        for calculation_id in calculation_ids:
+            if self._unacknowledged_jobs.pop(calculation_id, None) is None:
+                continue
+            logger.warning(f"Calculation {calculation_id!r} was not acknowledged by its client, queueing it again")
+            await self._requeue(await self.calculations.get(calculation_id))
+
+    async def _requeue(self, calc: CalculationDetails) -> None:
+        calc.executing_client = None
+        calc.awaiting_acknowledgement = False
+        await self.calculations.add(calc)
+        self.scheduler.mark_finished(calc.calculation_id)
+        self.scheduler.enqueue(calc)
+
+    def _select_calculations_for_client(self, msg: msg_specs.RequestWorkNATS) -> list[CalculationDetails]:
+        return self.scheduler.select(
+            msg.application_slug,
+            msg.application_version,
+            num_free_slots=msg.num_free_slots,
+            num_free_slots_per_command=msg.num_free_slots_per_command,
+        )
+
+    async def get_scheduler_stats(self, msg: msg_specs.GetSchedulerStatsNATS) -> msg_specs.SchedulerStatsResponseNATS:
+        return self.scheduler.get_stats()
+
+    async def run_garbage_collection(
+        self, msg: msg_specs.RunGarbageCollectionNATS
+    ) -> msg_specs.GarbageCollectionReportNATS:
+        return await self.garbage_collector.run(dry_run=msg.dry_run)
+
+    async def handle_data_file_registration(
+        self, msg: msg_specs.RegisterDataFilesNATS
+    ) -> msg_specs.RegisterDataFilesResponseNATS:
+        """
+        Add data files for contents which a client has stored in the object store (e.g. the output
+        files of a calculation), so that they are recorded in the server's catalogue of data files.
+        """
+        logger.info(f"Received registration of {len(msg.files)} data files")
+        qcrbox_file_ids = [
+            await self.data_file_manager.import_by_content_hash(f.sha256, filename=f.filename) for f in msg.files
+        ]
+        return msg_specs.RegisterDataFilesResponseNATS(qcrbox_file_ids=qcrbox_file_ids)
+
+    async def handle_calculation_cancellation(
+        self, msg: msg_specs.CancelCalculationNATS
+    ) -> msg_specs.QCrBoxGenericResponse:
+        logger.info(f"Received cancellation request for calculation {msg.calculation_id!r}")
+        response_to = "server.calc.cancel"
+
+        calc = self.scheduler.remove(msg.calculation_id)
+        if calc is None:
+            try:
+                calc = await self.calculations.get(msg.calculation_id)
+            except KeyError:
+                return msg_specs.responses.error(
+                    response_to=response_to, msg=f"Calculation not found: {msg.calculation_id!r}"
+                )
+
+        if calc.is_cancelled:
+            return msg_specs.responses.error(response_to=response_to, msg="Calculation has already been cancelled")
+
+        if self._unacknowledged_jobs.pop(calc.calculation_id, None) is not None:
+            # The client hasn't acknowledged the calculation yet (and now won't be allowed to run it)
+            calc.executing_client = None
+            calc.awaiting_acknowledgement = False
 
         if calc.executing_client is None:
-            response_to_client = msg_specs.CommandExecutionRequestNATS(
-                application_slug=calc.application_slug,
-                application_version=calc.application_version,
-                command_name=calc.command_name,
-                arguments=calc.arguments,
-                calculation_id=msg.calculation_id,
+            # The calculation has not been dispatched yet, so all we need to do is make
+            # sure that it never will be (including after a restart of the server).
+            calc.is_cancelled = True
+            await self.calculations.add(calc)
+            status_details = CalculationStatusDetails(
+                calculation_id=calc.calculation_id,
+                status=CalculationStatusEnum.CANCELLED,
+                stdout="",
+                stderr="",
+                extra_info={},
             )
-            subject = f"{msg.private_inbox_prefix}.cmd.execute"
-            await self.nats_broker.publish(response_to_client, subject=subject)
+            await update_calculation_status_in_nats_kv_NEW(status_details)
+            return msg_specs.responses.ok(response_to=response_to, msg="Calculation cancelled before it started")
 
-            logger.debug(
-                f"Sending command execution request to client {msg.client_id!r} "
-                f"(private inbox prefix: {msg.private_inbox_prefix!r})"
-            )
-            calc.executing_client = ExecutingClientDetails(
-                client_id=msg.client_id,
-                private_inbox_prefix=msg.private_inbox_prefix,
+        # The executing client terminates the calculation and publishes its final status
+        subject = f"{calc.executing_client.private_inbox_prefix}.calc.cancel"
+        try:
+            response = await self.nats_broker.publish(
+                msg, subject, rpc=True, rpc_timeout=settings.nats.rpc_timeout, raise_timeout=True
             )
-        else:
-            subject = f"{msg.private_inbox_prefix}.cmd.discard"
-            response_to_client = msg_specs.DiscardCommandInvocationNATS(calculation_id=msg.calculation_id)
-            logger.debug(
-                f"Telling client {msg.client_id!r} to discard the invocation request "
-                f"(private inbox prefix: {msg.private_inbox_prefix!r})"
+        except TimeoutError:
+            return msg_specs.responses.error(
+                response_to=response_to,
+                msg=f"No response from client executing the calculation: {calc.executing_client.client_id!r}",
             )
-            await self.nats_broker.publish(response_to_client, subject=subject)
+        return msg_specs.QCrBoxGenericResponse(**response)
 
     async def get_calculation_status(self, msg: msg_specs.GetCalculationStatusNATS):
         logger.debug(f"Retrieving status for {msg.calculation_id!r}")
-        executing_client = self.calculations[msg.calculation_id].executing_client
+        try:
+            executing_client = (await self.calculations.get(msg.calculation_id)).executing_client
+        except KeyError:
+            executing_client = None
+
+        # No client has picked up the calculation yet (or it is unknown), or it has already finished (in which
+        # case the client has forgotten about it), so the status in the NATS KV store is all there is to know.
+        try:
+            kv_entry = await self.kv_calculation_status.get(msg.calculation_id)
+        except nats.js.errors.KeyNotFoundError:
+            # The calculation has never been submitted (or has been removed by garbage collection)
+            return msg_specs.CalculationStatusResponseNATS(
+                calculation_id=msg.calculation_id, status=CalculationStatusEnum.UNKNOWN
+            )
+        status = CalculationStatusDetails.model_validate_json(kv_entry.value).status
+        if executing_client is None or status in FINAL_CALCULATION_STATUSES:
+            return msg_specs.CalculationStatusResponseNATS(calculation_id=msg.calculation_id, status=status)
+
         client_inbox_prefix = executing_client.private_inbox_prefix
         subject = f"{client_inbox_prefix}.calc.status"
-        response = await self.nats_broker.publish(msg, subject, rpc=True)
+        try:
+            response = await self.nats_broker.publish(
+                msg, subject, rpc=True, rpc_timeout=settings.nats.rpc_timeout, raise_timeout=True
+            )
+        except (TimeoutError, nats.errors.Error) as exc:
+            # Fall back to the status most recently published by the client
+            logger.warning(f"No status from client {executing_client.client_id!r}: {exc!r}")
+            return msg_specs.CalculationStatusResponseNATS(calculation_id=msg.calculation_id, status=status)
         logger.debug(f"{executing_client.client_id} responded with {response=!r}")
-        # status = response["status"]
-        status_nats_kv = json.loads((await self.kv_calculation_status.get(msg.calculation_id)).value)
-        logger.debug(f"Calculation status in nats KV store is: {status_nats_kv!r}")
         return response
 
     async def update_calculation_status_in_db(
@@ -181,12 +442,23 @@ class QCrBoxServer(QCrBoxServerClientBase):
         logger.debug(
             f"Received NATS notification about calculation status update: {status_details!r} ({calculation_id=!r})"
         )
-        with settings.db.get_session() as session:
-            calculation_db: sql_models.CalculationDB = session.exec(
-                select(sql_models.CalculationDB).where(sql_models.CalculationDB.calculation_id == calculation_id)
-            ).one()
-            calculation_db.update_status(status_details.status, comment="NATS notification")
-            logger.debug("Updated calculation status in the database.")
+        self.status_broadcaster.publish(calculation_id, status_details)
+        if status_details.status in FINAL_CALCULATION_STATUSES:
+            self.scheduler.mark_finished(calculation_id)
+        async with settings.db.get_async_session() as session:
+            calculation_db: sql_models.CalculationDB | None = (
+                await session.exec(
+                    select(sql_models.CalculationDB).where(sql_models.CalculationDB.calculation_id == calculation_id)
+                )
+            ).one_or_none()
+        if calculation_db is None:
+            # E.g. a status left in the key-value store by a calculation from a previous database
+            logger.warning(f"Ignoring status update for unknown calculation: {calculation_id!r}")
+            return
+        await calculation_db.aupdate_status(status_details.status, comment="NATS notification")
+        logger.debug("Updated calculation status in the database.")
+        if output_data_files := status_details.extra_info.get("output_data_files"):
+            await calculation_db.aadd_output_data_files(output_data_files.values())
 
     def _set_up_asgi_server(self) -> None:
         self.asgi_server = Litestar(
@@ -209,6 +481,43 @@ class QCrBoxServer(QCrBoxServerClientBase):
         settings.db.create_db_and_tables(purge_existing_tables=purge_existing_db_tables)
         logger.info("Finished initialising database...")
 
+    @on_qcrbox_startup
+    async def restore_calculation_registry(self) -> None:
+        # Calculations that were dispatched before the restart count towards the quotas until they finish
+        unfinished_calculation_ids = set()
+        async for kv_entry in iter_nats_key_value_entries(self.kv_calculation_status):
+            try:
+                status = CalculationStatusDetails.model_validate_json(kv_entry.value).status
+            except pydantic.ValidationError:
+                continue
+            if status not in FINAL_CALCULATION_STATUSES:
+                unfinished_calculation_ids.add(kv_entry.key)
+
+        async for calc in self.calculations.restore():
+            if calc.is_cancelled:
+                continue
+            if calc.executing_client is None:
+                self.scheduler.enqueue(calc)
+                continue
+            if calc.awaiting_acknowledgement:
+                # The server was restarted before the client acknowledged the calculation, so whether it
+                # has received the calculation is unknown (any late acknowledgement will be rejected).
+                await self._requeue(calc)
+                continue
+            if calc.calculation_id in unfinished_calculation_ids:
+                self.scheduler.mark_running(calc)
+
+        logger.info(f"Restored scheduler state: {self.scheduler!r}")
+
+    @on_qcrbox_startup
+    async def start_garbage_collection(self) -> None:
+        if not settings.registry.server.garbage_collection.enabled:
+            return
+        if not self.garbage_collector.has_retention_policies:
+            logger.warning("Garbage collection is enabled, but no retention policies are configured.")
+            return
+        self.start_background_task(self.garbage_collector.run_periodically)
+
     @on_qcrbox_startup
     async def restore_previously_registered_applications(self) -> None:
         try:
@@ -0,0 +1,199 @@
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+
+import anyio
+
+from pyqcrbox import logger, msg_specs, settings
+from pyqcrbox.settings import SchedulerSettings
+from pyqcrbox.sql_models import CalculationPriorityEnum
+
+from .calculation_registry import CalculationDetails
+
+__all__ = ["CalculationScheduler"]
+
+ANONYMOUS_USER = "anonymous"
+
+
+class CalculationScheduler:
+    """
+    Decides which pending calculations are handed out to clients requesting work.
+
+    Calculations are queued per application, priority class and user. When a client
+    asks for work, higher priority classes are always served first. Within a priority
+    class, the user with the smallest number of running calculations relative to their
+    fair-share weight goes next (ties are broken in favour of the longest-waiting
+    calculation). Users and applications that have reached their concurrency quota are
+    skipped until one of their calculations finishes.
+    """
+
+    def __init__(self, scheduler_settings: Optional[SchedulerSettings] = None):
+        self.settings = scheduler_settings or settings.registry.server.scheduler
+
+        # application (slug, version) -> priority -> user -> queued calculations (in order of submission)
+        self._queues: dict[tuple[str, str], dict[CalculationPriorityEnum, dict[str, deque[CalculationDetails]]]] = {}
+        self._queued: dict[str, CalculationDetails] = {}
+        self._running: dict[str, CalculationDetails] = {}
+        self._num_running_per_user: Counter[str] = Counter()
+        self._num_running_per_application: Counter[str] = Counter()
+        self._num_dispatched: Counter[CalculationPriorityEnum] = Counter()
+        self._total_wait_time: Counter[CalculationPriorityEnum] = Counter()
+        self._new_calculation_event = anyio.Event()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {len(self._queued)} queued, {len(self._running)} running>"
+
+    def is_known(self, calculation_id: str) -> bool:
+        return calculation_id in self._queued or calculation_id in self._running
+
+    def enqueue(self, calc: CalculationDetails) -> None:
+        if self.is_known(calc.calculation_id):
+            logger.debug(f"Calculation {calc.calculation_id!r} is already known to the scheduler, ignoring.")
+            return
+
+        user = calc.user or ANONYMOUS_USER
+        app_queues = self._queues.setdefault((calc.application_slug, calc.application_version), {})
+        app_queues.setdefault(calc.priority, {}).setdefault(user, deque()).append(calc)
+        self._queued[calc.calculation_id] = calc
+
+        # Wake up anyone waiting for new calculations (anyio events cannot be reset, so we replace it)
+        self._new_calculation_event.set()
+        self._new_calculation_event = anyio.Event()
+
+    def remove(self, calculation_id: str) -> Optional[CalculationDetails]:
+        """
+        Remove a calculation from the queues (e.g. because it was cancelled) and return it.
+
+        Returns `None` if the calculation is not queued (for example because it has already
+        been dispatched to a client).
+        """
+        try:
+            calc = self._queued[calculation_id]
+        except KeyError:
+            return None
+        self._remove_from_queue(calc)
+        return calc
+
+    def _remove_from_queue(self, calc: CalculationDetails) -> None:
+        user = calc.user or ANONYMOUS_USER
+        priority_queues = self._queues[(calc.application_slug, calc.application_version)][calc.priority]
+        priority_queues[user].remove(calc)
+        if not priority_queues[user]:
+            del priority_queues[user]
+        del self._queued[calc.calculation_id]
+
+    def mark_running(self, calc: CalculationDetails) -> None:
+        """
+        Record a calculation that is being executed without having been dispatched by this
+        scheduler (e.g. because it was dispatched before the server was restarted).
+        """
+        if not self.is_known(calc.calculation_id):
+            self._start_running(calc)
+
+    def mark_finished(self, calculation_id: str) -> None:
+        try:
+            calc = self._running.pop(calculation_id)
+        except KeyError:
+            return
+        self._num_running_per_user[calc.user or ANONYMOUS_USER] -= 1
+        self._num_running_per_application[calc.application_slug] -= 1
+
+    async def wait_for_new_calculations(self, timeout: float) -> None:
+        with anyio.move_on_after(timeout):
+            await self._new_calculation_event.wait()
+
+    def select(
+        self,
+        application_slug: str,
+        application_version: str,
+        num_free_slots: int,
+        num_free_slots_per_command: Optional[dict[str, int]] = None,
+    ) -> list[CalculationDetails]:
+        """
+        Remove up to `num_free_slots` calculations for the given application from the queues
+        and return them, respecting any per-command limits of the requesting client.
+        """
+        num_free_slots_per_command = dict(num_free_slots_per_command or {})
+        selected = []
+        while len(selected) < num_free_slots:
+            calc = self._select_next(application_slug, application_version, num_free_slots_per_command)
+            if calc is None:
+                break
+            if calc.command_name in num_free_slots_per_command:
+                num_free_slots_per_command[calc.command_name] -= 1
+            selected.append(calc)
+
+        return selected
+
+    def _select_next(
+        self, application_slug: str, application_version: str, num_free_slots_per_command: dict[str, int]
+    ) -> Optional[CalculationDetails]:
+        max_for_application = self.settings.max_concurrent_calculations_per_application.get(application_slug)
+        if (
+            max_for_application is not None
+            and self._num_running_per_application[application_slug] >= max_for_application
+        ):
+            return None
+
+        app_queues = self._queues.get((application_slug, application_version), {})
+        for priority in CalculationPriorityEnum:
+            candidates = []
+            for user, queue in app_queues.get(priority, {}).items():
+                max_for_user = self.settings.get_max_concurrent_calculations_for_user(user)
+                if max_for_user is not None and self._num_running_per_user[user] >= max_for_user:
+                    continue
+                idx = next(
+                    (
+                        idx
+                        for (idx, calc) in enumerate(queue)
+                        if num_free_slots_per_command.get(calc.command_name, 1) > 0
+                    ),
+                    None,
+                )
+                if idx is not None:
+                    usage = self._num_running_per_user[user] / self.settings.get_user_weight(user)
+                    candidates.append((usage, queue[idx].submitted_at, user, idx))
+
+            if candidates:
+                _, _, user, idx = min(candidates)
+                queue = app_queues[priority][user]
+                calc = queue[idx]
+                self._remove_from_queue(calc)
+                self._start_running(calc)
+                self._num_dispatched[priority] += 1
+                self._total_wait_time[priority] += (datetime.now() - calc.submitted_at).total_seconds()
+                return calc
+
+        return None
+
+    def _start_running(self, calc: CalculationDetails) -> None:
+        self._running[calc.calculation_id] = calc
+        self._num_running_per_user[calc.user or ANONYMOUS_USER] += 1
+        self._num_running_per_application[calc.application_slug] += 1
+
+    def get_stats(self) -> msg_specs.SchedulerStatsResponseNATS:
+        now = datetime.now()
+        queues = []
+        for priority in CalculationPriorityEnum:
+            queued = [
+                calc
+                for app_queues in self._queues.values()
+                for queue in app_queues.get(priority, {}).values()
+                for calc in queue
+            ]
+            num_dispatched = self._num_dispatched[priority]
+            queues.append(
+                msg_specs.PriorityClassStatsNATS(
+                    priority=priority,
+                    num_queued=len(queued),
+                    num_running=sum(1 for calc in self._running.values() if calc.priority == priority),
+                    num_dispatched=num_dispatched,
+                    max_wait_time_queued=(
+                        max((now - calc.submitted_at).total_seconds() for calc in queued) if queued else None
+                    ),
+                    mean_wait_time_dispatched=(
+                        self._total_wait_time[priority] / num_dispatched if num_dispatched else None
+                    ),
+                )
+            )
+        return msg_specs.SchedulerStatsResponseNATS(queues=queues)
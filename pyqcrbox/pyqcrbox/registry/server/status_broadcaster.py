@@ -0,0 +1,73 @@
+import contextlib
+from collections import deque
+from typing import Iterator
+
+import anyio
+
+from pyqcrbox.sql_models import CalculationStatusDetails
+
+__all__ = ["CalculationStatusBroadcaster", "CalculationStatusSubscription"]
+
+
+class CalculationStatusSubscription:
+    """
+    Receives the status updates of a single calculation.
+
+    Only the most recent `max_pending` updates are kept if the subscriber cannot
+    keep up, so that a slow consumer never holds up the server.
+    """
+
+    def __init__(self, calculation_id: str, max_pending: int):
+        self.calculation_id = calculation_id
+        self._pending: deque[CalculationStatusDetails] = deque(maxlen=max_pending)
+        self._update_event = anyio.Event()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.calculation_id!r}, {len(self._pending)} pending>"
+
+    def put(self, status_details: CalculationStatusDetails) -> None:
+        self._pending.append(status_details)
+        self._update_event.set()
+
+    async def get(self) -> CalculationStatusDetails:
+        while not self._pending:
+            # anyio events cannot be reset, so we replace it
+            self._update_event = anyio.Event()
+            await self._update_event.wait()
+        return self._pending.popleft()
+
+
+class CalculationStatusBroadcaster:
+    """
+    Fans out calculation status updates to any number of in-process subscribers.
+
+    The server feeds this from its watch on the `calculation_status` key-value
+    bucket, so that clients following a calculation (e.g. via server-sent events)
+    don't need to poll the server or set up their own watches.
+    """
+
+    def __init__(self, max_pending_per_subscriber: int = 100):
+        self.max_pending_per_subscriber = max_pending_per_subscriber
+        self._subscriptions: dict[str, set[CalculationStatusSubscription]] = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.num_subscribers} subscribers>"
+
+    @property
+    def num_subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, calculation_id: str, status_details: CalculationStatusDetails) -> None:
+        for subscription in self._subscriptions.get(calculation_id, ()):
+            subscription.put(status_details)
+
+    @contextlib.contextmanager
+    def subscribe(self, calculation_id: str) -> Iterator[CalculationStatusSubscription]:
+        subscription = CalculationStatusSubscription(calculation_id, max_pending=self.max_pending_per_subscriber)
+        self._subscriptions.setdefault(calculation_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions[calculation_id].discard(subscription)
+            if not self._subscriptions[calculation_id]:
+                del self._subscriptions[calculation_id]
@@ -29,8 +29,8 @@ async def serve_qcrbox_homepage() -> Response:
 
 @get(path="/applications")
 async def serve_applications_page() -> Response:
-    applications = api_helpers._retrieve_applications()
-    commands = api_helpers._retrieve_commands()
+    applications, _ = await api_helpers._retrieve_applications()
+    commands, _ = await api_helpers._retrieve_commands()
     return render(
         "ApplicationsPage",
         applications=applications,
@@ -40,7 +40,7 @@ async def serve_applications_page() -> Response:
 
 @get(path="/command/{cmd_id:int}", media_type=MediaType.HTML)
 async def get_command_details(cmd_id: int) -> Response:
-    command = api_helpers._retrieve_command_by_id(cmd_id, raise_if_not_found=False)
+    command = await api_helpers._retrieve_command_by_id(cmd_id, raise_if_not_found=False)
     return render("CommandDetails", command=command)
 
 
@@ -63,7 +63,7 @@ async def handle_dataset_upload(
 ) -> Response:
     dataset_id = await api_helpers._import_dataset(data)
     dataset_info = await api_helpers._get_dataset_info(dataset_id)
-    applications = api_helpers._retrieve_applications()
+    applications, _ = await api_helpers._retrieve_applications()
     return render("DatasetUploadResponse", dataset_info=dataset_info, applications=applications)
 
 
@@ -1,2 +1,3 @@
 from .qcrbox_server_client_base import QCrBoxServerClientBase, TestQCrBoxServerClientBase, on_qcrbox_startup
 from .structlog_config import structlog_plugin
+from .work_queue import get_work_queue_stream, get_work_queue_subject, get_work_queue_subject_wildcard
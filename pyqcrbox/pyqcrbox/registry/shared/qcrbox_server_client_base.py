@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 import inspect
 from abc import ABCMeta, abstractmethod
@@ -16,7 +17,7 @@ from litestar.testing import AsyncTestClient, TestClient
 from loguru import logger
 
 from pyqcrbox import QCRBOX_SVCS_REGISTRY, settings
-from pyqcrbox.svcs import NatsPersistenceAdapter, SQLitePersistenceAdapter
+from pyqcrbox.svcs import NatsPersistenceAdapter, SQLitePersistenceAdapter, get_nats_handle_cache
 
 __all__ = ["QCrBoxServerClientBase", "TestQCrBoxServerClientBase"]
 
@@ -28,6 +29,12 @@ def on_qcrbox_startup(func):
     return func
 
 
+def _log_background_task_error(task: asyncio.Task) -> None:
+    # Nobody awaits background tasks, so any error they end with would otherwise go unnoticed
+    if not task.cancelled() and (exc := task.exception()) is not None:
+        logger.opt(exception=exc).error(f"Background task {task.get_name()!r} failed: {exc!r}")
+
+
 class QCrBoxServerClientBase(metaclass=ABCMeta):
     def __init__(
         self,
@@ -59,6 +66,7 @@ class QCrBoxServerClientBase(metaclass=ABCMeta):
         self._private_inbox = None  # will be created after NATS broker startup
         self._shutdown_event = anyio.Event()
         self._notification_events = {}
+        self._background_tasks: set[asyncio.Task] = set()
 
         self.calculations = {}
         self.kv_applications = None
@@ -123,8 +131,9 @@ class QCrBoxServerClientBase(metaclass=ABCMeta):
         )
 
     async def set_up_key_value_store(self):
-        self.kv_applications = await self.nats_broker.key_value(bucket="applications")
-        self.kv_calculation_status = await self.nats_broker.key_value(bucket="calculation_status")
+        nats_handle_cache = get_nats_handle_cache(self.nats_broker)
+        self.kv_applications = await nats_handle_cache.key_value("applications")
+        self.kv_calculation_status = await nats_handle_cache.key_value("calculation_status")
 
     async def _run_custom_shutdown_tasks(self):
         """
@@ -133,6 +142,23 @@ class QCrBoxServerClientBase(metaclass=ABCMeta):
         """
         pass
 
+    def start_background_task(self, func, *args) -> asyncio.Task:
+        """
+        Run `func(*args)` in the background for the remainder of the lifespan.
+
+        Any background tasks that are still running when the lifespan ends are cancelled.
+        """
+        task = asyncio.create_task(func(*args), name=func.__name__)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(_log_background_task_error)
+        return task
+
+    async def _cancel_background_tasks(self):
+        for task in list(self._background_tasks):
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
     async def execute_startup_hooks(self, **kwargs):
         for name in dir(self):
             func = getattr(self, name)
@@ -166,6 +192,9 @@ class QCrBoxServerClientBase(metaclass=ABCMeta):
         finally:
             with contextlib.suppress(KeyError):
                 # with anyio.CancelScope(shield=True):
+                logger.trace("Cancelling background tasks.")
+                await self._cancel_background_tasks()
+
                 logger.trace("Closing broker.")
                 # await self.broker.close()
                 await self.nats_broker.close()
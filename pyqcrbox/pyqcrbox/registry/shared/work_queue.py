@@ -0,0 +1,33 @@
+from faststream.nats import JStream
+from nats.js.api import RetentionPolicy, StorageType
+
+from pyqcrbox import helpers, settings
+
+__all__ = ["get_work_queue_stream", "get_work_queue_subject", "get_work_queue_subject_wildcard"]
+
+
+def get_work_queue_subject(application_slug: str, application_version: str) -> str:
+    slug_sanitized = helpers.sanitize_for_nats_subject(application_slug)
+    version_sanitized = helpers.sanitize_for_nats_subject(application_version)
+    return f"{settings.nats.work_queue_subject_prefix}.{slug_sanitized}.{version_sanitized}"
+
+
+def get_work_queue_subject_wildcard() -> str:
+    return f"{settings.nats.work_queue_subject_prefix}.>"
+
+
+def get_work_queue_stream() -> JStream:
+    """
+    Return the JetStream stream holding pending command invocations.
+
+    The stream uses work-queue retention, so each message is delivered to exactly one consumer
+    and removed once acknowledged. It is file-backed so that queued calculations survive restarts
+    of the NATS server, the QCrBox server and any clients. The stream is created automatically
+    (if it doesn't exist yet) when a subscriber using it is started.
+    """
+    return JStream(
+        name=settings.nats.work_queue_stream,
+        subjects=[get_work_queue_subject_wildcard()],
+        retention=RetentionPolicy.WORK_QUEUE,
+        storage=StorageType.FILE,
+    )
@@ -1,20 +1,32 @@
+import asyncio
+from weakref import WeakKeyDictionary
+
 import svcs
 from faststream.nats import NatsBroker
 
 from pyqcrbox import settings
-from pyqcrbox.data_management import DummyDataFileManager, QCrBoxDataFileManager
+from pyqcrbox.data_management import QCrBoxDataFileManager
 
 
 class DevelopmentServicesRegistry(svcs.Registry):
     def __init__(self):
         super().__init__()
 
-        # self.register_value(QCrBoxDataFileManager, QCrBoxDataFileManager())
-        self.register_value(QCrBoxDataFileManager, DummyDataFileManager())
-        self.register_factory(NatsBroker, self.create_nats_broker)
-
-    def create_nats_broker(self):
-        return NatsBroker(settings.nats.url, graceful_timeout=10, max_reconnect_attempts=1)
+        # A single data file manager is shared by the API and the server, so that they use the same store
+        self.register_value(QCrBoxDataFileManager, QCrBoxDataFileManager())
+        self.register_factory(NatsBroker, self.get_or_create_nats_broker)
+        self._nats_brokers: WeakKeyDictionary[asyncio.AbstractEventLoop, NatsBroker] = WeakKeyDictionary()
+
+    def get_or_create_nats_broker(self):
+        # All users within the same event loop share the same broker (and hence connection),
+        # rather than opening a new connection to the NATS server every time. The connection
+        # is bound to the event loop it was opened in, so it can't be shared across loops.
+        loop = asyncio.get_running_loop()
+        try:
+            return self._nats_brokers[loop]
+        except KeyError:
+            broker = NatsBroker(settings.nats.url, graceful_timeout=10, max_reconnect_attempts=1)
+            return self._nats_brokers.setdefault(loop, broker)
 
 
 def get_qcrbox_services_registry():
@@ -1,10 +1,10 @@
 from .application_spec import ApplicationSpec, ApplicationSpecWithCommands
 from .application_spec_db import ApplicationSpecDB
-from .base import QCrBoxBaseSQLModel, QCrBoxPydanticBaseModel
+from .base import QCrBoxBaseSQLModel, QCrBoxDBError, QCrBoxPydanticBaseModel
 from .calculation import CalculationDB, CalculationResponseModel
 from .calculation_status_event import CalculationStatusDetails, CalculationStatusEnum
 from .command_execution import CommandExecutionCreate
-from .command_invocation import CommandInvocationCreate
+from .command_invocation import CalculationPriorityEnum, CommandInvocationCreate
 from .command_spec import (
     CLICommandSpec,
     CommandSpec,
@@ -14,4 +14,14 @@ from .command_spec import (
     InteractiveCommandSpec,
     PythonCallableSpec,
 )
+from .data_file import (
+    CalculationDataFileLinkDB,
+    DataFileDB,
+    DataFileResponseModel,
+    DatasetDataFileLinkDB,
+    DatasetDB,
+    DatasetResponseModel,
+    UploadPartDB,
+    UploadSessionDB,
+)
 from .parameter_spec import ParameterSpec, ParameterSpecDiscriminatedUnion
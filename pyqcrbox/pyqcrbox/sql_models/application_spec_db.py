@@ -64,6 +64,24 @@ class ApplicationSpecDB(ApplicationSpecBase, SQLModel, table=True):
                 session.refresh(self)
                 return self
 
+    async def asave_to_db(self):
+        cls = self.__class__
+
+        async with settings.db.get_async_session() as session:
+            existing_application = (
+                await session.exec(select(cls).where(cls.slug == self.slug, cls.version == self.version))
+            ).one_or_none()
+            if existing_application is not None:
+                logger.debug(
+                    f"An application was registered before with slug={self.slug!r}, version={self.version!r}. "
+                    "Loading details from the previously stored data."
+                )
+                return existing_application
+
+            session.add(self)
+            await session.commit()
+            return self
+
     def to_response_model(self):
         from .application_spec import ApplicationSpecWithCommands
 
@@ -1,7 +1,19 @@
 from pydantic import BaseModel, ConfigDict
-from sqlmodel import SQLModel
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import JSON, SQLModel
 
-__all__ = ["QCrBoxPydanticBaseModel"]
+__all__ = ["QCrBoxDBError", "QCrBoxPydanticBaseModel"]
+
+
+# JSON stored in binary form by PostgreSQL, so that it can be compared, indexed and queried in the
+# database. Unlike plain JSON columns, the order of keys in objects is not preserved.
+QueryableJSON = JSON().with_variant(JSONB(), "postgresql")
+
+
+class QCrBoxDBError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
 
 
 class QCrBoxPydanticBaseModel(BaseModel):
@@ -1,39 +1,68 @@
 from datetime import datetime
-from typing import TYPE_CHECKING, Any, Optional, Self
+from typing import TYPE_CHECKING, Any, Iterable, Optional, Self
 
 import sqlalchemy
 from pydantic import computed_field, model_validator
-from sqlmodel import JSON, Column, Field, Relationship, UniqueConstraint, desc, select
+from sqlmodel import Column, Field, Index, Relationship, UniqueConstraint, desc, select, update
 
 from pyqcrbox import sql_models
+from pyqcrbox.helpers import is_data_file_id
 from pyqcrbox.logging import logger
 from pyqcrbox.settings import settings
 
-from .base import QCrBoxBaseSQLModel
+from .base import QCrBoxBaseSQLModel, QueryableJSON
 from .calculation_status_event import CalculationStatusEnum, CalculationStatusEventDB
 from .command_spec import CommandSpecDB
+from .data_file import CalculationDataFileLinkDB
 
 if TYPE_CHECKING:
     from .application_spec_db import ApplicationSpecDB
 
 
+def get_data_file_ids_in_arguments(arguments: dict[str, Any]) -> set[str]:
+    data_file_ids = set()
+    for value in arguments.values():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        data_file_ids.update(v for v in values if is_data_file_id(v))
+    return data_file_ids
+
+
 class CalculationBase(QCrBoxBaseSQLModel):
     calculation_id: str
     application_slug: str
     application_version: str
     command_name: str
-    arguments: dict[str, Any] = Field(sa_column=Column(JSON))
+    arguments: dict[str, Any] = Field(sa_column=Column(QueryableJSON))
 
 
 class CalculationResponseModel(CalculationBase):
     status: str
+    user: Optional[str] = None
+    submitted_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
 
 class CalculationDB(CalculationBase, table=True):
     __tablename__ = "calculation"
-    __table_args__ = (UniqueConstraint("calculation_id"),)
+    __table_args__ = (
+        UniqueConstraint("calculation_id"),
+        # Listing (or garbage collecting) calculations by status, ordered by when they were last updated
+        Index("ix_calculation_current_status_updated_at", "current_status", "updated_at"),
+        # Listing calculations newest first (see `api_helpers._get_calculation_info()`), optionally filtered
+        Index("ix_calculation_timestamp_id", "timestamp", "id"),
+        Index("ix_calculation_current_status_timestamp", "current_status", "timestamp"),
+        Index("ix_calculation_application_slug_timestamp", "application_slug", "timestamp"),
+        Index("ix_calculation_application_version_timestamp", "application_version", "timestamp"),
+        Index("ix_calculation_command_name_timestamp", "command_name", "timestamp"),
+        Index("ix_calculation_user_timestamp", "user", "timestamp"),
+    )
 
     timestamp: datetime = Field(default_factory=datetime.now)
+    user: Optional[str] = None
+    # Copy of the latest status event (kept in sync by `update_status()`), so that the status
+    # of any number of calculations can be retrieved without looking at their status events
+    current_status: CalculationStatusEnum = CalculationStatusEnum.UNKNOWN
+    updated_at: datetime = Field(default_factory=datetime.now)
     status_events: list[CalculationStatusEventDB] = Relationship(back_populates="calculation")
     id: Optional[int] = Field(default=None, primary_key=True)
 
@@ -70,19 +99,15 @@ class CalculationDB(CalculationBase, table=True):
     @computed_field
     @property
     def status(self) -> CalculationStatusEnum:
-        with settings.db.get_session() as session:
-            # event = self._get_latest_status_event(session)
-            event = self._get_latest_status_event(session, create_if_not_exists=False)
-            if event:
-                status = event.status
-            else:
-                logger.warning(f"Unknown calculation status: {self.calculation_id!r}")
-                status = CalculationStatusEnum.UNKNOWN
-        return status
+        return self.current_status
 
     def get_status_events(self) -> list[CalculationStatusEventDB]:
         with settings.db.get_session() as session:
-            events = session.exec(select(CalculationStatusEventDB).order_by(CalculationStatusEventDB.timestamp)).all()
+            events = session.exec(
+                select(CalculationStatusEventDB)
+                .where(CalculationStatusEventDB.calculation_id == self.id)
+                .order_by(CalculationStatusEventDB.timestamp)
+            ).all()
         return events
 
     def get_status_values(self) -> list[CalculationStatusEnum]:
@@ -105,6 +130,9 @@ class CalculationDB(CalculationBase, table=True):
                 status=CalculationStatusEnum.SUBMITTED,
             )
             session.add(initial_status_event)
+            self.current_status = initial_status_event.status
+            self.updated_at = initial_status_event.timestamp
+            session.add(self)
             session.commit()
             session.refresh(initial_status_event)
 
@@ -116,11 +144,73 @@ class CalculationDB(CalculationBase, table=True):
         logger.debug(f"Creating new status event for calculation {self.calculation_id}")
         new_status = CalculationStatusEnum(new_status)
 
+        timestamp = datetime.now()
         with settings.db.get_session() as session:
-            status_event = CalculationStatusEventDB(calculation_id=self.id, status=new_status, comment=comment)
-            session.add(status_event)
+            session.add(self._new_status_event(new_status, comment, timestamp))
+            # The current status is updated in the same transaction, so it always matches the latest status event
+            session.exec(self._current_status_update(new_status, timestamp))
             session.commit()
 
+        self.current_status = new_status
+        self.updated_at = timestamp
+
+    async def aupdate_status(self, new_status: CalculationStatusEnum | str, comment: str = ""):
+        logger.debug(f"Creating new status event for calculation {self.calculation_id}")
+        new_status = CalculationStatusEnum(new_status)
+
+        timestamp = datetime.now()
+        async with settings.db.get_async_session() as session:
+            session.add(self._new_status_event(new_status, comment, timestamp))
+            await session.exec(self._current_status_update(new_status, timestamp))
+            await session.commit()
+
+        self.current_status = new_status
+        self.updated_at = timestamp
+
+    def _new_status_event(
+        self, new_status: CalculationStatusEnum, comment: str, timestamp: datetime
+    ) -> CalculationStatusEventDB:
+        return CalculationStatusEventDB(calculation_id=self.id, status=new_status, comment=comment, timestamp=timestamp)
+
+    def _current_status_update(self, new_status: CalculationStatusEnum, timestamp: datetime):
+        return (
+            update(CalculationDB)
+            .where(CalculationDB.id == self.id)
+            .values(current_status=new_status, updated_at=timestamp)
+        )
+
+    def add_output_data_files(self, qcrbox_file_ids: Iterable[str]) -> None:
+        with settings.db.get_session() as session:
+            self._add_data_file_references(session, self.id, qcrbox_file_ids, is_output=True)
+            session.commit()
+
+    async def aadd_output_data_files(self, qcrbox_file_ids: Iterable[str]) -> None:
+        async with settings.db.get_async_session() as session:
+            await self._aadd_data_file_references(session, self.id, qcrbox_file_ids, is_output=True)
+            await session.commit()
+
+    @staticmethod
+    def _add_data_file_references(
+        session, calculation_db_id: int, qcrbox_file_ids: Iterable[str], is_output: bool = False
+    ) -> None:
+        for qcrbox_file_id in qcrbox_file_ids:
+            session.merge(
+                CalculationDataFileLinkDB(
+                    calculation_id=calculation_db_id, qcrbox_file_id=qcrbox_file_id, is_output=is_output
+                )
+            )
+
+    @staticmethod
+    async def _aadd_data_file_references(
+        session, calculation_db_id: int, qcrbox_file_ids: Iterable[str], is_output: bool = False
+    ) -> None:
+        for qcrbox_file_id in qcrbox_file_ids:
+            await session.merge(
+                CalculationDataFileLinkDB(
+                    calculation_id=calculation_db_id, qcrbox_file_id=qcrbox_file_id, is_output=is_output
+                )
+            )
+
     def save_to_db(self):
         with settings.db.get_session() as session:
             session.add(self)
@@ -157,10 +247,101 @@ class CalculationDB(CalculationBase, table=True):
 
             # _ = self._get_latest_status_event(session)
 
+            session.commit()
+            session.refresh(self)
+
+            # Keep the input data files around for as long as the calculation itself
+            self._add_data_file_references(session, self.id, get_data_file_ids_in_arguments(self.arguments))
             session.commit()
             session.refresh(self)
             return self
 
+    @classmethod
+    def save_many_to_db(cls, calculations: list["CalculationDB"]) -> None:
+        """
+        Save multiple calculations in a single transaction.
+
+        Each distinct command is only looked up once, regardless of how many
+        calculations in the batch refer to it.
+        """
+        commands = {}
+        with settings.db.get_session() as session:
+            for calc in calculations:
+                key = (calc.application_slug, calc.application_version, calc.command_name)
+                if key not in commands:
+                    commands[key] = session.exec(cls._command_query(*key)).one_or_none()
+                    if commands[key] is None:
+                        logger.debug(f"Warning: could not find command {calc.command_name!r} for {key[:2]!r}.")
+
+                if (command := commands[key]) is not None:
+                    calc.command_id = command.id
+                    calc.application_id = command.application_id
+                session.add(calc)
+
+            session.flush()
+            for calc in calculations:
+                calc._add_data_file_references(session, calc.id, get_data_file_ids_in_arguments(calc.arguments))
+            session.commit()
+        logger.debug(f"Saved {len(calculations)} calculations to the database.")
+
+    @classmethod
+    async def asave_many_to_db(cls, calculations: list["CalculationDB"]) -> dict[str, str]:
+        """
+        Save multiple calculations in a single transaction (without blocking the event loop).
+
+        Each calculation is saved in its own savepoint, so that one which can't be saved
+        doesn't prevent the others from being saved. Returns the error message for each
+        calculation that could not be saved (by calculation id).
+        """
+        commands = {}
+        errors = {}
+        async with settings.db.get_async_session() as session:
+            for calc in calculations:
+                key = (calc.application_slug, calc.application_version, calc.command_name)
+                try:
+                    async with session.begin_nested():
+                        if key not in commands:
+                            commands[key] = (await session.exec(cls._command_query(*key))).one_or_none()
+                            if commands[key] is None:
+                                logger.debug(f"Warning: could not find command {calc.command_name!r} for {key[:2]!r}.")
+
+                        if (command := commands[key]) is not None:
+                            calc.command_id = command.id
+                            calc.application_id = command.application_id
+                        session.add(calc)
+                        await session.flush()
+                        await calc._aadd_data_file_references(
+                            session, calc.id, get_data_file_ids_in_arguments(calc.arguments)
+                        )
+                except sqlalchemy.exc.SQLAlchemyError as exc:
+                    # The underlying driver error is much more readable than the full statement and parameters
+                    error_msg = f"Could not save calculation to the database: {getattr(exc, 'orig', None) or exc}"
+                    logger.warning(f"{error_msg} (calculation_id: {calc.calculation_id!r})")
+                    errors[calc.calculation_id] = error_msg
+            await session.commit()
+        logger.debug(f"Saved {len(calculations) - len(errors)} calculations to the database.")
+        return errors
+
+    async def asave_to_db(self) -> Self:
+        """
+        Save the calculation (without blocking the event loop), raising QCrBoxDBError if that fails.
+        """
+        if errors := await self.asave_many_to_db([self]):
+            raise sql_models.QCrBoxDBError(errors[self.calculation_id])
+        return self
+
+    @staticmethod
+    def _command_query(application_slug: str, application_version: str, command_name: str):
+        return (
+            select(CommandSpecDB)
+            .join(sql_models.ApplicationSpecDB)
+            .where(
+                sql_models.ApplicationSpecDB.slug == application_slug,
+                sql_models.ApplicationSpecDB.version == application_version,
+                CommandSpecDB.name == command_name,
+            )
+        )
+
     def to_response_model(self) -> CalculationResponseModel:
         # breakpoint()
         # calculation_id = self.id
@@ -190,6 +371,8 @@ class CalculationDB(CalculationBase, table=True):
                 "application_version",
                 "command_name",
                 "arguments",
+                "user",
+                "updated_at",
             ]
         )
-        return CalculationResponseModel(**data)
+        return CalculationResponseModel(**data, submitted_at=self.timestamp)
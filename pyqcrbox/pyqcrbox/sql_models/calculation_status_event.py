@@ -3,7 +3,7 @@ from enum import StrEnum
 from typing import TYPE_CHECKING
 
 from pydantic import BaseModel
-from sqlmodel import Field, Relationship
+from sqlmodel import Field, Index, Relationship
 
 from .base import QCrBoxBaseSQLModel
 
@@ -31,6 +31,8 @@ class CalculationStatusDetails(BaseModel):
 
 class CalculationStatusEventDB(QCrBoxBaseSQLModel, table=True):
     __tablename__ = "calculation_status_event"
+    # Looking up the status history of a calculation (in chronological order)
+    __table_args__ = (Index("ix_calculation_status_event_calculation_id_timestamp", "calculation_id", "timestamp"),)
 
     id: int | None = Field(default=None, primary_key=True)
     timestamp: datetime = Field(default_factory=datetime.now)
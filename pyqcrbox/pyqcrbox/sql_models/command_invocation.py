@@ -1,15 +1,24 @@
-from typing import Any
+from enum import StrEnum
+from typing import Any, Optional
 
 from pyqcrbox import helpers
 
 from .base import QCrBoxPydanticBaseModel
 
 
+class CalculationPriorityEnum(StrEnum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+
 class CommandInvocationCreate(QCrBoxPydanticBaseModel):
     application_slug: str | None
     application_version: str | None
     command_name: str
     arguments: dict[str, Any]
+    priority: CalculationPriorityEnum = CalculationPriorityEnum.NORMAL
+    user: Optional[str] = None
     # correlation_id: str = Field(default_factory=helpers.generate_correlation_id)
 
     @property
@@ -19,6 +19,7 @@ class BaseCommandSpec(QCrBoxPydanticBaseModel):
     parameters: list[ParameterSpecDiscriminatedUnion]
     merge_cif_su: bool = False
     doi: str | None = None
+    max_concurrent_calculations: int | None = None
 
     @property
     def is_python_callable(self) -> bool:
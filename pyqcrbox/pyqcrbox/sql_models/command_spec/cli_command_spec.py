@@ -1,5 +1,7 @@
 from typing import Literal
 
+from pydantic import ByteSize, Field, NonNegativeInt, PositiveFloat
+
 from .base_command_spec import BaseCommandSpec
 from .call_pattern import CallPattern
 
@@ -9,3 +11,9 @@ __all__ = ["CLICommandSpec"]
 class CLICommandSpec(BaseCommandSpec):
     implemented_as: Literal["cli_command"] = "cli_command"
     call_pattern: CallPattern
+
+    # Optional resource limits, enforced by the client executing the command
+    timeout: PositiveFloat | None = None  # wall-clock time limit (in seconds)
+    max_memory: ByteSize | None = None  # address space limit, e.g. "4GiB"
+    cpu_affinity: list[NonNegativeInt] | None = None  # CPU cores the command may run on
+    nice: int | None = Field(default=None, ge=0, le=19)
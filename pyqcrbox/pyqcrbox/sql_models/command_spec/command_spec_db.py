@@ -22,9 +22,15 @@ class CommandSpecDB(QCrBoxBaseSQLModel, table=True):
     merge_cif_su: bool = False
     implemented_as: ImplementedAs
     doi: str | None = None
+    max_concurrent_calculations: int | None = None
 
     # for CLI commands
     call_pattern: str | None = None
+    timeout: float | None = None
+    max_memory: int | None = None
+    cpu_affinity: list[int] | None = Field(default=None, sa_type=JSON)
+    nice: int | None = None
+    # Plain JSON (rather than `QueryableJSON`) so that PostgreSQL keeps the parameters in their original order
     parameters: dict[Any, Any] = Field(sa_type=JSON)
 
     # for Python callables
@@ -44,7 +50,15 @@ class CommandSpecDB(QCrBoxBaseSQLModel, table=True):
     def model_dump(self, as_response_model=False, **kwargs):
         if as_response_model:
             assert "exclude" not in kwargs
-            kwargs["exclude"] = ["call_pattern", "callable_name", "import_path"]
+            kwargs["exclude"] = [
+                "call_pattern",
+                "timeout",
+                "max_memory",
+                "cpu_affinity",
+                "nice",
+                "callable_name",
+                "import_path",
+            ]
 
         data = super().model_dump(**kwargs)
         data["application"] = self.application.slug
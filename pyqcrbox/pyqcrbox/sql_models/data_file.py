@@ -0,0 +1,123 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import BigInteger, Field, Index, Relationship, UniqueConstraint
+
+from .base import QCrBoxBaseSQLModel
+
+
+class DataFileBase(QCrBoxBaseSQLModel):
+    qcrbox_file_id: str
+    filename: Optional[str] = Field(default=None, index=True)
+    filetype: str = Field(default="", index=True)
+    size: int = Field(index=True, sa_type=BigInteger)  # bytes (data files can be larger than 2 GiB)
+    sha256: str = Field(index=True)
+    uploaded_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+class DataFileResponseModel(DataFileBase):
+    pass
+
+
+class DatasetDataFileLinkDB(QCrBoxBaseSQLModel, table=True):
+    __tablename__ = "dataset_data_file"
+
+    dataset_id: int = Field(foreign_key="dataset.id", primary_key=True)
+    data_file_id: int = Field(foreign_key="data_file.id", primary_key=True, index=True)
+    position: int = 0
+
+
+class CalculationDataFileLinkDB(QCrBoxBaseSQLModel, table=True):
+    """
+    Records that a calculation uses (or produced) a data file, which protects the
+    data file from garbage collection for as long as the calculation is retained.
+
+    Data files are referenced by their id rather than their catalogue entry, because
+    a calculation may be submitted before its input files are known to the catalogue.
+    """
+
+    __tablename__ = "calculation_data_file"
+
+    calculation_id: int = Field(foreign_key="calculation.id", primary_key=True)
+    qcrbox_file_id: str = Field(primary_key=True, index=True)
+    is_output: bool = False
+
+
+class DataFileDB(DataFileBase, table=True):
+    """
+    Catalogue entry for a data file stored in the object store.
+
+    This holds all the metadata needed to list, filter and paginate data files, so
+    that none of these operations need to touch the object store itself.
+    """
+
+    __tablename__ = "data_file"
+    __table_args__ = (
+        UniqueConstraint("qcrbox_file_id"),
+        # Listing is newest-first, optionally restricted to a single file type
+        Index("ix_data_file_filetype_uploaded_at", "filetype", "uploaded_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    def to_response_model(self) -> DataFileResponseModel:
+        return DataFileResponseModel(**self.model_dump(exclude={"id"}))
+
+
+class DatasetResponseModel(QCrBoxBaseSQLModel):
+    dataset_id: str
+    created_at: datetime
+    data_files: list[DataFileResponseModel]
+
+
+class DatasetDB(QCrBoxBaseSQLModel, table=True):
+    __tablename__ = "dataset"
+    __table_args__ = (UniqueConstraint("dataset_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    dataset_id: str
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+    data_files: list[DataFileDB] = Relationship(
+        link_model=DatasetDataFileLinkDB,
+        sa_relationship_kwargs={"order_by": "DatasetDataFileLinkDB.position", "lazy": "selectin"},
+    )
+
+    def to_response_model(self) -> DatasetResponseModel:
+        return DatasetResponseModel(
+            dataset_id=self.dataset_id,
+            created_at=self.created_at,
+            data_files=[data_file.to_response_model() for data_file in self.data_files],
+        )
+
+
+class UploadSessionDB(QCrBoxBaseSQLModel, table=True):
+    """
+    A data file which is being uploaded in parts (which may arrive in any order and can be retried).
+
+    The expected size and SHA-256 digest are optional; if given, the assembled contents are verified against them.
+    """
+
+    __tablename__ = "upload_session"
+    __table_args__ = (UniqueConstraint("upload_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    upload_id: str
+    filename: Optional[str] = None
+    size: Optional[int] = Field(default=None, sa_type=BigInteger)
+    sha256: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+    parts: list["UploadPartDB"] = Relationship(
+        sa_relationship_kwargs={"order_by": "UploadPartDB.part_number", "lazy": "selectin"},
+    )
+
+
+class UploadPartDB(QCrBoxBaseSQLModel, table=True):
+    __tablename__ = "upload_part"
+
+    upload_session_id: int = Field(foreign_key="upload_session.id", primary_key=True)
+    part_number: int = Field(primary_key=True)
+    size: int = Field(sa_type=BigInteger)
+    sha256: str
+    uploaded_at: datetime = Field(default_factory=datetime.now)
@@ -1,2 +1,3 @@
-from .helper_functions import QCRBOX_SVCS_REGISTRY, get_nats_broker, get_nats_key_value
+from .helper_functions import QCRBOX_SVCS_REGISTRY, get_nats_broker, get_nats_key_value, iter_nats_key_value_entries
+from .nats_handle_cache import NatsHandleCache, get_nats_handle_cache
 from .persistence import NatsPersistenceAdapter, SQLitePersistenceAdapter
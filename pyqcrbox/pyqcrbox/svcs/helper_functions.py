@@ -1,8 +1,13 @@
+from typing import AsyncIterator
+
 import svcs
 
 __all__ = ["QCRBOX_SVCS_REGISTRY"]
 
 from faststream.nats import NatsBroker
+from nats.js.kv import KeyValue
+
+from .nats_handle_cache import get_nats_handle_cache
 
 QCRBOX_SVCS_REGISTRY = svcs.Registry()
 
@@ -15,4 +20,21 @@ async def get_nats_broker():
 
 async def get_nats_key_value(bucket: str):
     nats_broker = await get_nats_broker()
-    return await nats_broker.key_value(bucket=bucket)
+    return await get_nats_handle_cache(nats_broker).key_value(bucket)
+
+
+async def iter_nats_key_value_entries(kv: KeyValue, ignore_deletes: bool = True) -> AsyncIterator[KeyValue.Entry]:
+    """
+    Yield the current entries of a NATS key-value bucket (least recently updated first).
+
+    The entries are streamed through a single watcher rather than looked up one key at a time.
+    Unless `ignore_deletes` is false, the delete markers of deleted keys are left out.
+    """
+    watcher = await kv.watchall(ignore_deletes=ignore_deletes)
+    try:
+        async for kv_entry in watcher:
+            if kv_entry is None:  # marks the end of the entries that existed when the watch started
+                return
+            yield kv_entry
+    finally:
+        await watcher.stop()
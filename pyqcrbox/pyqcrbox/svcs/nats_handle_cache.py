@@ -0,0 +1,85 @@
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from faststream.nats import NatsBroker
+from nats.js.api import KeyValueConfig
+from nats.js.kv import KeyValue
+from nats.js.object_store import ObjectStore
+
+from pyqcrbox.logging import logger
+
+__all__ = ["NatsHandleCache", "get_nats_handle_cache"]
+
+
+class NatsHandleCache:
+    """
+    Caches the handles of key-value buckets and object stores for a NATS broker.
+
+    Looking up (or declaring) a bucket requires a JetStream round trip, so the handles
+    are kept for as long as the broker's connection stays up. They are discarded whenever
+    the broker reconnects or is restarted, so that the buckets are declared again (which
+    matters if they were lost, e.g. because the NATS server was restarted).
+    """
+
+    def __init__(self, nats_broker: NatsBroker):
+        self.nats_broker = nats_broker
+        self._key_values: dict[str, KeyValue] = {}
+        self._object_stores: dict[str, ObjectStore] = {}
+        self._connection_state: Optional[tuple[int, int]] = None
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__}: key_values={sorted(self._key_values)}, "
+            f"object_stores={sorted(self._object_stores)}>"
+        )
+
+    def invalidate(self) -> None:
+        self._key_values.clear()
+        self._object_stores.clear()
+
+    def _invalidate_if_reconnected(self) -> None:
+        # The broker does not expose its underlying connection (or any reconnection events) publicly,
+        # but the NATS client keeps track of the number of reconnects.
+        connection = self.nats_broker._connection
+        connection_state = (id(connection), connection.stats["reconnects"]) if connection is not None else None
+        if connection_state != self._connection_state:
+            if self._connection_state is not None:
+                logger.debug("NATS broker has reconnected, discarding cached bucket handles.")
+            self.invalidate()
+            self._connection_state = connection_state
+
+    async def key_value(self, bucket: str) -> KeyValue:
+        self._invalidate_if_reconnected()
+        try:
+            return self._key_values[bucket]
+        except KeyError:
+            pass
+
+        await self.nats_broker.connect()
+        kv = await self.nats_broker.stream.create_key_value(config=KeyValueConfig(bucket=bucket))
+        self._invalidate_if_reconnected()
+        self._key_values[bucket] = kv
+        return kv
+
+    async def object_store(self, bucket: str) -> ObjectStore:
+        self._invalidate_if_reconnected()
+        try:
+            return self._object_stores[bucket]
+        except KeyError:
+            pass
+
+        await self.nats_broker.connect()
+        object_store = await self.nats_broker.stream.create_object_store(bucket=bucket)
+        self._invalidate_if_reconnected()
+        self._object_stores[bucket] = object_store
+        return object_store
+
+
+_handle_caches: WeakKeyDictionary[NatsBroker, NatsHandleCache] = WeakKeyDictionary()
+
+
+def get_nats_handle_cache(nats_broker: NatsBroker) -> NatsHandleCache:
+    try:
+        return _handle_caches[nats_broker]
+    except KeyError:
+        return _handle_caches.setdefault(nats_broker, NatsHandleCache(nats_broker))
@@ -38,4 +38,4 @@ class NatsPersistenceAdapter(BasePersistenceAdapter):
 class SQLitePersistenceAdapter(BasePersistenceAdapter):
     async def save_application_spec(self, application_spec: "ApplicationSpec") -> None:
         application_spec_db = ApplicationSpecDB.from_pydantic_model(application_spec)
-        application_spec_db.save_to_db()
+        await application_spec_db.asave_to_db()
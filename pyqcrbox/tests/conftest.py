@@ -1,7 +1,9 @@
-import pytest
-
 from pathlib import Path
 
+import httpx
+import pytest
+from litestar import Litestar
+
 
 @pytest.fixture(scope="session")
 def anyio_backend():
@@ -16,3 +18,13 @@ def sample_data_dir():
 @pytest.fixture(scope="session")
 def sample_cif_file(sample_data_dir):
     return sample_data_dir.joinpath("periodic_table.cif")
+
+
+@pytest.fixture
+async def api_client():
+    from pyqcrbox.registry.server.api.api_endpoints import api_router
+
+    # Unlike litestar's test client, this handles concurrent requests concurrently
+    transport = httpx.ASGITransport(app=Litestar(route_handlers=[api_router]))
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        yield client
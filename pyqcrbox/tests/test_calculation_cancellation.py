@@ -0,0 +1,126 @@
+import uuid
+
+import anyio
+import pytest
+
+from pyqcrbox import msg_specs, settings
+from pyqcrbox.registry.client import qcrbox_client
+from pyqcrbox.registry.server import QCrBoxServer
+from pyqcrbox.registry.server.calculation_registry import CalculationDetails, CalculationRegistry
+from pyqcrbox.services import get_nats_broker
+from pyqcrbox.sql_models import CalculationStatusEnum
+
+from .test_command_execution import get_published_status, make_client, make_execution_request
+from .test_work_dispatch import make_work_request
+
+
+@pytest.mark.anyio
+async def test_cancelling_a_queued_calculation_removes_it_from_the_queue():
+    broker = await get_nats_broker()
+    server = QCrBoxServer(nats_broker=broker)
+    bucket = f"test_calculations_{uuid.uuid4().hex}"
+    server.calculations = CalculationRegistry(broker, bucket=bucket)
+    calc = CalculationDetails(
+        calculation_id=f"calc_{uuid.uuid4().hex}",
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="greet_and_sleep",
+        arguments={},
+    )
+    await server.calculations.add(calc)
+    server.scheduler.enqueue(calc)
+
+    response = await server.handle_calculation_cancellation(
+        msg_specs.CancelCalculationNATS(calculation_id=calc.calculation_id)
+    )
+    assert response.status == msg_specs.ResponseStatusEnum.OK
+    assert (await get_published_status(calc.calculation_id)).status == CalculationStatusEnum.CANCELLED
+    assert (await CalculationRegistry(broker, bucket=bucket).get(calc.calculation_id)).is_cancelled
+    assert (await server.handle_work_request(make_work_request("client_a"))).jobs == []
+
+    response = await server.handle_calculation_cancellation(
+        msg_specs.CancelCalculationNATS(calculation_id=calc.calculation_id)
+    )
+    assert response.status == msg_specs.ResponseStatusEnum.ERROR
+
+    await broker.stream.delete_key_value(bucket)
+
+
+async def start_command_execution(client, msg, task_group) -> anyio.Event:
+    finished = anyio.Event()
+
+    async def execute():
+        await client.handle_command_execution(msg)
+        finished.set()
+
+    client.status.set_pending(msg.calculation_id, msg.command_name)
+    task_group.start_soon(execute)
+    return finished
+
+
+@pytest.mark.anyio
+async def test_cancelling_a_running_calculation_terminates_it_and_releases_its_slot(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings.registry.client, "scratch_dir", tmp_path)
+    client = make_client("sleep 30 && cat {input_cif}")
+    input_file_id = await client.data_file_manager.import_bytes(b"data_test\n", filename="test.cif")
+    msg = make_execution_request(input_file_id)
+
+    with anyio.fail_after(10):
+        async with anyio.create_task_group() as tg:
+            finished = await start_command_execution(client, msg, tg)
+            while msg.calculation_id not in client.calculations:
+                await anyio.sleep(0.01)
+
+            response = await client.cancel_calculation(
+                msg_specs.CancelCalculationNATS(calculation_id=msg.calculation_id)
+            )
+            assert response.status == msg_specs.ResponseStatusEnum.OK
+            await finished.wait()
+
+    assert (await get_published_status(msg.calculation_id)).status == CalculationStatusEnum.CANCELLED
+    assert client.status.num_free_slots == 1
+    assert client.calculations == {}
+
+    await client.data_file_manager.delete(input_file_id)
+
+
+@pytest.mark.anyio
+async def test_calculation_cancelled_while_being_started_is_cancelled_once_it_has_started(tmp_path, monkeypatch):
+    """
+    Test that a cancellation request arriving after the client has accepted a calculation,
+    but before the calculation has been launched, is not lost.
+    """
+    monkeypatch.setattr(settings.registry.client, "scratch_dir", tmp_path)
+    client = make_client("sleep 30 && cat {input_cif}")
+    input_file_id = await client.data_file_manager.import_bytes(b"data_test\n", filename="test.cif")
+    msg = make_execution_request(input_file_id)
+
+    staging_started = anyio.Event()
+    cancellation_requested = anyio.Event()
+    stage_inputs = qcrbox_client.DataFileStaging.stage_inputs
+
+    async def stage_inputs_until_cancellation_is_requested(self):
+        staging_started.set()
+        await cancellation_requested.wait()
+        return await stage_inputs(self)
+
+    monkeypatch.setattr(qcrbox_client.DataFileStaging, "stage_inputs", stage_inputs_until_cancellation_is_requested)
+
+    with anyio.fail_after(10):
+        async with anyio.create_task_group() as tg:
+            finished = await start_command_execution(client, msg, tg)
+            await staging_started.wait()
+
+            response = await client.cancel_calculation(
+                msg_specs.CancelCalculationNATS(calculation_id=msg.calculation_id)
+            )
+            assert response.status == msg_specs.ResponseStatusEnum.OK
+            assert response.msg == "Cancellation requested"
+            cancellation_requested.set()
+            await finished.wait()
+
+    assert (await get_published_status(msg.calculation_id)).status == CalculationStatusEnum.CANCELLED
+    assert client.status.num_free_slots == 1
+    assert client._pending_cancellations == set()
+
+    await client.data_file_manager.delete(input_file_id)
@@ -0,0 +1,190 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy
+from sqlmodel import select
+
+from pyqcrbox import settings
+from pyqcrbox.registry.server.api.api_helpers import _get_calculation_info
+from pyqcrbox.sql_models import CalculationDB, CalculationStatusEnum, QCrBoxDBError
+
+
+def test_current_status_is_kept_in_sync_with_status_events():
+    calculation_id = f"calc_db_{uuid.uuid4().hex}"
+    calculation_db = CalculationDB(
+        calculation_id=calculation_id,
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="greet_and_sleep",
+        arguments={},
+    )
+    with settings.db.get_session(init_db=True) as session:
+        session.add(calculation_db)
+        session.commit()
+        session.refresh(calculation_db)
+
+    assert calculation_db.status == CalculationStatusEnum.UNKNOWN
+    calculation_db.update_status(CalculationStatusEnum.RUNNING)
+    calculation_db.update_status(CalculationStatusEnum.SUCCESSFUL)
+
+    with settings.db.get_session() as session:
+        stored_calculation = session.exec(
+            select(CalculationDB).where(CalculationDB.calculation_id == calculation_id)
+        ).one()
+        assert stored_calculation.current_status == CalculationStatusEnum.SUCCESSFUL
+        assert stored_calculation.get_status_values() == [
+            CalculationStatusEnum.RUNNING,
+            CalculationStatusEnum.SUCCESSFUL,
+        ]
+        assert stored_calculation.updated_at == stored_calculation.get_status_events()[-1].timestamp
+
+
+@pytest.mark.anyio
+async def test_listing_calculations_needs_a_single_query():
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = settings.db.get_async_engine().sync_engine
+    sqlalchemy.event.listen(engine, "before_cursor_execute", record_statement)
+    try:
+        calculations, _ = await _get_calculation_info(limit=50)
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", record_statement)
+
+    assert calculations
+    assert len(statements) == 1
+
+
+@pytest.mark.anyio
+async def test_calculations_are_filtered_and_paginated_in_the_database():
+    user = f"user_{uuid.uuid4().hex}"
+    submitted_at = datetime(2024, 1, 1)
+    with settings.db.get_session(init_db=True) as session:
+        for idx in range(7):
+            session.add(
+                CalculationDB(
+                    calculation_id=f"calc_db_{uuid.uuid4().hex}",
+                    application_slug="olex2" if idx % 2 == 0 else "dummy_cli",
+                    application_version="0.1.0",
+                    command_name="refine",
+                    arguments={"idx": idx},
+                    user=user,
+                    # Two calculations share each timestamp, so the cursor must also break ties
+                    timestamp=submitted_at + timedelta(minutes=idx // 2),
+                    current_status=CalculationStatusEnum.FAILED if idx != 4 else CalculationStatusEnum.SUCCESSFUL,
+                )
+            )
+        session.commit()
+
+    async def get_pages(**filters):
+        pages = []
+        cursor = None
+        while True:
+            calculations, cursor = await _get_calculation_info(user=user, limit=3, cursor=cursor, **filters)
+            pages.append([calc.arguments["idx"] for calc in calculations])
+            if cursor is None:
+                return pages
+
+    # The most recently submitted calculations come first
+    assert await get_pages() == [[6, 5, 4], [3, 2, 1], [0]]
+    assert await get_pages(status=CalculationStatusEnum.FAILED, application_slug="olex2") == [[6, 2, 0]]
+    assert await get_pages(submitted_after=submitted_at + timedelta(minutes=1)) == [[6, 5, 4], [3, 2]]
+
+
+@pytest.mark.anyio
+async def test_calculations_saved_through_the_async_engine_are_visible_to_the_sync_one():
+    calculation_id = f"calc_db_{uuid.uuid4().hex}"
+    settings.db.create_db_and_tables()
+    calculation_db = CalculationDB(
+        calculation_id=calculation_id,
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="greet_and_sleep",
+        arguments={},
+    )
+    await calculation_db.asave_to_db()
+    await calculation_db.aupdate_status(CalculationStatusEnum.FAILED)
+
+    with settings.db.get_session() as session:
+        stored_calculation = session.exec(
+            select(CalculationDB).where(CalculationDB.calculation_id == calculation_id)
+        ).one()
+        assert stored_calculation.current_status == CalculationStatusEnum.FAILED
+        assert stored_calculation.get_status_values() == [CalculationStatusEnum.FAILED]
+
+
+@pytest.mark.anyio
+async def test_calculations_which_cannot_be_saved_do_not_prevent_the_rest_of_the_batch_from_being_saved():
+    settings.db.create_db_and_tables()
+    calculation_ids = [f"calc_db_{uuid.uuid4().hex}" for _ in range(3)]
+
+    def make_calculation(calculation_id: str) -> CalculationDB:
+        return CalculationDB(
+            calculation_id=calculation_id,
+            application_slug="dummy_cli",
+            application_version="0.1.0",
+            command_name="greet_and_sleep",
+            arguments={},
+        )
+
+    await make_calculation(calculation_ids[1]).asave_to_db()
+    with pytest.raises(QCrBoxDBError):
+        await make_calculation(calculation_ids[1]).asave_to_db()
+
+    errors = await CalculationDB.asave_many_to_db(
+        [make_calculation(calculation_id) for calculation_id in calculation_ids]
+    )
+    assert list(errors) == [calculation_ids[1]]
+
+    with settings.db.get_session() as session:
+        stored_calculation_ids = session.exec(
+            select(CalculationDB.calculation_id).where(CalculationDB.calculation_id.in_(calculation_ids))
+        ).all()
+        assert sorted(stored_calculation_ids) == sorted(calculation_ids)
+
+
+@pytest.mark.anyio
+async def test_sqlite_tuning_profile_is_applied_to_database_files(tmp_path):
+    url = f"sqlite:///{tmp_path / 'qcrbox.db'}"
+    expected_pragmas = {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000, "temp_store": 2}
+
+    def get_pragmas(conn) -> dict:
+        return {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in expected_pragmas}
+
+    with settings.db.get_engine(url=url).connect() as conn:
+        assert get_pragmas(conn) == expected_pragmas
+    async with settings.db.get_async_engine(url=url).connect() as conn:
+        assert await conn.run_sync(get_pragmas) == expected_pragmas
+
+
+@pytest.mark.anyio
+async def test_calculation_listing_is_only_paginated_when_a_limit_is_given(api_client):
+    user = f"user_{uuid.uuid4().hex}"
+    with settings.db.get_session(init_db=True) as session:
+        for idx in range(120):
+            session.add(
+                CalculationDB(
+                    calculation_id=f"calc_db_{uuid.uuid4().hex}",
+                    application_slug="dummy_cli",
+                    application_version="0.1.0",
+                    command_name="refine",
+                    arguments={"idx": idx},
+                    user=user,
+                )
+            )
+        session.commit()
+
+    response = await api_client.get("/api/calculations", params={"user": user})
+    assert len(response.json()) == 120
+    assert "X-Next-Cursor" not in response.headers
+
+    response = await api_client.get("/api/calculations", params={"user": user, "limit": 100})
+    assert len(response.json()) == 100
+    response = await api_client.get(
+        "/api/calculations", params={"user": user, "limit": 100, "cursor": response.headers["X-Next-Cursor"]}
+    )
+    assert len(response.json()) == 20
+    assert "X-Next-Cursor" not in response.headers
@@ -0,0 +1,50 @@
+import uuid
+
+import pytest
+
+from pyqcrbox.registry.server.calculation_registry import (
+    CalculationDetails,
+    CalculationRegistry,
+    ExecutingClientDetails,
+)
+from pyqcrbox.services import get_nats_broker
+
+
+def make_calculation_details(calculation_id: str) -> CalculationDetails:
+    return CalculationDetails(
+        calculation_id=calculation_id,
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="greet_and_sleep",
+        arguments={"name": "Alice", "duration": 1},
+    )
+
+
+@pytest.mark.anyio
+async def test_calculation_registry_survives_restart():
+    """
+    Test that calculations and their executing clients can be looked up by a new registry instance
+    (as happens after a server restart), even if they have already been evicted from the in-memory cache.
+    """
+    broker = await get_nats_broker()
+    bucket = f"test_calculations_{uuid.uuid4().hex}"
+
+    registry = CalculationRegistry(broker, bucket=bucket, max_cached=2)
+    for idx in range(3):
+        await registry.add(make_calculation_details(f"calc_{idx:03d}"))
+    await registry.set_executing_client(
+        "calc_000", ExecutingClientDetails(client_id="client_01", private_inbox_prefix="_INBOX.abc")
+    )
+
+    new_registry = CalculationRegistry(broker, bucket=bucket, max_cached=2)
+    restored_calculation_ids = [calc.calculation_id async for calc in new_registry.restore()]
+    # The calculation updated last comes last, and only the most recently updated ones are cached
+    assert restored_calculation_ids == ["calc_001", "calc_002", "calc_000"]
+    assert list(new_registry._cache) == ["calc_002", "calc_000"]
+    calc = await new_registry.get("calc_000")
+    assert calc.executing_client.client_id == "client_01"
+
+    with pytest.raises(KeyError):
+        await new_registry.get("calc_999")
+
+    await broker.stream.delete_key_value(bucket)
@@ -0,0 +1,74 @@
+import anyio
+import pytest
+
+from pyqcrbox import helpers, settings
+from pyqcrbox.registry.client.executable_command import CLICommand
+from pyqcrbox.sql_models import CalculationStatusEnum, CLICommandSpec
+
+
+def make_cli_command(call_pattern: str, **resource_limits) -> CLICommand:
+    cmd_spec = CLICommandSpec(name="test_cmd", call_pattern=call_pattern, parameters=[], **resource_limits)
+    return CLICommand(cmd_spec)
+
+
+@pytest.mark.anyio
+async def test_cli_command_is_killed_when_exceeding_its_timeout():
+    cmd = make_cli_command("sleep 10", timeout=0.2)
+    calc = await cmd.execute_in_background(_calculation_id=helpers.generate_calculation_id())
+    await calc.wait_until_finished()
+
+    status_details = await calc.get_status_details()
+    assert status_details.status == CalculationStatusEnum.FAILED
+    assert status_details.extra_info["failure_reason"] == "timeout"
+    assert status_details.extra_info["timeout"] == 0.2
+
+
+@pytest.mark.anyio
+async def test_cli_command_runs_with_resource_limits():
+    cmd = make_cli_command("python -c 'import os; print(os.nice(0))'", max_memory="1GiB", cpu_affinity=[0], nice=5)
+    calc = await cmd.execute_in_background(_calculation_id=helpers.generate_calculation_id())
+    await calc.wait_until_finished()
+
+    assert calc.status == CalculationStatusEnum.SUCCESSFUL
+    assert (await calc.stdout).strip() == "5"
+
+
+@pytest.mark.anyio
+async def test_cli_command_fails_when_exceeding_its_memory_limit():
+    cmd = make_cli_command("python -c 'x = bytearray(512 * 1024**2)'", max_memory="256MiB")
+    calc = await cmd.execute_in_background(_calculation_id=helpers.generate_calculation_id())
+    await calc.wait_until_finished()
+
+    status_details = await calc.get_status_details()
+    assert status_details.status == CalculationStatusEnum.FAILED
+    assert "MemoryError" in status_details.stderr
+
+
+@pytest.mark.anyio
+async def test_cli_command_output_is_captured_while_running():
+    cmd = make_cli_command("python -u -c 'import time; print(\"started\"); time.sleep(10)'", timeout=2)
+    calc = await cmd.execute_in_background(_calculation_id=helpers.generate_calculation_id())
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(calc.wait_until_finished)
+        with anyio.fail_after(1.5):
+            while await calc.stdout == "":
+                await anyio.sleep(0.05)
+        assert calc.status == CalculationStatusEnum.RUNNING
+        assert (await calc.stdout).strip() == "started"
+        await calc.terminate()
+
+
+@pytest.mark.anyio
+async def test_cli_command_with_large_output_does_not_block_and_keeps_output_tail(monkeypatch):
+    monkeypatch.setattr(settings.registry.client, "max_captured_output_size", 1024)
+    # This writes more output than fits into the pipe buffers (which would block the process if not drained)
+    cmd = make_cli_command('python -c \'print("x" * 1_000_000 + "END")\'', timeout=5)
+    calc = await cmd.execute_in_background(_calculation_id=helpers.generate_calculation_id())
+    await calc.wait_until_finished()
+
+    status_details = await calc.get_status_details()
+    assert status_details.status == CalculationStatusEnum.SUCCESSFUL
+    assert len(status_details.stdout) == 1024
+    assert status_details.stdout.endswith("xEND\n")
+    assert status_details.extra_info["stdout_num_bytes_total"] == 1_000_004
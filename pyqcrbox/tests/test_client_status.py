@@ -0,0 +1,40 @@
+import pytest
+
+from pyqcrbox.registry.client.client_status import ClientStatus, ClientStatusEnum
+
+
+def test_client_accepts_calculations_until_all_slots_are_occupied():
+    """
+    Test that a client can handle several calculations in parallel, up to the configured number of slots.
+    """
+    status = ClientStatus(max_concurrent_calculations=2)
+    assert status.status == ClientStatusEnum.IDLE
+
+    status.set_pending("calc_001", "cmd_a")
+    assert status.status == ClientStatusEnum.PENDING
+    assert status.is_available("cmd_a")
+
+    status.set_busy("calc_001")
+    status.set_pending("calc_002", "cmd_b")
+    assert status.status == ClientStatusEnum.BUSY
+    assert status.num_free_slots == 0
+    assert not status.is_available("cmd_a")
+
+    with pytest.raises(RuntimeError):
+        status.set_pending("calc_003", "cmd_a")
+
+    status.set_idle("calc_001")
+    assert status.is_available("cmd_a")
+    assert status.get_calculation_status("calc_001") == ClientStatusEnum.IDLE
+
+
+def test_per_command_limits_are_respected():
+    """
+    Test that a per-command limit restricts a single command without blocking the remaining slots.
+    """
+    status = ClientStatus(max_concurrent_calculations=4, max_concurrent_calculations_per_command={"refine": 1})
+
+    status.set_pending("calc_001", "refine")
+    assert not status.is_available("refine")
+    assert status.is_available("convert_cif")
+    assert status.num_free_slots == 3
@@ -0,0 +1,85 @@
+import pytest
+
+from pyqcrbox import helpers, msg_specs, settings
+from pyqcrbox.registry.client import QCrBoxClient
+from pyqcrbox.services import get_nats_broker
+from pyqcrbox.sql_models import ApplicationSpec, CalculationStatusDetails, CalculationStatusEnum
+from pyqcrbox.svcs import get_nats_handle_cache
+
+
+def make_client(call_pattern: str) -> QCrBoxClient:
+    application_spec = ApplicationSpec(
+        name="Dummy CLI",
+        slug="dummy_cli",
+        version="0.1.0",
+        qcrbox_yaml_spec_version="0.1",
+        commands=[
+            dict(
+                name="run",
+                implemented_as="cli_command",
+                call_pattern=call_pattern,
+                parameters=[dict(name="input_cif", dtype="QCrBox.input_cif")],
+            )
+        ],
+    )
+    return QCrBoxClient(application_spec=application_spec, max_concurrent_calculations=1)
+
+
+def make_execution_request(input_file_id: str) -> msg_specs.CommandExecutionRequestNATS:
+    return msg_specs.CommandExecutionRequestNATS(
+        calculation_id=helpers.generate_calculation_id(),
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="run",
+        arguments={"input_cif": input_file_id},
+    )
+
+
+async def get_published_status(calculation_id: str) -> CalculationStatusDetails:
+    kv = await get_nats_handle_cache(await get_nats_broker()).key_value("calculation_status")
+    return CalculationStatusDetails.model_validate_json((await kv.get(calculation_id)).value)
+
+
+@pytest.mark.anyio
+async def test_calculation_failing_after_launch_is_reported_and_releases_its_slot(tmp_path, monkeypatch):
+    """
+    Test that an error while a calculation is followed (rather than when it is launched) still results
+    in a final status, and that the slot, scratch directory and calculation object are released.
+    """
+    monkeypatch.setattr(settings.registry.client, "scratch_dir", tmp_path)
+    client = make_client("sleep 10 && cat {input_cif}")
+    input_file_id = await client.data_file_manager.import_bytes(b"data_test\n", filename="test.cif")
+
+    async def fail_to_publish_status_updates(calc):
+        raise RuntimeError("NATS is unavailable")
+
+    monkeypatch.setattr(client, "publish_status_updates_while_running", fail_to_publish_status_updates)
+    msg = make_execution_request(input_file_id)
+    client.status.set_pending(msg.calculation_id, msg.command_name)
+    await client.handle_command_execution(msg)
+
+    status_details = await get_published_status(msg.calculation_id)
+    assert status_details.status == CalculationStatusEnum.FAILED
+    assert "NATS is unavailable" in status_details.extra_info["error_msg"]
+    assert client.status.num_free_slots == 1
+    assert client.calculations == {}
+    assert list(tmp_path.iterdir()) == []
+
+    await client.data_file_manager.delete(input_file_id)
+
+
+@pytest.mark.anyio
+async def test_calculation_with_staged_data_files_runs_in_its_scratch_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings.registry.client, "scratch_dir", tmp_path)
+    client = make_client("ls")
+    input_file_id = await client.data_file_manager.import_bytes(b"data_test\n", filename="test.cif")
+
+    msg = make_execution_request(input_file_id)
+    client.status.set_pending(msg.calculation_id, msg.command_name)
+    await client.handle_command_execution(msg)
+
+    status_details = await get_published_status(msg.calculation_id)
+    assert status_details.status == CalculationStatusEnum.SUCCESSFUL
+    assert status_details.stdout.split() == ["test.cif"]
+
+    await client.data_file_manager.delete(input_file_id)
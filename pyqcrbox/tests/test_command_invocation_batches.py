@@ -0,0 +1,23 @@
+from pyqcrbox import msg_specs
+from pyqcrbox.registry.server.api.api_helpers import _split_invocations_into_batches
+
+
+def make_invocation(text: str) -> msg_specs.InvokeCommandNATS:
+    return msg_specs.InvokeCommandNATS(
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="greet_and_sleep",
+        arguments={"name": text},
+    )
+
+
+def test_batches_of_invocations_are_split_to_stay_below_the_maximum_message_size():
+    invocations = list(enumerate(make_invocation("x" * 100) for _ in range(10)))
+    invocation_size = len(invocations[0][1].model_dump_json().encode()) + 1
+
+    batches = _split_invocations_into_batches(invocations, max_size=3 * invocation_size)
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+    assert [idx for batch in batches for idx, _ in batch] == list(range(10))
+
+    (batch,) = _split_invocations_into_batches(invocations, max_size=10 * invocation_size)
+    assert batch == invocations
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+import pytest
+
+from pyqcrbox.data_management import DataFileDiskCache, QCrBoxDataFileManager
+
+
+async def iter_chunks(data: bytes):
+    yield data[: len(data) // 2]
+    yield data[len(data) // 2 :]
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_entries_are_evicted(tmp_path):
+    """
+    Test that the disk cache stays within its size limit by evicting the least recently used entries.
+    """
+    cache = DataFileDiskCache(tmp_path, max_size=250)
+    contents = [os.urandom(100) for _ in range(3)]
+    digests = [hashlib.sha256(data).hexdigest() for data in contents]
+
+    await cache.put_stream(digests[0], iter_chunks(contents[0]))
+    await cache.put_stream(digests[1], iter_chunks(contents[1]))
+    assert cache.get(digests[0]).read_bytes() == contents[0]  # now the most recently used entry
+
+    await cache.put_stream(digests[2], iter_chunks(contents[2]))
+    assert digests[0] in cache and digests[1] not in cache and digests[2] in cache
+    assert cache.total_size == 200
+
+    # The cache contents (and their access order) are picked up again after a restart
+    cache = DataFileDiskCache(tmp_path, max_size=250)
+    assert cache.total_size == 200
+    await cache.put_stream(digests[1], iter_chunks(contents[1]))
+    assert digests[0] not in cache and digests[1] in cache and digests[2] in cache
+
+    with pytest.raises(ValueError):
+        await cache.put_stream(digests[0], iter_chunks(b"wrong contents"))
+    assert digests[0] not in cache
+    assert sorted(p.name for p in tmp_path.glob("*/*")) == sorted(digests[1:])
+
+
+@pytest.mark.anyio
+async def test_data_file_manager_reads_through_disk_cache(tmp_path):
+    """
+    Test that data files are fetched into the disk cache once and can be hard-linked from there.
+    """
+    data_file_manager = QCrBoxDataFileManager(DataFileDiskCache(tmp_path / "cache", max_size=10**6))
+    file_contents = os.urandom(1000)
+    sha256_hexdigest = hashlib.sha256(file_contents).hexdigest()
+
+    qcrbox_file_id = "qcrbox_data_file_cached_001"
+    await data_file_manager.delete(qcrbox_file_id)
+    await data_file_manager.import_bytes(file_contents, filename="input.tsc", _qcrbox_file_id=qcrbox_file_id)
+    assert await data_file_manager.get_content_hash(qcrbox_file_id) == sha256_hexdigest
+
+    assert await data_file_manager.get_file_contents(qcrbox_file_id) == file_contents
+    cached_path = data_file_manager.disk_cache.get(sha256_hexdigest)
+    assert cached_path.read_bytes() == file_contents
+
+    work_dir = tmp_path / "work_dir"
+    work_dir.mkdir()
+    linked_path = await data_file_manager.export_to_path(qcrbox_file_id, work_dir / "input.tsc")
+    assert linked_path.read_bytes() == file_contents
+    assert os.path.samefile(linked_path, cached_path)
+
+    await data_file_manager.delete(qcrbox_file_id)
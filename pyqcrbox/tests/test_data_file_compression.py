@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import tracemalloc
+
+import pytest
+
+from pyqcrbox.data_management import QCrBoxDataFileManager, compression
+from pyqcrbox.data_management.compression import ContentEncoding, parse_accept_encoding
+from pyqcrbox.data_management.data_file_manager import iter_bytes_chunks
+from pyqcrbox.data_management.object_store_streaming import resolve_object_links
+
+# Tabulated reflection data compresses well, just like real CIF/HKL files
+SAMPLE_TEXT_CONTENTS = b"".join(
+    f"{h:4d}{k:4d}{l:4d}{(h * k + l) % 997:8.2f}{0.5:8.2f}\n".encode()
+    for h in range(-10, 11)
+    for k in range(-10, 11)
+    for l in range(0, 20)  # noqa: E741
+)
+
+
+async def _get_stored_blob_info(data_file_manager: QCrBoxDataFileManager, qcrbox_file_id: str):
+    js = await data_file_manager._get_jetstream()
+    return await resolve_object_links(js, "qcrbox_data_files", qcrbox_file_id)
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(compression.zstandard is None, reason="zstandard is not installed")
+async def test_text_files_are_stored_compressed_and_read_back_transparently():
+    data_file_manager = QCrBoxDataFileManager()
+    qcrbox_file_id = "qcrbox_data_file_compressed_001"
+    await data_file_manager.delete(qcrbox_file_id)
+    await data_file_manager.import_bytes(SAMPLE_TEXT_CONTENTS, filename="sample.lst", _qcrbox_file_id=qcrbox_file_id)
+
+    blob_info = await _get_stored_blob_info(data_file_manager, qcrbox_file_id)
+    assert compression.get_content_encoding(blob_info) == ContentEncoding.ZSTD
+    assert blob_info.size < len(SAMPLE_TEXT_CONTENTS) / 2
+    assert compression.get_decoded_size(blob_info) == len(SAMPLE_TEXT_CONTENTS)
+
+    assert await data_file_manager.get_file_contents(qcrbox_file_id) == SAMPLE_TEXT_CONTENTS
+    assert (await data_file_manager.get_data_file(qcrbox_file_id)).size == len(SAMPLE_TEXT_CONTENTS)
+
+    # Contents are still addressed by the digest of the uncompressed contents
+    sha256_hexdigest = hashlib.sha256(SAMPLE_TEXT_CONTENTS).hexdigest()
+    assert await data_file_manager.get_content_hash(qcrbox_file_id) == sha256_hexdigest
+    other_file_id = await data_file_manager.import_by_content_hash(sha256_hexdigest, filename="copy.lst")
+    assert await data_file_manager.get_file_contents(other_file_id) == SAMPLE_TEXT_CONTENTS
+
+    # Clients accepting the stored encoding get the contents exactly as stored
+    encoding, chunks = await data_file_manager.iter_encoded_file_contents(qcrbox_file_id, {ContentEncoding.ZSTD})
+    encoded_contents = b"".join([chunk async for chunk in chunks])
+    assert encoding == ContentEncoding.ZSTD
+    assert len(encoded_contents) == blob_info.size
+    assert compression.zstandard.ZstdDecompressor().decompressobj().decompress(encoded_contents) == SAMPLE_TEXT_CONTENTS
+
+    for file_id in (qcrbox_file_id, other_file_id):
+        await data_file_manager.delete(file_id)
+
+
+@pytest.mark.anyio
+async def test_gzip_is_used_if_zstandard_is_not_installed(monkeypatch):
+    monkeypatch.setattr(compression, "zstandard", None)
+    data_file_manager = QCrBoxDataFileManager()
+    # Use different contents than above, so that they aren't deduplicated against the zstd-compressed blob
+    file_contents = SAMPLE_TEXT_CONTENTS + b"   0   0   0    0.00    0.00\n"
+    qcrbox_file_id = await data_file_manager.import_bytes(file_contents, filename="sample_gzip.lst")
+
+    blob_info = await _get_stored_blob_info(data_file_manager, qcrbox_file_id)
+    assert compression.get_content_encoding(blob_info) == ContentEncoding.GZIP
+    assert await data_file_manager.get_file_contents(qcrbox_file_id) == file_contents
+
+    encoding, chunks = await data_file_manager.iter_encoded_file_contents(qcrbox_file_id, {ContentEncoding.GZIP})
+    assert encoding == ContentEncoding.GZIP
+    assert gzip.decompress(b"".join([chunk async for chunk in chunks])) == file_contents
+
+    await data_file_manager.delete(qcrbox_file_id)
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding(None) == set()
+    assert parse_accept_encoding("gzip, deflate, br, zstd") == {ContentEncoding.GZIP, ContentEncoding.ZSTD}
+    assert parse_accept_encoding("GZIP;q=0.5, zstd;q=0") == {ContentEncoding.GZIP}
+    assert parse_accept_encoding("*, gzip;q=0.0") == {ContentEncoding.IDENTITY, ContentEncoding.ZSTD}
+
+
+async def _decode(encoded_contents: bytes, encoding: ContentEncoding, decoded_size: int | None) -> bytes:
+    chunks = iter_bytes_chunks(encoded_contents, chunk_size=1024)
+    return b"".join([chunk async for chunk in compression.decode_chunks(chunks, encoding, decoded_size=decoded_size)])
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("encoding", [ContentEncoding.GZIP, ContentEncoding.ZSTD])
+async def test_truncated_or_oversized_contents_are_rejected_when_decoding(encoding):
+    if encoding == ContentEncoding.ZSTD and compression.zstandard is None:
+        pytest.skip("zstandard is not installed")
+    encoded_contents = b"".join(
+        [chunk async for chunk in compression.encode_chunks(iter_bytes_chunks(SAMPLE_TEXT_CONTENTS), encoding)]
+    )
+    size = len(SAMPLE_TEXT_CONTENTS)
+
+    assert await _decode(encoded_contents, encoding, decoded_size=size) == SAMPLE_TEXT_CONTENTS
+    with pytest.raises(compression.CorruptContentsError, match="truncated"):
+        await _decode(encoded_contents[: len(encoded_contents) // 2], encoding, decoded_size=None)
+    with pytest.raises(compression.CorruptContentsError, match="exceed"):
+        await _decode(encoded_contents, encoding, decoded_size=size // 10)
+    with pytest.raises(compression.CorruptContentsError, match="rather than"):
+        await _decode(encoded_contents, encoding, decoded_size=size + 1)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("encoding", [ContentEncoding.GZIP, ContentEncoding.ZSTD])
+async def test_decompression_bombs_are_rejected_without_decompressing_them(encoding):
+    """
+    Test that contents which decompress to far more than their recorded size are rejected
+    before they are decompressed in full, even if they arrive in a single chunk.
+    """
+    if encoding == ContentEncoding.ZSTD and compression.zstandard is None:
+        pytest.skip("zstandard is not installed")
+    decompressed_size = 200 * 1024 * 1024
+    encoded_contents = b"".join(
+        [chunk async for chunk in compression.encode_chunks(iter_bytes_chunks(bytes(decompressed_size)), encoding)]
+    )
+
+    tracemalloc.start()
+    try:
+        with pytest.raises(compression.CorruptContentsError, match="exceed"):
+            async for _ in compression.decode_chunks(iter_bytes_chunks(encoded_contents), encoding, decoded_size=1000):
+                pass
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak_memory < 10 * 1024 * 1024
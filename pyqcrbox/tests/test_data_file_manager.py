@@ -1,6 +1,13 @@
+import hashlib
+import os
+
 import pytest
 
-from pyqcrbox.services import get_data_file_manager
+from pyqcrbox.data_management import DummyDataFileManager, QCrBoxDataFileManager, object_store_streaming
+from pyqcrbox.data_management import data_file_manager as data_file_manager_module
+from pyqcrbox.data_management.data_file import QCrBoxDataFileQuery
+from pyqcrbox.data_management.object_store_streaming import DEFAULT_CHUNK_SIZE
+from pyqcrbox.services import get_data_file_manager, get_nats_broker
 
 
 @pytest.mark.anyio
@@ -33,12 +40,218 @@ async def test_list_existing_data_files(sample_cif_file):
     await data_file_manager.delete(qcrbox_file_id)
 
     data_files = await data_file_manager.get_data_files()
-    assert len(data_files) == 0
+    assert qcrbox_file_id not in [data_file.qcrbox_file_id for data_file in data_files]
 
     await data_file_manager.import_local_file(sample_cif_file, _qcrbox_file_id=qcrbox_file_id)
     data_files = await data_file_manager.get_data_files()
-    assert len(data_files) == 1
-
-    file1 = data_files[0]
-    assert file1.qcrbox_file_id == qcrbox_file_id
+    (file1,) = [data_file for data_file in data_files if data_file.qcrbox_file_id == qcrbox_file_id]
     assert file1.filename == sample_cif_file.name
+
+
+@pytest.mark.anyio
+async def test_streaming_import_and_retrieval_of_large_file():
+    """
+    Test that files can be imported into and retrieved from the NATS object store chunk by chunk.
+    """
+    data_file_manager = QCrBoxDataFileManager()
+    file_contents = os.urandom(1_000_000)
+
+    async def iter_upload_chunks():
+        # Deliberately use a chunk size which doesn't match the one used by the object store
+        for idx in range(0, len(file_contents), 100_000):
+            yield file_contents[idx : idx + 100_000]
+
+    qcrbox_file_id = "qcrbox_data_file_large_001"
+    await data_file_manager.delete(qcrbox_file_id)
+    await data_file_manager.import_stream(iter_upload_chunks(), filename="frames.raw", _qcrbox_file_id=qcrbox_file_id)
+
+    chunks = [chunk async for chunk in data_file_manager.iter_file_contents(qcrbox_file_id)]
+    assert len(chunks) == 8
+    assert max(len(chunk) for chunk in chunks) == DEFAULT_CHUNK_SIZE
+    assert b"".join(chunks) == file_contents
+
+    # Files stored this way can also be retrieved by any other NATS client
+    nats_broker = await get_nats_broker()
+    data_file_storage = await nats_broker.object_storage("qcrbox_data_files")
+    assert (await data_file_storage.get(qcrbox_file_id)).data == file_contents
+
+    await data_file_manager.delete(qcrbox_file_id)
+
+
+@pytest.mark.anyio
+async def test_identical_file_contents_are_only_stored_once():
+    """
+    Test that importing the same contents again only adds a reference to the existing contents.
+    """
+    data_file_manager = QCrBoxDataFileManager()
+    file_contents = os.urandom(300_000)
+    nats_broker = await get_nats_broker()
+
+    file_id_1 = await data_file_manager.import_bytes(file_contents, filename="input_1.cif")
+    num_stored_messages = (await nats_broker.stream.stream_info("OBJ_qcrbox_data_blobs")).state.messages
+    file_id_2 = await data_file_manager.import_bytes(file_contents, filename="input_2.cif")
+    file_id_3 = await data_file_manager.import_by_content_hash(
+        hashlib.sha256(file_contents).hexdigest(), filename="input_3.cif"
+    )
+    assert (await nats_broker.stream.stream_info("OBJ_qcrbox_data_blobs")).state.messages == num_stored_messages
+
+    assert len({file_id_1, file_id_2, file_id_3}) == 3
+    for file_id in (file_id_1, file_id_2, file_id_3):
+        assert await data_file_manager.get_file_contents(file_id) == file_contents
+
+    # Deleting a data file doesn't affect others with the same contents
+    await data_file_manager.delete(file_id_1)
+    assert not await data_file_manager.exists(file_id_1)
+    assert await data_file_manager.get_file_contents(file_id_2) == file_contents
+
+    with pytest.raises(KeyError):
+        await data_file_manager.import_by_content_hash(hashlib.sha256(b"never stored").hexdigest())
+
+
+@pytest.mark.anyio
+async def test_data_file_catalogue_supports_filtering_and_pagination():
+    """
+    Test that data files and datasets can be listed from the catalogue without touching their contents.
+    """
+    data_file_manager = QCrBoxDataFileManager()
+    file_ids = [f"qcrbox_data_file_catalogue_{idx:03d}" for idx in range(5)]
+    for idx, qcrbox_file_id in enumerate(file_ids):
+        await data_file_manager.delete(qcrbox_file_id)
+        filename = f"structure_{idx}.hkl" if idx % 2 == 0 else f"structure_{idx}.fcf"
+        await data_file_manager.import_bytes(b"x" * (idx + 1), filename=filename, _qcrbox_file_id=qcrbox_file_id)
+
+    hkl_files = await data_file_manager.get_data_files(QCrBoxDataFileQuery(filetype="hkl", min_size=2))
+    assert [f.qcrbox_file_id for f in hkl_files] == [file_ids[4], file_ids[2]]
+    assert hkl_files[0].size == 5
+    assert hkl_files[0].sha256 == hashlib.sha256(b"xxxxx").hexdigest()
+
+    first_page = await data_file_manager.get_data_files(QCrBoxDataFileQuery(filetype="hkl", limit=2))
+    second_page = await data_file_manager.get_data_files(QCrBoxDataFileQuery(filetype="hkl", limit=2, offset=2))
+    assert [f.qcrbox_file_id for f in first_page + second_page] == [file_ids[4], file_ids[2], file_ids[0]]
+
+    dataset_id = await data_file_manager.create_dataset_from_data_file(file_ids[1])
+    dataset_info = await data_file_manager.get_dataset_info(dataset_id)
+    assert [f.filename for f in dataset_info.data_files] == ["structure_1.fcf"]
+
+    for qcrbox_file_id in file_ids:
+        await data_file_manager.delete(qcrbox_file_id)
+    assert await data_file_manager.get_data_files(QCrBoxDataFileQuery(filetype="hkl")) == []
+    assert (await data_file_manager.get_dataset_info(dataset_id)).data_files == []
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("data_file_manager_cls", [QCrBoxDataFileManager, DummyDataFileManager])
+async def test_multi_file_datasets_load_their_members_lazily(data_file_manager_cls, monkeypatch):
+    """
+    Test that datasets can be made up of many data files whose contents are only fetched when accessed.
+    """
+    data_file_manager = data_file_manager_cls()
+    member_contents = {f"frame_{idx:03d}.sfrm": os.urandom(100) for idx in range(3)}
+    member_contents["structure.tsc"] = b"tsc contents"
+    file_ids = [
+        await data_file_manager.import_bytes(contents, filename=filename)
+        for filename, contents in member_contents.items()
+    ]
+
+    dataset_id = await data_file_manager.create_dataset(file_ids[:2])
+    await data_file_manager.add_data_files_to_dataset(dataset_id, file_ids[1:])
+    with pytest.raises(KeyError):
+        await data_file_manager.create_dataset(["qcrbox_df_does_not_exist"])
+
+    async def _fail(qcrbox_file_id):
+        raise AssertionError(f"Contents of {qcrbox_file_id!r} should not have been accessed")
+
+    with monkeypatch.context() as m:
+        m.setattr(data_file_manager, "get_file_contents", _fail)
+        m.setattr(data_file_manager, "iter_file_contents", _fail)
+        dataset_info = await data_file_manager.get_dataset_info(dataset_id)
+        dataset = await data_file_manager.get_dataset(dataset_id)
+        dataset_response = dataset.to_response_model()
+
+    assert [f.qcrbox_file_id for f in dataset_info.data_files] == file_ids
+    assert [f.filename for f in dataset_response.data_files] == list(member_contents)
+    assert [f.size for f in dataset_response.data_files] == [len(c) for c in member_contents.values()]
+    assert len(dataset.get_members_by_filetype("sfrm")) == 3
+
+    tsc_file = dataset.get_member("structure.tsc")
+    assert await tsc_file.get_contents() == b"tsc contents"
+    first_frame = next(iter(dataset))
+    assert b"".join([chunk async for chunk in first_frame.iter_contents()]) == member_contents["frame_000.sfrm"]
+
+    for qcrbox_file_id in file_ids:
+        await data_file_manager.delete(qcrbox_file_id)
+
+
+@pytest.mark.anyio
+async def test_streaming_upload_and_download_via_the_api(api_client, monkeypatch):
+    """
+    Test that a file uploaded via the API is passed on to the data file manager chunk by chunk
+    (rather than read into memory as a whole) and can be downloaded again.
+    """
+    file_contents = os.urandom(3_000_000)
+    chunk_sizes = []
+    import_stream = QCrBoxDataFileManager.import_stream
+
+    async def record_chunk_sizes(self, chunks, **kwargs):
+        async def iter_recorded_chunks():
+            async for chunk in chunks:
+                chunk_sizes.append(len(chunk))
+                yield chunk
+
+        return await import_stream(self, iter_recorded_chunks(), **kwargs)
+
+    monkeypatch.setattr(QCrBoxDataFileManager, "import_stream", record_chunk_sizes)
+    response = await api_client.post("/api/data_files/upload", files={"data": ("frames.raw", file_contents)})
+    assert response.status_code == 200
+    qcrbox_file_id = response.json()["payload"]["qcrbox_id"]
+    assert sum(chunk_sizes) == len(file_contents)
+    assert len(chunk_sizes) > 1 and max(chunk_sizes) <= 1024 * 1024
+
+    response = await api_client.get(f"/api/data_files/{qcrbox_file_id}/content")
+    assert response.status_code == 200
+    assert response.content == file_contents
+    data_file_manager = await get_data_file_manager()
+    assert (await data_file_manager.get_data_file(qcrbox_file_id)).filename == "frames.raw"
+
+    await data_file_manager.delete(qcrbox_file_id)
+
+
+@pytest.mark.anyio
+async def test_contents_reused_while_they_are_being_deleted_stay_intact(monkeypatch):
+    """
+    Test that contents reused while garbage collection deletes them are either kept or stored again,
+    but never end up referenced without their chunks (whichever side gets there first).
+    """
+    data_file_manager = QCrBoxDataFileManager()
+    file_contents = os.urandom(300_000)
+    sha256_hexdigest = hashlib.sha256(file_contents).hexdigest()
+    blob_name = f"sha256-{sha256_hexdigest}"
+    await data_file_manager.delete(await data_file_manager.import_bytes(file_contents, filename="input_1.cif"))
+    file_ids = []
+
+    # The contents are reused after garbage collection has looked them up, so they are kept
+    async def reuse_contents_after_lookup(js, bucket, name):
+        result = await object_store_streaming.get_object_info_and_sequence(js, bucket, name)
+        file_ids.append(await data_file_manager.import_by_content_hash(sha256_hexdigest, filename="input_2.cif"))
+        return result
+
+    with monkeypatch.context() as m:
+        m.setattr(data_file_manager_module, "get_object_info_and_sequence", reuse_contents_after_lookup)
+        assert not await data_file_manager.delete_blob(blob_name)
+    assert await data_file_manager.get_file_contents(file_ids[-1]) == file_contents
+    await data_file_manager.delete(file_ids[-1])
+
+    # The contents are deleted after the import has looked them up, so they are stored again
+    get_object_info_and_sequence = object_store_streaming.get_object_info_and_sequence
+
+    async def delete_contents_after_lookup(js, bucket, name):
+        result = await get_object_info_and_sequence(js, bucket, name)
+        if not file_ids[1:]:
+            assert await data_file_manager.delete_blob(blob_name)
+        return result
+
+    with monkeypatch.context() as m:
+        m.setattr(object_store_streaming, "get_object_info_and_sequence", delete_contents_after_lookup)
+        file_ids.append(await data_file_manager.import_bytes(file_contents, filename="input_3.cif"))
+    assert await data_file_manager.get_file_contents(file_ids[-1]) == file_contents
+    await data_file_manager.delete(file_ids[-1])
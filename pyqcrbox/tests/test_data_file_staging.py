@@ -0,0 +1,74 @@
+import pytest
+
+from pyqcrbox import helpers, msg_specs, settings
+from pyqcrbox.data_management import DataFileDiskCache, QCrBoxDataFileManager
+from pyqcrbox.registry.client.data_file_staging import DataFileStaging
+from pyqcrbox.registry.client.executable_command import CLICommand
+from pyqcrbox.registry.server import QCrBoxServer
+from pyqcrbox.services import get_nats_broker
+from pyqcrbox.sql_models import CalculationStatusEnum, CLICommandSpec
+
+
+@pytest.mark.anyio
+async def test_data_file_arguments_are_staged_and_outputs_uploaded(tmp_path, monkeypatch):
+    """
+    Test that data file ids passed as input file arguments are fetched into a scratch directory,
+    and that the output files are uploaded after the calculation has finished and can be added
+    as new data files by the server.
+    """
+    monkeypatch.setattr(settings.registry.client, "scratch_dir", tmp_path / "scratch")
+    data_file_manager = QCrBoxDataFileManager(DataFileDiskCache(tmp_path / "cache", max_size=10**6))
+    input_cif_id = await data_file_manager.import_bytes(b"data_structure\n", filename="structure.cif")
+    input_hkl_id = await data_file_manager.import_bytes(b"1 0 0 10.0 1.0\n", filename="structure.hkl")
+
+    cmd_spec = CLICommandSpec(
+        name="merge",
+        call_pattern="cat {input_cif} {input_hkl} > {output_cif}",
+        parameters=[
+            dict(name="input_cif", dtype="QCrBox.input_cif"),
+            dict(name="input_hkl", dtype="QCrBox.input_file"),
+            dict(name="output_cif", dtype="QCrBox.output_cif", invalidated_entries=[]),
+        ],
+    )
+    calculation_id = helpers.generate_calculation_id()
+    staging = DataFileStaging(
+        cmd_spec,
+        {"input_cif": input_cif_id, "input_hkl": input_hkl_id, "output_cif": "/some/other/dir/merged.cif"},
+        calculation_id=calculation_id,
+        data_file_manager=data_file_manager,
+    )
+    arguments = await staging.stage_inputs()
+    assert sorted(p.name for p in staging.scratch_dir.iterdir()) == ["structure.cif", "structure.hkl"]
+    assert arguments["output_cif"] == str(staging.scratch_dir / "merged.cif")
+
+    calc = await CLICommand(cmd_spec).execute_in_background(**arguments, _calculation_id=calculation_id)
+    await calc.wait_until_finished()
+    assert calc.status == CalculationStatusEnum.SUCCESSFUL
+
+    output_contents = await staging.upload_outputs()
+    assert list(output_contents) == ["output_cif"]
+    server = QCrBoxServer(nats_broker=await get_nats_broker())
+    response = await server.handle_data_file_registration(
+        msg_specs.RegisterDataFilesNATS(files=list(output_contents.values()))
+    )
+    (output_data_file_id,) = response.qcrbox_file_ids
+    assert await data_file_manager.get_file_contents(output_data_file_id) == b"data_structure\n1 0 0 10.0 1.0\n"
+    assert (await data_file_manager.get_data_file(output_data_file_id)).filename == "merged.cif"
+
+    scratch_dir = staging.scratch_dir
+    staging.cleanup()
+    assert not scratch_dir.exists()
+
+    for qcrbox_file_id in [input_cif_id, input_hkl_id, output_data_file_id]:
+        await data_file_manager.delete(qcrbox_file_id)
+
+
+def test_calculations_without_data_file_arguments_are_not_staged():
+    cmd_spec = CLICommandSpec(
+        name="check", call_pattern="check {input_cif}", parameters=[dict(name="input_cif", dtype="QCrBox.input_cif")]
+    )
+    arguments = {"input_cif": "/mnt/qcrbox/shared_files/structure.cif"}
+    staging = DataFileStaging(
+        cmd_spec, arguments, calculation_id="qcrbox_calc_dummy", data_file_manager=QCrBoxDataFileManager()
+    )
+    assert not staging.is_needed
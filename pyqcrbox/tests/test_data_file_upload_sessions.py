@@ -0,0 +1,179 @@
+import hashlib
+import os
+
+import anyio
+import pytest
+
+from pyqcrbox.data_management import QCrBoxDataFileManager
+from pyqcrbox.data_management.data_file_manager import UPLOAD_PARTS_BUCKET, UploadVerificationError, iter_bytes_chunks
+from pyqcrbox.services import get_data_file_manager, get_nats_broker
+
+PART_SIZE = 300_000
+
+
+async def get_num_stored_upload_chunks() -> int:
+    broker = await get_nats_broker()
+    return (await broker.stream.stream_info(f"OBJ_{UPLOAD_PARTS_BUCKET}")).state.messages
+
+
+@pytest.mark.anyio
+async def test_upload_in_parts_is_assembled_into_a_data_file():
+    """
+    Test that a file can be uploaded in concurrent parts (retrying failed ones) and is verified when it is assembled.
+    """
+    data_file_manager = QCrBoxDataFileManager()
+    file_contents = os.urandom(4 * PART_SIZE + 1234)
+    parts = [file_contents[idx : idx + PART_SIZE] for idx in range(0, len(file_contents), PART_SIZE)]
+    upload_session = await data_file_manager.create_upload_session(
+        "image_stack.sfrm", size=len(file_contents), sha256=hashlib.sha256(file_contents).hexdigest()
+    )
+    upload_id = upload_session.upload_id
+
+    # Parts can arrive in any order, and a part whose digest doesn't match is rejected
+    async with anyio.create_task_group() as tg:
+        for part_number in (5, 3, 1, 2):
+            tg.start_soon(
+                data_file_manager.upload_part, upload_id, part_number, iter_bytes_chunks(parts[part_number - 1])
+            )
+    with pytest.raises(UploadVerificationError):
+        await data_file_manager.upload_part(
+            upload_id, 4, iter_bytes_chunks(b"garbled"), sha256=hashlib.sha256(parts[3]).hexdigest()
+        )
+
+    upload_session = await data_file_manager.get_upload_session(upload_id)
+    assert [part.part_number for part in upload_session.parts] == [1, 2, 3, 5]
+    with pytest.raises(UploadVerificationError, match=r"Missing parts: \[4\]"):
+        await data_file_manager.complete_upload_session(upload_id)
+
+    # Uploading a part again replaces it
+    await data_file_manager.upload_part(upload_id, 4, iter_bytes_chunks(b"wrong contents"))
+    await data_file_manager.upload_part(
+        upload_id, 4, iter_bytes_chunks(parts[3]), sha256=hashlib.sha256(parts[3]).hexdigest()
+    )
+    qcrbox_file_id = await data_file_manager.complete_upload_session(upload_id)
+
+    assert await data_file_manager.get_file_contents(qcrbox_file_id) == file_contents
+    assert (await data_file_manager.get_data_file(qcrbox_file_id)).filename == "image_stack.sfrm"
+    with pytest.raises(KeyError):
+        await data_file_manager.get_upload_session(upload_id)
+
+    await data_file_manager.delete(qcrbox_file_id)
+
+
+@pytest.mark.anyio
+async def test_upload_not_matching_expected_digest_is_not_stored():
+    data_file_manager = QCrBoxDataFileManager()
+    upload_session = await data_file_manager.create_upload_session(
+        "image_stack.sfrm", sha256=hashlib.sha256(b"expected contents").hexdigest()
+    )
+    await data_file_manager.upload_part(upload_session.upload_id, 1, iter_bytes_chunks(b"other contents"))
+
+    with pytest.raises(UploadVerificationError, match="digest mismatch"):
+        await data_file_manager.complete_upload_session(upload_session.upload_id, _qcrbox_file_id="qcrbox_df_rejected")
+    assert not await data_file_manager.exists("qcrbox_df_rejected")
+    with pytest.raises(KeyError):
+        await data_file_manager.import_by_content_hash(hashlib.sha256(b"other contents").hexdigest())
+
+    # The upload can still be fixed or aborted
+    assert len((await data_file_manager.get_upload_session(upload_session.upload_id)).parts) == 1
+    await data_file_manager.abort_upload_session(upload_session.upload_id)
+    with pytest.raises(KeyError):
+        await data_file_manager.upload_part(upload_session.upload_id, 1, iter_bytes_chunks(b"too late"))
+
+
+@pytest.mark.anyio
+async def test_concurrent_uploads_of_the_same_part_via_the_api(api_client):
+    """
+    Test that the same part can be uploaded concurrently (e.g. when a client retries a part whose
+    response was slow), that the last upload wins and that the other uploads leave nothing behind.
+    """
+    client, data_file_manager = api_client, await get_data_file_manager()
+    response = await client.post("/api/data_files/uploads", json={"filename": "image_stack.sfrm"})
+    assert response.status_code == 200
+    upload_id = response.json()["payload"]["upload_id"]
+    await client.put(f"/api/data_files/uploads/{upload_id}/parts/1", content=b"first attempt")
+    num_stored_chunks = await get_num_stored_upload_chunks()
+
+    part_contents = [os.urandom(PART_SIZE) for _ in range(5)]
+    responses = [None] * len(part_contents)
+
+    async def upload_part(idx: int) -> None:
+        responses[idx] = await client.put(f"/api/data_files/uploads/{upload_id}/parts/1", content=part_contents[idx])
+
+    async with anyio.create_task_group() as tg:
+        for idx in range(len(part_contents)):
+            tg.start_soon(upload_part, idx)
+
+    assert [response.status_code for response in responses] == [200] * len(part_contents)
+    (part,) = (await data_file_manager.get_upload_session(upload_id)).parts
+    assert part.sha256 in {hashlib.sha256(contents).hexdigest() for contents in part_contents}
+    # Only the chunks of the upload that was stored last are left (replacing those of the first attempt)
+    assert await get_num_stored_upload_chunks() == num_stored_chunks - 1 + 3
+
+    response = await client.post(f"/api/data_files/uploads/{upload_id}/complete")
+    assert response.status_code == 200
+    qcrbox_file_id = response.json()["payload"]["qcrbox_id"]
+    assert hashlib.sha256(await data_file_manager.get_file_contents(qcrbox_file_id)).hexdigest() == part.sha256
+    assert await get_num_stored_upload_chunks() == num_stored_chunks - 1
+    await data_file_manager.delete(qcrbox_file_id)
+
+
+@pytest.mark.anyio
+async def test_invalid_part_uploads_via_the_api_are_rejected(api_client):
+    client, data_file_manager = api_client, await get_data_file_manager()
+    response = await client.put("/api/data_files/uploads/qcrbox_upload_unknown/parts/1", content=b"contents")
+    assert response.status_code == 404
+
+    upload_session = await data_file_manager.create_upload_session("image_stack.sfrm")
+    response = await client.put(
+        f"/api/data_files/uploads/{upload_session.upload_id}/parts/1",
+        content=b"garbled",
+        headers={"X-Content-SHA256": hashlib.sha256(b"contents").hexdigest()},
+    )
+    assert response.status_code == 400
+    response = await client.put(f"/api/data_files/uploads/{upload_session.upload_id}/parts/0", content=b"contents")
+    assert response.status_code == 400
+    assert (await data_file_manager.get_upload_session(upload_session.upload_id)).parts == []
+
+    response = await client.delete(f"/api/data_files/uploads/{upload_session.upload_id}")
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_interrupted_upload_via_the_api_can_be_resumed(api_client):
+    """
+    Test that an upload interrupted by a server restart can be resumed by uploading the parts
+    the upload session doesn't list yet, and that the resumed upload is assembled from all parts.
+    """
+    client = api_client
+    file_contents = os.urandom(3 * PART_SIZE)
+    parts = [file_contents[idx : idx + PART_SIZE] for idx in range(0, len(file_contents), PART_SIZE)]
+    response = await client.post(
+        "/api/data_files/uploads",
+        json={"filename": "image_stack.sfrm", "sha256": hashlib.sha256(file_contents).hexdigest()},
+    )
+    upload_id = response.json()["payload"]["upload_id"]
+    for part_number in (1, 3):
+        response = await client.put(
+            f"/api/data_files/uploads/{upload_id}/parts/{part_number}", content=parts[part_number - 1]
+        )
+        assert response.status_code == 200
+
+    # The upload session (in the database) and its parts (in the NATS object store) outlive the server that received them
+    data_file_manager = QCrBoxDataFileManager()
+    upload_session = await data_file_manager.get_upload_session(upload_id)
+    assert [part.sha256 for part in upload_session.parts] == [hashlib.sha256(parts[idx]).hexdigest() for idx in (0, 2)]
+
+    response = await client.get(f"/api/data_files/uploads/{upload_id}")
+    received_part_numbers = {part["part_number"] for part in response.json()["parts"]}
+    for part_number in sorted({1, 2, 3} - received_part_numbers):
+        response = await client.put(
+            f"/api/data_files/uploads/{upload_id}/parts/{part_number}", content=parts[part_number - 1]
+        )
+        assert response.status_code == 200
+    response = await client.post(f"/api/data_files/uploads/{upload_id}/complete")
+    assert response.status_code == 200
+
+    qcrbox_file_id = response.json()["payload"]["qcrbox_id"]
+    assert await data_file_manager.get_file_contents(qcrbox_file_id) == file_contents
+    await data_file_manager.delete(qcrbox_file_id)
@@ -0,0 +1,112 @@
+# The whole test suite can be run against PostgreSQL by setting QCRBOX__DB__URL to the url of a (test) database.
+# The tests in this module additionally create (and afterwards drop) scratch databases on the PostgreSQL
+# server given by QCRBOX_TEST_POSTGRES_URL, e.g. "postgresql://postgres@localhost:5432/postgres".
+import os
+import uuid
+
+import pytest
+import sqlalchemy
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from pyqcrbox import migrations, settings
+from pyqcrbox.sql_models import QCrBoxBaseSQLModel
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def empty_db_url(request, tmp_path):
+    if request.param == "sqlite":
+        yield f"sqlite:///{tmp_path / 'qcrbox.db'}"
+        return
+
+    if (server_url := os.environ.get("QCRBOX_TEST_POSTGRES_URL")) is None:
+        pytest.skip("QCRBOX_TEST_POSTGRES_URL is not set")
+    db_name = f"qcrbox_test_{uuid.uuid4().hex}"
+    server_engine = sqlalchemy.create_engine(server_url, isolation_level="AUTOCOMMIT")
+    with server_engine.connect() as conn:
+        conn.exec_driver_sql(f"CREATE DATABASE {db_name}")
+    yield sqlalchemy.make_url(server_url).set(database=db_name).render_as_string(hide_password=False)
+    with server_engine.connect() as conn:
+        conn.exec_driver_sql(f"DROP DATABASE {db_name} WITH (FORCE)")
+    server_engine.dispose()
+
+
+def get_schema_differences(engine: sqlalchemy.Engine) -> list:
+    with engine.connect() as conn:
+        return compare_metadata(MigrationContext.configure(conn), QCrBoxBaseSQLModel.metadata)
+
+
+def test_migrations_create_the_same_schema_as_the_models(empty_db_url):
+    engine = sqlalchemy.create_engine(empty_db_url)
+    with engine.begin() as conn:
+        migrations.upgrade_db_schema(conn)  # creates the tables from the models
+        migrations.drop_version_table(conn)
+        QCrBoxBaseSQLModel.metadata.drop_all(conn)
+
+    with engine.begin() as conn:
+        migrations.command.upgrade(migrations.get_alembic_config(conn), "head")
+    assert get_schema_differences(engine) == []
+    engine.dispose()
+
+
+def test_new_databases_are_marked_as_up_to_date(empty_db_url):
+    settings.db.create_db_and_tables(url=empty_db_url)
+
+    head_revision = ScriptDirectory.from_config(migrations.get_alembic_config()).get_current_head()
+    with settings.db.get_engine(url=empty_db_url).connect() as conn:
+        assert MigrationContext.configure(conn).get_current_revision() == head_revision
+    assert get_schema_differences(settings.db.get_engine(url=empty_db_url)) == []
+    settings.db.get_engine(url=empty_db_url).dispose()
+
+
+def test_databases_created_before_migrations_are_migrated(empty_db_url):
+    """
+    Test that a database created before the schema was managed by migrations (and before the current status
+    of calculations was kept on the calculation table) is migrated rather than marked as up to date.
+    """
+    engine = sqlalchemy.create_engine(empty_db_url)
+    with engine.begin() as conn:
+        migrations.command.upgrade(migrations.get_alembic_config(conn), migrations.BASELINE_REVISION)
+        migrations.drop_version_table(conn)
+        conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO calculation (id, calculation_id, application_slug, application_version, command_name, "
+                "timestamp) VALUES (1, 'calc_old', 'dummy_cli', '0.1.0', 'greet', '2026-01-01 10:00:00'), "
+                "(2, 'calc_without_events', 'dummy_cli', '0.1.0', 'greet', '2026-01-02 10:00:00')"
+            )
+        )
+        conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO calculation_status_event (calculation_id, timestamp, status, comment) VALUES "
+                "(1, '2026-01-01 10:00:00', 'SUBMITTED', ''), (1, '2026-01-01 10:05:00', 'SUCCESSFUL', '')"
+            )
+        )
+
+    with engine.begin() as conn:
+        migrations.upgrade_db_schema(conn)
+    assert get_schema_differences(engine) == []
+    with engine.connect() as conn:
+        rows = conn.execute(
+            sqlalchemy.text("SELECT calculation_id, current_status, updated_at FROM calculation ORDER BY id")
+        ).all()
+    assert [(row.calculation_id, row.current_status, str(row.updated_at)) for row in rows] == [
+        ("calc_old", "SUCCESSFUL", "2026-01-01 10:05:00"),
+        ("calc_without_events", "UNKNOWN", "2026-01-02 10:00:00"),
+    ]
+    engine.dispose()
+
+
+def test_databases_created_before_migrations_with_the_current_status_of_calculations_are_migrated(empty_db_url):
+    engine = sqlalchemy.create_engine(empty_db_url)
+    with engine.begin() as conn:
+        migrations.command.upgrade(migrations.get_alembic_config(conn), migrations.CALCULATION_CURRENT_STATUS_REVISION)
+        migrations.drop_version_table(conn)
+    with engine.begin() as conn:
+        migrations.upgrade_db_schema(conn)
+
+    head_revision = ScriptDirectory.from_config(migrations.get_alembic_config()).get_current_head()
+    with engine.connect() as conn:
+        assert MigrationContext.configure(conn).get_current_revision() == head_revision
+    assert get_schema_differences(engine) == []
+    engine.dispose()
@@ -0,0 +1,163 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import nats.js.errors
+import pytest
+from sqlmodel import select
+
+from pyqcrbox import settings
+from pyqcrbox.data_management import QCrBoxDataFileManager
+from pyqcrbox.registry.server.calculation_registry import CalculationDetails, CalculationRegistry
+from pyqcrbox.registry.server.garbage_collector import GarbageCollector
+from pyqcrbox.services import get_nats_broker
+from pyqcrbox.settings import GarbageCollectionSettings
+from pyqcrbox.sql_models import CalculationDB, CalculationStatusEnum, DataFileDB, UploadSessionDB
+from pyqcrbox.sql_models.calculation_status_event import CalculationStatusEventDB
+from pyqcrbox.svcs import get_nats_handle_cache
+
+LONG_AGO = datetime.now() - timedelta(days=30)
+
+
+def add_calculation(calculation_id: str, status: CalculationStatusEnum, arguments: dict) -> None:
+    with settings.db.get_session(init_db=True) as session:
+        calculation_db = CalculationDB(
+            calculation_id=calculation_id,
+            application_slug="dummy_cli",
+            application_version="0.1.0",
+            command_name="greet_and_sleep",
+            arguments=arguments,
+            timestamp=LONG_AGO,
+            current_status=status,
+            updated_at=LONG_AGO,
+        )
+        session.add(calculation_db)
+        session.commit()
+        CalculationDB._add_data_file_references(session, calculation_db.id, arguments.values())
+        session.add(CalculationStatusEventDB(calculation_id=calculation_db.id, status=status, timestamp=LONG_AGO))
+        session.commit()
+
+
+async def import_old_data_file(data_file_manager: QCrBoxDataFileManager) -> str:
+    qcrbox_file_id = await data_file_manager.import_bytes(os.urandom(1000), filename="old_file.bin")
+    with settings.db.get_session() as session:
+        data_file = session.exec(select(DataFileDB).where(DataFileDB.qcrbox_file_id == qcrbox_file_id)).one()
+        data_file.uploaded_at = LONG_AGO
+        session.add(data_file)
+        session.commit()
+    return qcrbox_file_id
+
+
+@pytest.mark.anyio
+async def test_garbage_collection_deletes_expired_calculations_and_unreferenced_data_files():
+    data_file_manager = QCrBoxDataFileManager()
+    calculation_registry = CalculationRegistry(await get_nats_broker(), bucket="test_gc_calculations")
+    kv_calculation_status = await get_nats_handle_cache(calculation_registry.nats_broker).key_value(
+        "calculation_status"
+    )
+
+    # A finished and a running calculation, each referencing an old data file
+    finished_calc_id, running_calc_id = f"calc_gc_{uuid.uuid4().hex}", f"calc_gc_{uuid.uuid4().hex}"
+    input_file_id = await import_old_data_file(data_file_manager)
+    running_input_file_id = await import_old_data_file(data_file_manager)
+    add_calculation(finished_calc_id, CalculationStatusEnum.SUCCESSFUL, {"input_cif": input_file_id})
+    add_calculation(running_calc_id, CalculationStatusEnum.RUNNING, {"input_cif": running_input_file_id})
+    for calculation_id in (finished_calc_id, running_calc_id):
+        await kv_calculation_status.put(calculation_id, b"{}")
+        await calculation_registry.add(
+            CalculationDetails(
+                calculation_id=calculation_id,
+                application_slug="dummy_cli",
+                application_version="0.1.0",
+                command_name="greet_and_sleep",
+                arguments={},
+            )
+        )
+
+    # Old data files which aren't referenced by a calculation, one of them part of a dataset
+    unreferenced_file_id = await import_old_data_file(data_file_manager)
+    dataset_file_id = await import_old_data_file(data_file_manager)
+    await data_file_manager.create_dataset_from_data_file(dataset_file_id)
+
+    garbage_collector = GarbageCollector(
+        calculation_registry,
+        GarbageCollectionSettings(
+            calculation_max_age=timedelta(days=1),
+            data_file_max_age=timedelta(days=1),
+            grace_period=timedelta(0),
+            batch_size=1,
+        ),
+        data_file_manager=data_file_manager,
+    )
+
+    report = await garbage_collector.run(dry_run=True)
+    assert report.calculation_ids == [finished_calc_id]
+    assert report.data_file_ids == [unreferenced_file_id]
+    assert await data_file_manager.exists(unreferenced_file_id)
+
+    report = await garbage_collector.run()
+    assert report.calculation_ids == [finished_calc_id]
+    # The input file of the deleted calculation is no longer referenced now
+    assert sorted(report.data_file_ids) == sorted([input_file_id, unreferenced_file_id])
+    assert report.num_blobs >= 2
+
+    with settings.db.get_session() as session:
+        remaining_calc_ids = session.exec(
+            select(CalculationDB.calculation_id).where(
+                CalculationDB.calculation_id.in_([finished_calc_id, running_calc_id])
+            )
+        ).all()
+    assert remaining_calc_ids == [running_calc_id]
+    with pytest.raises(nats.js.errors.KeyNotFoundError):
+        await kv_calculation_status.get(finished_calc_id)
+    with pytest.raises(KeyError):
+        await calculation_registry.get(finished_calc_id)
+    assert (await calculation_registry.get(running_calc_id)).calculation_id == running_calc_id
+
+    assert not await data_file_manager.exists(input_file_id)
+    assert not await data_file_manager.exists(unreferenced_file_id)
+    for qcrbox_file_id in (running_input_file_id, dataset_file_id):
+        assert len(await data_file_manager.get_file_contents(qcrbox_file_id)) == 1000
+
+    # Nothing is left to do for a second run
+    report = await garbage_collector.run()
+    assert (report.num_calculations, report.num_data_files, report.num_blobs) == (0, 0, 0)
+
+
+@pytest.mark.anyio
+async def test_garbage_collection_aborts_abandoned_upload_sessions():
+    data_file_manager = QCrBoxDataFileManager()
+
+    async def iter_chunks(contents: bytes):
+        yield contents
+
+    async def create_upload_session(last_activity: datetime) -> str:
+        upload_session = await data_file_manager.create_upload_session("upload.bin")
+        await data_file_manager.upload_part(upload_session.upload_id, 1, iter_chunks(b"part"))
+        with settings.db.get_session() as session:
+            upload_session_db = session.exec(
+                select(UploadSessionDB).where(UploadSessionDB.upload_id == upload_session.upload_id)
+            ).one()
+            upload_session_db.created_at = LONG_AGO
+            upload_session_db.parts[0].uploaded_at = last_activity
+            session.add(upload_session_db.parts[0])
+            session.add(upload_session_db)
+            session.commit()
+        return upload_session.upload_id
+
+    abandoned_upload_ids = [await create_upload_session(LONG_AGO) for _ in range(3)]
+    active_upload_id = await create_upload_session(datetime.now())
+
+    garbage_collector = GarbageCollector(
+        CalculationRegistry(await get_nats_broker(), bucket="test_gc_calculations"),
+        GarbageCollectionSettings(upload_session_max_age=timedelta(days=1), grace_period=timedelta(0), batch_size=2),
+        data_file_manager=data_file_manager,
+    )
+    report = await garbage_collector.run()
+    assert report.num_upload_sessions >= 3
+
+    for upload_id in abandoned_upload_ids:
+        with pytest.raises(KeyError):
+            await data_file_manager.get_upload_session(upload_id)
+    assert len((await data_file_manager.get_upload_session(active_upload_id)).parts) == 1
+    await data_file_manager.abort_upload_session(active_upload_id)
@@ -0,0 +1,25 @@
+import pytest
+
+from pyqcrbox.services import get_nats_broker
+from pyqcrbox.svcs import get_nats_handle_cache
+
+
+@pytest.mark.anyio
+async def test_nats_handles_are_cached_until_invalidated():
+    """
+    Test that key-value and object store handles are only looked up once per broker connection.
+    """
+    nats_broker = await get_nats_broker()
+    assert await get_nats_broker() is nats_broker
+
+    handle_cache = get_nats_handle_cache(nats_broker)
+    assert get_nats_handle_cache(nats_broker) is handle_cache
+
+    kv = await handle_cache.key_value("test_handle_cache_kv")
+    object_store = await handle_cache.object_store("test_handle_cache_objects")
+    assert await handle_cache.key_value("test_handle_cache_kv") is kv
+    assert await handle_cache.object_store("test_handle_cache_objects") is object_store
+
+    handle_cache.invalidate()
+    assert await handle_cache.key_value("test_handle_cache_kv") is not kv
+    assert await handle_cache.object_store("test_handle_cache_objects") is not object_store
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from pyqcrbox.registry.server.calculation_registry import CalculationDetails
+from pyqcrbox.registry.server.scheduler import CalculationScheduler
+from pyqcrbox.settings import SchedulerSettings
+from pyqcrbox.sql_models import CalculationPriorityEnum
+
+
+def make_calculation_details(calculation_id: str, user: str, priority: str = "normal", age: int = 0):
+    return CalculationDetails(
+        calculation_id=calculation_id,
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="greet_and_sleep",
+        arguments={},
+        priority=priority,
+        user=user,
+        submitted_at=datetime.now() - timedelta(seconds=age),
+    )
+
+
+def test_high_priority_calculations_are_dispatched_first():
+    scheduler = CalculationScheduler(SchedulerSettings())
+    for idx in range(5):
+        scheduler.enqueue(make_calculation_details(f"batch_{idx}", user="alice", age=100 - idx))
+    scheduler.enqueue(make_calculation_details("interactive", user="bob", priority="high"))
+
+    (calc,) = scheduler.select("dummy_cli", "0.1.0", num_free_slots=1)
+    assert calc.calculation_id == "interactive"
+
+    stats = {q.priority: q for q in scheduler.get_stats().queues}
+    assert stats[CalculationPriorityEnum.NORMAL].num_queued == 5
+    assert stats[CalculationPriorityEnum.HIGH].num_running == 1
+
+
+def test_users_share_slots_according_to_weights_and_quotas():
+    """
+    Test that a user with a large batch does not starve other users, and that quotas are respected.
+    """
+    scheduler = CalculationScheduler(
+        SchedulerSettings(user_weights={"carol": 2.0}, max_concurrent_calculations_per_user={"bob": 1})
+    )
+    for idx in range(10):
+        scheduler.enqueue(make_calculation_details(f"alice_{idx}", user="alice", age=100 - idx))
+    for idx in range(3):
+        scheduler.enqueue(make_calculation_details(f"bob_{idx}", user="bob"))
+        scheduler.enqueue(make_calculation_details(f"carol_{idx}", user="carol"))
+
+    calcs = scheduler.select("dummy_cli", "0.1.0", num_free_slots=6)
+    users = [calc.user for calc in calcs]
+    assert users.count("alice") == 2
+    assert users.count("bob") == 1
+    assert users.count("carol") == 3
+
+    scheduler.mark_finished(next(calc.calculation_id for calc in calcs if calc.user == "bob"))
+    (calc,) = scheduler.select("dummy_cli", "0.1.0", num_free_slots=1)
+    assert calc.user == "bob"
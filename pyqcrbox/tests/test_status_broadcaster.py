@@ -0,0 +1,45 @@
+import anyio
+import pytest
+
+from pyqcrbox.registry.server.status_broadcaster import CalculationStatusBroadcaster
+from pyqcrbox.sql_models import CalculationStatusDetails, CalculationStatusEnum
+
+
+def make_status_details(calculation_id: str, status: CalculationStatusEnum) -> CalculationStatusDetails:
+    return CalculationStatusDetails(
+        calculation_id=calculation_id, status=status, stdout=None, stderr=None, extra_info={}
+    )
+
+
+@pytest.mark.anyio
+async def test_status_updates_are_delivered_to_all_subscribers_of_a_calculation():
+    broadcaster = CalculationStatusBroadcaster()
+
+    with broadcaster.subscribe("calc_001") as sub_1, broadcaster.subscribe("calc_001") as sub_2:
+        with broadcaster.subscribe("calc_002") as sub_other:
+            assert broadcaster.num_subscribers == 3
+            broadcaster.publish("calc_001", make_status_details("calc_001", CalculationStatusEnum.RUNNING))
+            broadcaster.publish("calc_001", make_status_details("calc_001", CalculationStatusEnum.SUCCESSFUL))
+
+            for sub in (sub_1, sub_2):
+                with anyio.fail_after(1):
+                    assert (await sub.get()).status == CalculationStatusEnum.RUNNING
+                    assert (await sub.get()).status == CalculationStatusEnum.SUCCESSFUL
+
+            with anyio.move_on_after(0.1) as cancel_scope:
+                await sub_other.get()
+            assert cancel_scope.cancelled_caught
+
+    assert broadcaster.num_subscribers == 0
+
+
+@pytest.mark.anyio
+async def test_slow_subscribers_only_keep_the_most_recent_status_updates():
+    broadcaster = CalculationStatusBroadcaster(max_pending_per_subscriber=2)
+
+    with broadcaster.subscribe("calc_001") as sub:
+        for status in (CalculationStatusEnum.SUBMITTED, CalculationStatusEnum.RUNNING, CalculationStatusEnum.FAILED):
+            broadcaster.publish("calc_001", make_status_details("calc_001", status))
+
+        assert (await sub.get()).status == CalculationStatusEnum.RUNNING
+        assert (await sub.get()).status == CalculationStatusEnum.FAILED
@@ -0,0 +1,176 @@
+import json
+import uuid
+
+import anyio
+import pytest
+
+from pyqcrbox import msg_specs, settings
+from pyqcrbox.registry.server import QCrBoxServer
+from pyqcrbox.registry.server.calculation_registry import CalculationDetails, CalculationRegistry
+from pyqcrbox.services import get_nats_broker
+from pyqcrbox.sql_models import CalculationStatusDetails, CalculationStatusEnum
+
+from .test_command_execution import make_client, make_execution_request
+
+
+def make_work_request(client_id: str) -> msg_specs.RequestWorkNATS:
+    return msg_specs.RequestWorkNATS(
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        client_id=client_id,
+        private_inbox_prefix=f"_INBOX.{client_id}",
+        num_free_slots=1,
+    )
+
+
+def make_acknowledgement(client_id: str, calculation_id: str) -> msg_specs.AcknowledgeWorkNATS:
+    return msg_specs.AcknowledgeWorkNATS(
+        client_id=client_id, private_inbox_prefix=f"_INBOX.{client_id}", calculation_ids=[calculation_id]
+    )
+
+
+@pytest.mark.anyio
+async def test_jobs_not_acknowledged_in_time_are_handed_out_again(monkeypatch):
+    """
+    Test that a calculation whose dispatch reply never reached the client is given to the next client
+    asking for work, and that the first client is not allowed to run it when it acknowledges it late.
+    """
+    monkeypatch.setattr(settings.registry.server, "work_acknowledgement_timeout", 0.1)
+    broker = await get_nats_broker()
+    server = QCrBoxServer(nats_broker=broker)
+    bucket = f"test_calculations_{uuid.uuid4().hex}"
+    server.calculations = CalculationRegistry(broker, bucket=bucket)
+    calc = CalculationDetails(
+        calculation_id="calc_001",
+        application_slug="dummy_cli",
+        application_version="0.1.0",
+        command_name="greet_and_sleep",
+        arguments={},
+    )
+    await server.calculations.add(calc)
+    server.scheduler.enqueue(calc)
+
+    (job,) = (await server.handle_work_request(make_work_request("client_a"))).jobs
+    assert job.calculation_id == "calc_001"
+    assert (await server.calculations.get("calc_001")).awaiting_acknowledgement
+    await anyio.sleep(0.3)
+
+    response = await server.handle_work_acknowledgement(make_acknowledgement("client_a", "calc_001"))
+    assert response.calculation_ids == []
+
+    (job,) = (await server.handle_work_request(make_work_request("client_b"))).jobs
+    assert job.calculation_id == "calc_001"
+    response = await server.handle_work_acknowledgement(make_acknowledgement("client_b", "calc_001"))
+    assert response.calculation_ids == ["calc_001"]
+    calc = await CalculationRegistry(broker, bucket=bucket).get("calc_001")
+    assert calc.executing_client.client_id == "client_b"
+    assert not calc.awaiting_acknowledgement
+
+    await server._cancel_background_tasks()
+    await broker.stream.delete_key_value(bucket)
+
+
+@pytest.mark.anyio
+async def test_client_keeps_requesting_work_while_server_is_unavailable(monkeypatch):
+    """
+    Test that the client keeps asking for work (rather than giving up for good) when nobody answers its requests.
+    """
+    monkeypatch.setattr(settings.nats, "work_queue_poll_interval", 0.01)
+    monkeypatch.setattr(settings.nats, "work_request_max_retry_delay", 0.05)
+    client = make_client("true")
+    client.nats_broker = await get_nats_broker()
+    client._private_inbox = f"_INBOX.{uuid.uuid4().hex}"
+
+    task = client.start_background_task(client.request_work_while_running)
+    await anyio.sleep(0.2)  # no server is listening yet
+
+    work_requests = []
+
+    async def reply_without_jobs(nats_msg):
+        work_requests.append(json.loads(nats_msg.data))
+        await nats_msg.respond(msg_specs.RequestWorkResponseNATS(jobs=[]).model_dump_json().encode())
+
+    subscription = await client.nats_broker._connection.subscribe("server.cmd.request_work", cb=reply_without_jobs)
+    with anyio.fail_after(5):
+        while not work_requests:
+            await anyio.sleep(0.01)
+
+    assert not task.done()
+    assert work_requests[0]["num_free_slots"] == 1
+    await subscription.unsubscribe()
+    await client._cancel_background_tasks()
+
+
+@pytest.mark.anyio
+async def test_client_skips_jobs_it_has_no_slot_for(monkeypatch):
+    """
+    Test that jobs the client cannot take on (here: more jobs than free slots) are skipped and not acknowledged,
+    so that the server hands them out again, while the client keeps running the others and asking for work.
+    """
+    monkeypatch.setattr(settings.nats, "work_queue_poll_interval", 0.01)
+    client = make_client("true")
+    client.nats_broker = await get_nats_broker()
+    client._private_inbox = f"_INBOX.{uuid.uuid4().hex}"
+    jobs = [make_execution_request("qcrbox_df_unused") for _ in range(2)]
+    executed_jobs = []
+
+    async def record_command_execution(msg):
+        executed_jobs.append(msg.calculation_id)
+        client.status.set_idle(msg.calculation_id)
+
+    monkeypatch.setattr(client, "handle_command_execution", record_command_execution)
+
+    work_requests = []
+    acknowledged_ids = []
+
+    async def reply_with_jobs(nats_msg):
+        work_requests.append(json.loads(nats_msg.data))
+        response = msg_specs.RequestWorkResponseNATS(jobs=jobs if len(work_requests) == 1 else [])
+        await nats_msg.respond(response.model_dump_json().encode())
+
+    async def confirm_acknowledged_jobs(nats_msg):
+        calculation_ids = json.loads(nats_msg.data)["calculation_ids"]
+        acknowledged_ids.extend(calculation_ids)
+        response = msg_specs.AcknowledgeWorkResponseNATS(calculation_ids=calculation_ids)
+        await nats_msg.respond(response.model_dump_json().encode())
+
+    connection = client.nats_broker._connection
+    subscriptions = [
+        await connection.subscribe("server.cmd.request_work", cb=reply_with_jobs),
+        await connection.subscribe("server.cmd.acknowledge_work", cb=confirm_acknowledged_jobs),
+    ]
+    task = client.start_background_task(client.request_work_while_running)
+    with anyio.fail_after(5):
+        while len(work_requests) < 2:
+            await anyio.sleep(0.01)
+
+    assert not task.done()
+    assert acknowledged_ids == executed_jobs == [jobs[0].calculation_id]
+    assert client.status.num_free_slots == 1
+    for subscription in subscriptions:
+        await subscription.unsubscribe()
+    await client._cancel_background_tasks()
+
+
+@pytest.mark.anyio
+async def test_status_of_unknown_calculations_is_reported_as_unknown():
+    server = QCrBoxServer(nats_broker=await get_nats_broker())
+    await server.set_up_key_value_store()
+
+    response = await server.get_calculation_status(msg_specs.GetCalculationStatusNATS(calculation_id="calc_unknown"))
+    assert response.status == CalculationStatusEnum.UNKNOWN
+
+
+@pytest.mark.anyio
+async def test_status_updates_of_calculations_missing_from_the_database_are_ignored():
+    """
+    Test that a status update for a calculation the database doesn't know about (e.g. one left in the
+    key-value store from a previous run) is skipped, rather than failing in the status update handler.
+    """
+    settings.db.create_db_and_tables()
+    server = QCrBoxServer(nats_broker=await get_nats_broker())
+    status_details = CalculationStatusDetails(
+        calculation_id="calc_not_in_db", status=CalculationStatusEnum.RUNNING, stdout="", stderr="", extra_info={}
+    )
+
+    await server.update_calculation_status_in_db(status_details, calculation_id="calc_not_in_db")
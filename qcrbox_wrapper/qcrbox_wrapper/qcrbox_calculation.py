@@ -1,8 +1,9 @@
 import json
 import textwrap
 import time
+import urllib.error
 import urllib.request
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator
 
 from pyqcrbox.sql_models import CalculationStatusDetails, CalculationStatusEnum
 
@@ -81,21 +82,65 @@ class QCrBoxCalculation:
     def is_running(self) -> bool:
         return self.status in [CalculationStatusEnum.SUBMITTED, CalculationStatusEnum.RUNNING]
 
+    def iter_status_updates(self, timeout: float = 60.0) -> Iterator[CalculationStatusDetails]:
+        """
+        Yields the current status of the calculation, followed by any updates pushed
+        by the server (via server-sent events) until the calculation has finished.
+
+        Parameters
+        ----------
+        timeout : float
+            If no update arrives for this many seconds, the connection is re-established (which
+            yields the current status again), so that a dropped connection cannot block forever.
+
+        Returns
+        -------
+        Iterator[CalculationStatusDetails]
+            The status details of the calculation after each update.
+
+        Raises
+        ------
+        urllib.error.URLError
+            If the server cannot be reached or does not support pushing updates.
+        """
+        while True:
+            try:
+                with urllib.request.urlopen(f"{self._server_url}/calculations/{self.id}/events", timeout=timeout) as r:
+                    for line in r:
+                        line = line.decode("UTF-8").strip()
+                        if line.startswith("data:"):
+                            yield CalculationStatusDetails(**json.loads(line.removeprefix("data:")))
+                return
+            except TimeoutError:
+                continue
+
     def wait_while_running(self, sleep_time: float) -> None:
         """
-        Periodically checks the calculation's status and blocks until it is no longer running.
+        Blocks until the calculation is no longer running.
+
+        Status updates are pushed by the server; if the server does not support this,
+        the calculation's status is checked periodically instead.
 
         Parameters
         ----------
         sleep_time : float
-            The interval, in seconds, between status checks.
+            The interval, in seconds, between status checks (if the server cannot push updates).
 
         Raises
         ------
         RuntimeError
             If the calculation finishes with a status other than 'completed'.
         """
+        try:
+            for _ in self.iter_status_updates():
+                pass
+        except (urllib.error.URLError, OSError):
+            pass
+
+        # Only needed if the server cannot push updates or the connection failed or was closed early
         while self.is_running():
             time.sleep(sleep_time)
-        if self.status != CalculationStatusEnum.SUCCESSFUL:
-            raise UnsuccessfulCalculationError(self.status_details)
+
+        status_details = self.status_details
+        if status_details.status != CalculationStatusEnum.SUCCESSFUL:
+            raise UnsuccessfulCalculationError(status_details)
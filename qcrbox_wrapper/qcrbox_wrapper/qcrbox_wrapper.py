@@ -66,8 +66,15 @@ def get_time_cached_app_answer(web_client: httpx.Client, ttl_hash: int) -> list[
     intervals, instead of for a fixed time.
     """
     del ttl_hash
-    response = web_client.get("/applications")
-    return response.json()
+    applications = []
+    params = {}
+    # The server returns the applications in pages, pointing to the next one in the `X-Next-Cursor` header
+    while True:
+        response = web_client.get("/applications", params=params)
+        applications.extend(response.json())
+        if (next_cursor := response.headers.get("X-Next-Cursor")) is None:
+            return applications
+        params = {"cursor": next_cursor}
 
 
 def get_ttl_hash(seconds: int = 20) -> int: